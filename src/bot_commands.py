@@ -3,6 +3,7 @@ import re
 from telegram import Update
 from telegram.ext import ContextTypes
 from database import Database
+from config import DIGEST_WINDOW, format_duration
 
 logger = logging.getLogger(__name__)
 
@@ -17,11 +18,12 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
         "/unsubscribe <vk_id или ссылка> - Отписаться от отслеживания пользователя\n"
         "/settings <vk_id или ссылка> - Настроить параметры отслеживания\n"
         "/list - Показать список отслеживаемых пользователей\n"
+        "/digest - Настроить объединение уведомлений в сводки\n"
         "/help - Показать справку по командам\n\n"
         "🔔 Я буду уведомлять вас об активности указанных пользователей ВКонтакте:\n"
         "• Вход/выход из сети\n"
-        "• Новые друзья\n"
-        "• Вступление в группы\n"
+        "• Новые и удаленные друзья\n"
+        "• Вступление в группы и выход из них\n"
         "• Новые записи на стене\n"
         "• Лайки\n"
         "• Комментарии\n\n"
@@ -49,10 +51,11 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         "• `/settings 12345678`\n"
         "• `/settings vk.com/durov`\n\n"
         "*/list* - Показать список всех отслеживаемых вами пользователей ВКонтакте.\n\n"
+        f"*/digest <1-3>* - Выбрать режим доставки уведомлений: сразу, сводкой за {format_duration(DIGEST_WINDOW)} или сводкой раз в час.\n\n"
         "🔔 *Типы отслеживаемой активности:*\n"
         "• Онлайн-статус (вход/выход из сети)\n"
-        "• Новые друзья\n"
-        "• Вступление в группы\n"
+        "• Новые и удаленные друзья\n"
+        "• Вступление в группы и выход из них\n"
         "• Новые записи на стене\n"
         "• Лайки\n"
         "• Комментарии\n\n"
@@ -137,6 +140,10 @@ async def subscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         if success:
             # Инициализация настроек мониторинга (по умолчанию только онлайн-статус)
             await Database.init_monitoring_settings(chat_id, vk_id)
+            if vk_tracker:
+                # Ранее сохраненные настройки этой пары сохраняются
+                settings = await Database.get_monitoring_settings(chat_id, vk_id)
+                vk_tracker.router.update(chat_id, vk_id, settings or {})
             
             await update.message.reply_text(
                 f"✅ Вы успешно подписались на отслеживание пользователя с VK ID: {vk_id}.\n"
@@ -205,6 +212,8 @@ async def unsubscribe_command(update: Update, context: ContextTypes.DEFAULT_TYPE
         success = await Database.remove_subscription(chat_id, vk_id)
         
         if success:
+            if vk_tracker:
+                vk_tracker.router.remove(chat_id, vk_id)
             await update.message.reply_text(
                 f"✅ Вы успешно отписались от отслеживания пользователя с VK ID: {vk_id}."
             )
@@ -416,6 +425,8 @@ async def toggle_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         success = await Database.update_monitoring_settings(chat_id, vk_id, {setting_key: int(new_value)})
         
         if success:
+            if vk_tracker:
+                vk_tracker.router.update(chat_id, vk_id, {setting_key: new_value})
             setting_names = [
                 "Онлайн-статус",
                 "Новые друзья",
@@ -443,4 +454,60 @@ async def toggle_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         logger.error(f"Ошибка при выполнении команды toggle: {e}")
         await update.message.reply_text(
             "❌ Произошла непредвиденная ошибка при обработке вашего запроса."
-        )
\ No newline at end of file
+        )
+
+async def digest_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обработчик команды /digest <режим>"""
+    modes = {
+        "1": "immediate", "immediate": "immediate",
+        "2": "window", "window": "window",
+        "3": "hourly", "hourly": "hourly"
+    }
+    mode_names = {
+        "immediate": "Сразу",
+        "window": f"Сводкой за {format_duration(DIGEST_WINDOW)}",
+        "hourly": "Сводкой раз в час"
+    }
+    
+    try:
+        chat_id = update.effective_chat.id
+        
+        # Без аргументов показываем текущий режим
+        if not context.args:
+            current_mode = vk_tracker.notifier.get_mode(chat_id) if vk_tracker else "immediate"
+            await update.message.reply_text(
+                f"📬 *Режим доставки уведомлений:* {mode_names[current_mode]}\n\n"
+                "Для изменения отправьте: `/digest N`, где N:\n"
+                "1. Сразу - каждое уведомление отдельным сообщением\n"
+                f"2. Сводкой за {format_duration(DIGEST_WINDOW)} - уведомления объединяются в одно сообщение\n"
+                "3. Сводкой раз в час",
+                parse_mode="Markdown"
+            )
+            return
+        
+        mode = modes.get(context.args[0].lower())
+        if mode is None:
+            await update.message.reply_text(
+                "❌ Некорректный режим. Должно быть число от 1 до 3."
+            )
+            return
+        
+        # Сохраняем режим в базе данных и применяем его сразу
+        success = await Database.set_chat_delivery_mode(chat_id, mode)
+        
+        if success:
+            if vk_tracker:
+                vk_tracker.notifier.set_mode(chat_id, mode)
+            await update.message.reply_text(
+                f"✅ Режим доставки уведомлений: {mode_names[mode]}."
+            )
+        else:
+            await update.message.reply_text(
+                "❌ Произошла ошибка при изменении режима доставки уведомлений."
+            )
+            
+    except Exception as e:
+        logger.error(f"Ошибка при выполнении команды digest: {e}")
+        await update.message.reply_text(
+            "❌ Произошла непредвиденная ошибка при обработке вашего запроса."
+        )
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+import time
+from config import HISTORY_RETENTION_DAYS, HISTORY_KEEP_PER_USER, COMPACTION_INTERVAL, VACUUM_PAGES
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд без отметки запись процесса-обработчика удаляется
+STALE_WORKER_AGE = 86400
+
+class DatabaseCompactor:
+    """Фоновая очистка базы данных
+
+    Периодически удаляет историю старше срока хранения (сохраняя последние
+    записи каждого пользователя), данные пользователей без подписок и
+    окончательно недоставленные события outbox, после чего возвращает
+    освободившиеся страницы файловой системе через incremental_vacuum.
+    Благодаря этому размер базы не растет бесконечно.
+    """
+
+    def __init__(self, interval=COMPACTION_INTERVAL, retention_days=HISTORY_RETENTION_DAYS,
+                 keep=HISTORY_KEEP_PER_USER, vacuum_pages=VACUUM_PAGES):
+        self.interval = interval
+        self.retention_days = retention_days
+        self.keep = keep
+        self.vacuum_pages = vacuum_pages
+        self._task = None
+
+    async def run_once(self):
+        """Один проход очистки"""
+        started = time.monotonic()
+        now = int(time.time())
+        min_time = now - self.retention_days * 86400
+
+        deleted = await Database.compact_history(min_time, self.keep)
+        for table, count in (await Database.remove_untracked_users()).items():
+            deleted[table] = deleted.get(table, 0) + count
+        deleted["outbox"] = await Database.remove_failed_outbox_events(min_time)
+        await Database.remove_stale_workers(now - STALE_WORKER_AGE)
+
+        free_pages = await Database.incremental_vacuum(self.vacuum_pages)
+
+        removed = {table: count for table, count in deleted.items() if count}
+        logger.info(
+            f"Очистка базы данных за {time.monotonic() - started:.1f} с: удалено строк {removed or 0}, "
+            f"освобождено страниц: {free_pages}"
+        )
+
+    async def _loop(self):
+        # Включение incremental_vacuum для существующей базы (однократный VACUUM)
+        try:
+            if await Database.enable_incremental_vacuum():
+                logger.info("Для базы данных включен режим auto_vacuum = INCREMENTAL")
+        except Exception as e:
+            logger.error(f"Ошибка при включении incremental_vacuum: {e}")
+
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка при очистке базы данных: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Запуск фоновой очистки"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Остановка фоновой очистки"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -12,6 +12,8 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
 )
 logger = logging.getLogger(__name__)
+# httpx пишет в лог каждый HTTP-запрос, оставляем только предупреждения
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # Telegram Bot токен
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN", "")
@@ -25,6 +27,13 @@ VK_CLIENT_SECRET = os.getenv("VK_CLIENT_SECRET", "")
 VK_SERVICE_TOKEN = os.getenv("VK_SERVICE_TOKEN", "")
 VK_APP_ID = os.getenv("VK_APP_ID", "")
 
+# Дополнительные токены VK (пользовательские или сервисные) через запятую:
+# запросы распределяются между всеми токенами
+VK_EXTRA_TOKENS = [token.strip() for token in os.getenv("VK_EXTRA_TOKENS", "").split(",") if token.strip()]
+
+# Время, на которое токен исключается из работы после ошибки авторизации или лимита (коды 5, 29), в секундах
+VK_TOKEN_COOLDOWN = int(os.getenv("VK_TOKEN_COOLDOWN", "900"))
+
 # Админ ID (для уведомлений об ошибках)
 ADMIN_CHAT_ID = os.getenv("ADMIN_CHAT_ID", "")
 
@@ -34,9 +43,107 @@ if POLLING_INTERVAL < 20:
     logger.warning("Интервал опроса VK API слишком маленький, установлено минимальное значение 20 секунд")
     POLLING_INTERVAL = 20
 
+# Ограничение частоты запросов к VK API (не более 3 запросов в секунду на токен)
+VK_REQUESTS_PER_SECOND = float(os.getenv("VK_REQUESTS_PER_SECOND", "3"))
+
+# Бюджет запросов к VK API в минуту на один токен для планировщика проверок (статусы и активность)
+VK_REQUESTS_PER_MINUTE = int(os.getenv("VK_REQUESTS_PER_MINUTE", "120"))
+
+# Границы интервала опроса онлайн-статуса одного пользователя в секундах:
+# интервал начинается с POLLING_INTERVAL и подстраивается под частоту изменений
+STATUS_MIN_INTERVAL = max(20, int(os.getenv("STATUS_MIN_INTERVAL", "20")))
+STATUS_MAX_INTERVAL = int(os.getenv("STATUS_MAX_INTERVAL", "300"))
+
+# Максимальное количество одновременно выполняемых запросов users.get при опросе статусов
+VK_MAX_INFLIGHT_BATCHES = int(os.getenv("VK_MAX_INFLIGHT_BATCHES", "4"))
+
+# Получение онлайн-статусов друзей владельца пользовательского токена через Long Poll
+# вместо опроса users.get (требуется VK_USER_TOKEN с доступом к сообщениям)
+VK_LONGPOLL = os.getenv("VK_LONGPOLL", "false").lower() in ("1", "true", "yes")
+
+# Время ожидания событий Long Poll и интервал обновления списка друзей в секундах
+LONGPOLL_WAIT = int(os.getenv("LONGPOLL_WAIT", "25"))
+LONGPOLL_FRIENDS_REFRESH = int(os.getenv("LONGPOLL_FRIENDS_REFRESH", "3600"))
+
+# Максимальное количество HTTP-соединений с VK API (keep-alive)
+VK_HTTP_MAX_CONNECTIONS = int(os.getenv("VK_HTTP_MAX_CONNECTIONS", "10"))
+
+# Начальный интервал проверки активности (друзья, группы, посты, лайки, комментарии) в секундах
+# и границы, в которых он подстраивается под частоту изменений у пользователя
+ACTIVITY_INTERVAL = int(os.getenv("ACTIVITY_INTERVAL", "300"))
+ACTIVITY_MIN_INTERVAL = int(os.getenv("ACTIVITY_MIN_INTERVAL", "60"))
+ACTIVITY_MAX_INTERVAL = int(os.getenv("ACTIVITY_MAX_INTERVAL", "3600"))
+
+# Количество проверок активности, выполняемых одновременно
+ACTIVITY_CONCURRENCY = int(os.getenv("ACTIVITY_CONCURRENCY", "10"))
+
+# Количество страниц новостной ленты, загружаемых за цикл для поиска лайков
+NEWSFEED_PAGES = int(os.getenv("NEWSFEED_PAGES", "3"))
+
+# Интервал записи кэшей (онлайн-статусов и профилей) в базу данных в секундах
+STATUS_FLUSH_INTERVAL = int(os.getenv("STATUS_FLUSH_INTERVAL", "60"))
+
+# Кэш имен пользователей и групп: максимальное количество записей и время жизни в секундах
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", "10000"))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "86400"))
+
+# Очередь отправки уведомлений в Telegram: общий лимит сообщений в секунду,
+# минимальный интервал между сообщениями в один чат, число обработчиков и размер очереди
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", "1"))
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "8"))
+DELIVERY_QUEUE_SIZE = int(os.getenv("DELIVERY_QUEUE_SIZE", "1000"))
+
+# Количество чатов, в которые уведомление о событии рассылается одновременно
+NOTIFICATION_FANOUT = int(os.getenv("NOTIFICATION_FANOUT", "50"))
+
+# Окно объединения уведомлений в сводку (режим доставки "window") в секундах
+DIGEST_WINDOW = int(os.getenv("DIGEST_WINDOW", "60"))
+
+# Доставка событий из outbox: размер выборки, интервал опроса таблицы (с),
+# максимум одновременно обрабатываемых событий и число попыток доставки
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_POLL_INTERVAL = int(os.getenv("OUTBOX_POLL_INTERVAL", "5"))
+OUTBOX_MAX_INFLIGHT = int(os.getenv("OUTBOX_MAX_INFLIGHT", "1000"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+
+# Задержка перед повторной доставкой события (удваивается с каждой попыткой) в секундах
+OUTBOX_RETRY_DELAY = int(os.getenv("OUTBOX_RETRY_DELAY", "60"))
+
+# Время резервирования события обработчиком в секундах (должно превышать час - окно сводки "hourly")
+OUTBOX_LEASE = int(os.getenv("OUTBOX_LEASE", "7200"))
+
+# Количество процессов-обработчиков, между которыми распределяются отслеживаемые VK ID
+# (0 - отслеживание выполняется в процессе бота)
+TRACKER_WORKERS = int(os.getenv("TRACKER_WORKERS", "0"))
+
+# Интервал отметки процесса-обработчика в базе данных и время без отметки,
+# после которого процесс считается остановленным, в секундах
+WORKER_HEARTBEAT_INTERVAL = int(os.getenv("WORKER_HEARTBEAT_INTERVAL", "10"))
+WORKER_HEARTBEAT_TIMEOUT = int(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "30"))
+
+# Интервал перечитывания подписок процессом-обработчиком в секундах
+# (общий для циклов опроса статусов и проверки активности)
+ROUTES_REFRESH_INTERVAL = int(os.getenv("ROUTES_REFRESH_INTERVAL", "10"))
+
+# Срок хранения истории постов, лайков и комментариев (и недоставленных событий outbox) в днях.
+# У каждого пользователя сохраняются последние HISTORY_KEEP_PER_USER записей: значение должно
+# быть больше числа элементов за одну проверку: 20 постов со стены, до 10 + NEWSFEED_PAGES * 100
+# лайков (10 записей стены и NEWSFEED_PAGES страниц ленты записей и фотографий по 50 элементов)
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", "90"))
+HISTORY_KEEP_PER_USER = int(os.getenv("HISTORY_KEEP_PER_USER", "500"))
+
+# Интервал фоновой очистки базы данных в секундах и количество свободных страниц,
+# возвращаемых файловой системе за один раз (0 - все свободные страницы)
+COMPACTION_INTERVAL = int(os.getenv("COMPACTION_INTERVAL", "3600"))
+VACUUM_PAGES = int(os.getenv("VACUUM_PAGES", "0"))
+
 # Путь к файлу базы данных SQLite
 DB_PATH = os.getenv("DB_PATH", "vk_tracker.db")
 
+# Количество соединений-читателей в пуле SQLite (писатель всегда один)
+DB_POOL_READERS = int(os.getenv("DB_POOL_READERS", "4"))
+
 # Параметры для webhook (для использования на PythonAnywhere)
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Например, https://username.pythonanywhere.com
 WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
@@ -55,3 +162,14 @@ def format_time(unix_time):
     
     # Формат вывода: часы:минуты:секунды (по МСК)
     return dt.strftime("%H:%M:%S (МСК)")
+
+# Функция для вывода длительности в сообщениях бота
+def format_duration(seconds):
+    """Конвертирует длительность в секундах в строку вида 1 мин 30 с"""
+    minutes, seconds = divmod(int(seconds), 60)
+    parts = []
+    if minutes:
+        parts.append(f"{minutes} мин")
+    if seconds or not minutes:
+        parts.append(f"{seconds} с")
+    return " ".join(parts)
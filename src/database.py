@@ -1,16 +1,318 @@
+import asyncio
+import hashlib
+import itertools
+import json
 import aiosqlite
 import logging
-from config import DB_PATH
+import time
+from contextlib import asynccontextmanager
+from config import DB_PATH, DB_POOL_READERS
 
 logger = logging.getLogger(__name__)
 
+# Максимальное количество параметров в одном запросе вида "IN (?, ?, ...)"
+SQL_PARAMS_CHUNK = 500
+
+# PRAGMA, применяемые к каждому соединению пула
+CONNECTION_PRAGMAS = (
+    # Для новой базы auto_vacuum применяется, только если задан до перехода в WAL;
+    # существующая база переводится в этот режим при первой очистке
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -8000",
+    "PRAGMA mmap_size = 67108864",
+)
+
+# Таблицы истории и столбец времени, по которому применяется срок хранения
+HISTORY_TABLES = (
+    ("user_posts", "date"),
+    ("user_likes", "added_at"),
+    ("user_comments", "date"),
+)
+
+# Таблицы с данными отслеживаемых пользователей: очищаются, когда на
+# пользователя не остается подписок
+TRACKED_USER_TABLES = (
+    "user_statuses", "user_friends", "user_groups", "user_posts",
+    "user_likes", "user_comments", "comment_cursors", "list_fingerprints",
+)
+
+# Количество строк, удаляемых одной транзакцией при очистке (запись
+# других задач не блокируется надолго)
+COMPACTION_BATCH_SIZE = 1000
+
+# Биты маски настроек мониторинга (столбец monitoring_settings.track_mask)
+TRACK_FLAGS = {
+    "track_online": 1,
+    "track_friends": 2,
+    "track_groups": 4,
+    "track_posts": 8,
+    "track_likes": 16,
+    "track_comments": 32,
+}
+
+# Настройки новой подписки: только онлайн-статус
+DEFAULT_TRACK_MASK = TRACK_FLAGS["track_online"]
+
+# Версионные миграции схемы: (версия, описание, SQL-команды). Номер последней
+# примененной миграции хранится в PRAGMA user_version; каждая миграция
+# выполняется в отдельной транзакции вместе с изменением номера версии
+MIGRATIONS = (
+    (1, "индексы для поиска по vk_id", (
+        # Подписчики пользователя VK (первичный ключ начинается с chat_id)
+        "CREATE INDEX IF NOT EXISTS idx_subscriptions_vk_id ON subscriptions (vk_id, chat_id)",
+        # Подписчики с включенным типом отслеживания и сводка настроек по vk_id:
+        # индекс содержит все нужные столбцы, обращение к таблице не требуется
+        """
+        CREATE INDEX IF NOT EXISTS idx_monitoring_settings_vk_id ON monitoring_settings (
+            vk_id, track_online, track_friends, track_groups, track_posts, track_likes, track_comments, chat_id
+        )
+        """,
+        # Посты пользователя (первичный ключ - (owner_id, post_id))
+        "CREATE INDEX IF NOT EXISTS idx_user_posts_vk_id ON user_posts (vk_id, owner_id, post_id)",
+        # Загрузка и очистка кэша профилей по времени обновления
+        "CREATE INDEX IF NOT EXISTS idx_profile_cache_updated_at ON profile_cache (updated_at)",
+    )),
+    (2, "настройки мониторинга в виде битовой маски", (
+        """
+        CREATE TABLE monitoring_settings_new (
+            chat_id INTEGER,
+            vk_id INTEGER,
+            track_mask INTEGER DEFAULT 1,
+            PRIMARY KEY (chat_id, vk_id)
+        )
+        """,
+        """
+        INSERT INTO monitoring_settings_new (chat_id, vk_id, track_mask)
+        SELECT chat_id, vk_id,
+               (track_online != 0) * 1 | (track_friends != 0) * 2 | (track_groups != 0) * 4 |
+               (track_posts != 0) * 8 | (track_likes != 0) * 16 | (track_comments != 0) * 32
+        FROM monitoring_settings
+        """,
+        "DROP TABLE monitoring_settings",
+        "ALTER TABLE monitoring_settings_new RENAME TO monitoring_settings",
+        "CREATE INDEX IF NOT EXISTS idx_monitoring_settings_vk_id ON monitoring_settings (vk_id, chat_id, track_mask)",
+    )),
+    (3, "индексы для очистки истории по сроку хранения", (
+        "CREATE INDEX IF NOT EXISTS idx_user_posts_vk_id_date ON user_posts (vk_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_user_likes_vk_id_added_at ON user_likes (vk_id, added_at)",
+        "CREATE INDEX IF NOT EXISTS idx_user_comments_vk_id_date ON user_comments (vk_id, date)",
+    )),
+)
+
+# Запросы, которые выполняются на каждом цикле проверки или на каждое событие.
+# Методы Database используют эти же строки, а tests/test_query_plans.py
+# проверяет через EXPLAIN QUERY PLAN, что каждый из них читает таблицы по индексу
+SUBSCRIPTIONS_BY_CHAT_SQL = "SELECT vk_id FROM subscriptions WHERE chat_id = ?"
+SUBSCRIBERS_COUNT_SQL = "SELECT COUNT(*) FROM subscriptions WHERE vk_id = ?"
+MONITORING_SETTINGS_SQL = "SELECT track_mask FROM monitoring_settings WHERE chat_id = ? AND vk_id = ?"
+SUBSCRIPTION_ROUTES_SQL = """
+    SELECT s.vk_id, s.chat_id, m.track_mask FROM subscriptions s
+    LEFT JOIN monitoring_settings m ON m.chat_id = s.chat_id AND m.vk_id = s.vk_id
+"""
+LIST_FINGERPRINT_SQL = "SELECT item_count, digest FROM list_fingerprints WHERE vk_id = ? AND list_type = ?"
+FETCHED_IDS_TABLE_SQL = "CREATE TEMP TABLE IF NOT EXISTS fetched_ids (id INTEGER PRIMARY KEY)"
+# Шаблоны сравнения списка ID с сохраненным (подставляются таблица и столбец ID)
+LIST_DIFF_SQL = """
+    SELECT f.id, 1 FROM temp.fetched_ids f
+    LEFT JOIN {table} t ON t.vk_id = ? AND t.{column} = f.id
+    WHERE t.{column} IS NULL
+    UNION ALL
+    SELECT t.{column}, 0 FROM {table} t
+    LEFT JOIN temp.fetched_ids f ON f.id = t.{column}
+    WHERE t.vk_id = ? AND f.id IS NULL
+"""
+LIST_DIFF_DELETE_SQL = """
+    DELETE FROM {table}
+    WHERE vk_id = ? AND {column} NOT IN (SELECT id FROM temp.fetched_ids)
+"""
+LIST_SAVED_SQL = "SELECT 1 FROM {table} WHERE vk_id = ? LIMIT 1"
+COMMENT_CURSORS_SQL = "SELECT owner_id, post_id, comments_count, last_comment_id FROM comment_cursors WHERE vk_id = ?"
+CACHED_PROFILES_SQL = """
+    SELECT kind, id, name, screen_name, updated_at FROM profile_cache
+    WHERE updated_at >= ?
+    ORDER BY updated_at DESC
+    LIMIT ?
+"""
+OUTBOX_CLAIM_SQL = """
+    SELECT id, vk_id, event_type, payload, chat_ids, attempts FROM outbox
+    WHERE failed_at IS NULL AND next_attempt_at <= ?
+    ORDER BY next_attempt_at, id
+    LIMIT ?
+"""
+
+# Ключи записей истории, по которым проверяется, сохранен ли полученный элемент
+HISTORY_KEY_COLUMNS = {
+    "user_posts": ("owner_id", "post_id"),
+    "user_likes": ("type", "owner_id", "item_id"),
+    "user_comments": ("owner_id", "post_id", "comment_id"),
+}
+
+def existing_keys_query(table, columns, count):
+    """Запрос сохраненных у пользователя ключей из count переданных
+
+    Параметры - сначала значения ключей, затем vk_id. Переданные ключи
+    соединяются с таблицей, поэтому каждый ищется по всем столбцам индекса.
+    """
+    row = "(" + ", ".join("?" * len(columns)) + ")"
+    match = " AND ".join(f"t.{column} = k.column{i}" for i, column in enumerate(columns, 1))
+    return (
+        f"SELECT {', '.join(f't.{column}' for column in columns)} "
+        f"FROM (VALUES {', '.join([row] * count)}) k "
+        f"JOIN {table} t ON t.vk_id = ? AND {match}"
+    )
+
+# Частые запросы для проверки планов: (название, запрос, псевдонимы таблиц,
+# которые допустимо читать полным просмотром). Полный просмотр допускается
+# только там, где запрос по смыслу читает все строки: загрузка всех подписок
+# для маршрутизации, временная таблица с только что полученными ID и список
+# полученных ключей истории
+HOT_QUERIES = (
+    ("subscriptions_by_chat", SUBSCRIPTIONS_BY_CHAT_SQL, ()),
+    ("subscribers_count", SUBSCRIBERS_COUNT_SQL, ()),
+    ("monitoring_settings", MONITORING_SETTINGS_SQL, ()),
+    ("subscription_routes", SUBSCRIPTION_ROUTES_SQL, ("s",)),
+    ("list_fingerprint", LIST_FINGERPRINT_SQL, ()),
+    *(
+        (f"list_diff_{table}", LIST_DIFF_SQL.format(table=table, column=column), ("f",))
+        for table, column in (("user_friends", "friend_id"), ("user_groups", "group_id"))
+    ),
+    *(
+        (f"list_diff_delete_{table}", LIST_DIFF_DELETE_SQL.format(table=table, column=column), ())
+        for table, column in (("user_friends", "friend_id"), ("user_groups", "group_id"))
+    ),
+    *(
+        (f"list_saved_{table}", LIST_SAVED_SQL.format(table=table), ())
+        for table in ("user_friends", "user_groups")
+    ),
+    *(
+        (f"existing_keys_{table}", existing_keys_query(table, columns, 2), ("k",))
+        for table, columns in HISTORY_KEY_COLUMNS.items()
+    ),
+    ("comment_cursors", COMMENT_CURSORS_SQL, ()),
+    ("cached_profiles", CACHED_PROFILES_SQL, ()),
+    ("outbox_claim", OUTBOX_CLAIM_SQL, ()),
+)
+
+def list_fingerprint(ids):
+    """Компактный отпечаток списка ID: количество и хэш отсортированных значений"""
+    unique_ids = sorted(set(ids))
+    digest = hashlib.blake2b(",".join(map(str, unique_ids)).encode(), digest_size=8).hexdigest()
+    return len(unique_ids), digest
+
+class ConnectionPool:
+    """Пул долгоживущих соединений SQLite: один писатель и N читателей"""
+
+    def __init__(self, db_path, readers=DB_POOL_READERS):
+        self.db_path = db_path
+        self.readers_count = max(1, readers)
+        self._writer = None
+        self._writer_lock = asyncio.Lock()
+        self._readers = asyncio.Queue()
+        self._all_readers = []
+
+    async def _connect(self, read_only=False):
+        """Открытие соединения и применение PRAGMA"""
+        db = await aiosqlite.connect(self.db_path)
+        for pragma in CONNECTION_PRAGMAS:
+            await db.execute(pragma)
+        if read_only:
+            await db.execute("PRAGMA query_only = 1")
+        return db
+
+    async def open(self):
+        """Открытие соединений пула"""
+        # Писатель открывается первым: он переводит файл базы в режим WAL
+        self._writer = await self._connect()
+        for _ in range(self.readers_count):
+            reader = await self._connect(read_only=True)
+            self._all_readers.append(reader)
+            self._readers.put_nowait(reader)
+        logger.info(f"Открыт пул соединений SQLite (читателей: {self.readers_count})")
+
+    async def close(self):
+        """Закрытие всех соединений пула"""
+        async with self._writer_lock:
+            if self._writer:
+                await self._writer.close()
+                self._writer = None
+        for reader in self._all_readers:
+            await reader.close()
+        self._all_readers = []
+        self._readers = asyncio.Queue()
+        logger.info("Пул соединений SQLite закрыт")
+
+    @asynccontextmanager
+    async def writer(self):
+        """Эксклюзивный доступ к соединению-писателю"""
+        async with self._writer_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                # Не оставляем на общем соединении незавершенную транзакцию
+                if self._writer.in_transaction:
+                    await self._writer.rollback()
+                raise
+
+    @asynccontextmanager
+    async def reader(self):
+        """Соединение только для чтения из пула"""
+        db = await self._readers.get()
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
 class Database:
     """Класс для работы с базой данных SQLite"""
+
+    _pool = None
+    _pool_lock = None
+    # Кэш отпечатков списков друзей и групп: (vk_id, list_type) -> (count, digest)
+    _fingerprints = {}
+
+    @classmethod
+    async def open_pool(cls):
+        """Открытие пула соединений (вызывается при запуске приложения)"""
+        if cls._pool_lock is None:
+            cls._pool_lock = asyncio.Lock()
+        async with cls._pool_lock:
+            if cls._pool is None:
+                pool = ConnectionPool(DB_PATH)
+                await pool.open()
+                cls._pool = pool
+        return cls._pool
+
+    @classmethod
+    async def close_pool(cls):
+        """Закрытие пула соединений (вызывается при остановке приложения)"""
+        if cls._pool is not None:
+            await cls._pool.close()
+            cls._pool = None
+
+    @classmethod
+    @asynccontextmanager
+    async def _write(cls):
+        """Соединение для изменения данных"""
+        pool = cls._pool or await cls.open_pool()
+        async with pool.writer() as db:
+            yield db
+
+    @classmethod
+    @asynccontextmanager
+    async def _read(cls):
+        """Соединение для чтения данных"""
+        pool = cls._pool or await cls.open_pool()
+        async with pool.reader() as db:
+            yield db
     
     @staticmethod
     async def init_db():
         """Инициализация базы данных и создание таблиц при необходимости"""
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with Database._write() as db:
             # Создание таблицы для хранения подписок
             await db.execute('''
                 CREATE TABLE IF NOT EXISTS subscriptions (
@@ -86,7 +388,92 @@ class Database:
                 )
             ''')
             
+            # Создание таблицы курсоров комментариев: сколько комментариев было у поста
+            # и ID последнего просмотренного комментария
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS comment_cursors (
+                    vk_id INTEGER,
+                    owner_id INTEGER,
+                    post_id INTEGER,
+                    comments_count INTEGER,
+                    last_comment_id INTEGER,
+                    PRIMARY KEY (vk_id, owner_id, post_id)
+                )
+            ''')
+            
+            # Создание таблицы для отпечатков последних полученных списков друзей и групп
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS list_fingerprints (
+                    vk_id INTEGER,
+                    list_type TEXT,
+                    item_count INTEGER,
+                    digest TEXT,
+                    updated_at INTEGER,
+                    PRIMARY KEY (vk_id, list_type)
+                )
+            ''')
+            
+            # Создание таблицы для кэша имен пользователей и данных групп
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS profile_cache (
+                    kind TEXT,
+                    id INTEGER,
+                    name TEXT,
+                    screen_name TEXT,
+                    updated_at INTEGER,
+                    PRIMARY KEY (kind, id)
+                )
+            ''')
+            
+            # Создание таблицы для настроек чатов (режим доставки уведомлений)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS chat_settings (
+                    chat_id INTEGER PRIMARY KEY,
+                    delivery_mode TEXT DEFAULT 'immediate'
+                )
+            ''')
+            
+            # Создание таблицы исходящих событий (outbox): изменения, уведомления о которых
+            # еще не доставлены. Записываются в одной транзакции с изменением состояния
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    vk_id INTEGER,
+                    event_type TEXT,
+                    payload TEXT,
+                    chat_ids TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at INTEGER DEFAULT 0,
+                    created_at INTEGER,
+                    failed_at INTEGER
+                )
+            ''')
+            
+            # Индекс только по ожидающим доставки событиям
+            await db.execute('''
+                CREATE INDEX IF NOT EXISTS idx_outbox_pending
+                ON outbox (next_attempt_at, id) WHERE failed_at IS NULL
+            ''')
+            
+            # Создание таблицы для служебного состояния (например, позиция Long Poll)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS app_state (
+                    name TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+            
+            # Создание таблицы процессов-обработчиков (для распределения VK ID между ними)
+            await db.execute('''
+                CREATE TABLE IF NOT EXISTS tracker_workers (
+                    worker_id TEXT PRIMARY KEY,
+                    pid INTEGER,
+                    heartbeat_at INTEGER
+                )
+            ''')
+            
             # Создание таблицы для дополнительных настроек мониторинга
+            # (исходная схема: миграция 2 заменяет столбцы track_* битовой маской track_mask)
             await db.execute('''
                 CREATE TABLE IF NOT EXISTS monitoring_settings (
                     chat_id INTEGER,
@@ -102,12 +489,42 @@ class Database:
             ''')
             
             await db.commit()
+            await Database._migrate(db)
             logger.info("База данных инициализирована")
-    
+
+    @staticmethod
+    async def _migrate(db):
+        """Применение миграций схемы, которые еще не выполнены"""
+        cursor = await db.execute("PRAGMA user_version")
+        version = (await cursor.fetchone())[0]
+        for target, description, statements in MIGRATIONS:
+            if target <= version:
+                continue
+            try:
+                # Блокировка записи сразу: несколько процессов могут запускаться одновременно,
+                # версия перечитывается уже под блокировкой
+                await db.execute("BEGIN IMMEDIATE")
+                cursor = await db.execute("PRAGMA user_version")
+                version = (await cursor.fetchone())[0]
+                if target <= version:
+                    await db.rollback()
+                    continue
+                for statement in statements:
+                    await db.execute(statement)
+                # PRAGMA не поддерживает параметры; target - константа из MIGRATIONS
+                await db.execute(f"PRAGMA user_version = {int(target)}")
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                logger.critical(f"Ошибка при применении миграции {target} ({description})")
+                raise
+            version = target
+            logger.info(f"Применена миграция схемы {target}: {description}")
+
     @staticmethod
     async def add_subscription(chat_id, vk_id):
         """Добавление подписки на VK-пользователя"""
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with Database._write() as db:
             try:
                 await db.execute(
                     "INSERT OR IGNORE INTO subscriptions (chat_id, vk_id) VALUES (?, ?)",
@@ -122,7 +539,7 @@ class Database:
     @staticmethod
     async def remove_subscription(chat_id, vk_id):
         """Удаление подписки на VK-пользователя"""
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with Database._write() as db:
             try:
                 await db.execute(
                     "DELETE FROM subscriptions WHERE chat_id = ? AND vk_id = ?",
@@ -130,10 +547,7 @@ class Database:
                 )
                 await db.commit()
                 # Проверяем, остались ли подписки на этого vk_id
-                cursor = await db.execute(
-                    "SELECT COUNT(*) FROM subscriptions WHERE vk_id = ?",
-                    (vk_id,)
-                )
+                cursor = await db.execute(SUBSCRIBERS_COUNT_SQL, (vk_id,))
                 count = await cursor.fetchone()
                 
                 # Если нет подписок, удаляем информацию о статусе
@@ -149,222 +563,281 @@ class Database:
     @staticmethod
     async def get_subscriptions(chat_id):
         """Получение списка VK ID, на которые подписан пользователь"""
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute(
-                "SELECT vk_id FROM subscriptions WHERE chat_id = ?",
-                (chat_id,)
-            )
+        async with Database._read() as db:
+            cursor = await db.execute(SUBSCRIPTIONS_BY_CHAT_SQL, (chat_id,))
             result = await cursor.fetchall()
             return [row[0] for row in result]
     
     @staticmethod
-    async def get_all_tracked_vk_ids():
-        """Получение списка всех отслеживаемых VK ID"""
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute("SELECT DISTINCT vk_id FROM subscriptions")
+    async def get_all_user_statuses():
+        """Получение сохраненных статусов всех VK-пользователей"""
+        async with Database._read() as db:
+            cursor = await db.execute("SELECT vk_id, online, last_seen FROM user_statuses")
             result = await cursor.fetchall()
-            return [row[0] for row in result]
+            return {row[0]: {"online": row[1], "last_seen": row[2]} for row in result}
     
     @staticmethod
-    async def get_subscribers_for_vk_id(vk_id):
-        """Получение списка Telegram chat_id, подписанных на VK-пользователя"""
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute(
-                "SELECT chat_id FROM subscriptions WHERE vk_id = ?",
-                (vk_id,)
+    async def upsert_user_statuses(rows):
+        """Пакетное обновление статусов: rows - список кортежей (vk_id, online, last_seen)"""
+        if not rows:
+            return
+        async with Database._write() as db:
+            await db.executemany(
+                """
+                INSERT OR REPLACE INTO user_statuses (vk_id, online, last_seen)
+                VALUES (?, ?, ?)
+                """,
+                rows
             )
-            result = await cursor.fetchall()
-            return [row[0] for row in result]
+            await db.commit()
+            
+    @staticmethod
+    async def get_cached_profiles(min_updated_at, limit):
+        """Получение актуальных записей кэша профилей (от новых к старым)"""
+        async with Database._read() as db:
+            cursor = await db.execute(CACHED_PROFILES_SQL, (min_updated_at, limit))
+            return await cursor.fetchall()
     
     @staticmethod
-    async def get_user_status(vk_id):
-        """Получение текущего статуса VK-пользователя из базы данных"""
-        async with aiosqlite.connect(DB_PATH) as db:
+    async def save_cached_profiles(rows, min_updated_at):
+        """Сохранение записей кэша профилей и удаление устаревших"""
+        async with Database._write() as db:
+            if rows:
+                await db.executemany(
+                    """
+                    INSERT OR REPLACE INTO profile_cache (kind, id, name, screen_name, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    rows
+                )
+            await db.execute("DELETE FROM profile_cache WHERE updated_at < ?", (min_updated_at,))
+            await db.commit()
+            
+    @staticmethod
+    async def get_chat_delivery_modes():
+        """Получение режимов доставки уведомлений для всех чатов с нестандартным режимом"""
+        async with Database._read() as db:
             cursor = await db.execute(
-                "SELECT online, last_seen FROM user_statuses WHERE vk_id = ?",
-                (vk_id,)
+                "SELECT chat_id, delivery_mode FROM chat_settings WHERE delivery_mode != 'immediate'"
             )
-            result = await cursor.fetchone()
-            if result:
-                return {"online": result[0], "last_seen": result[1]}
-            return None
+            result = await cursor.fetchall()
+            return {row[0]: row[1] for row in result}
     
     @staticmethod
-    async def update_user_status(vk_id, online, last_seen):
-        """Обновление статуса VK-пользователя в базе данных"""
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute(
-                """
-                INSERT OR REPLACE INTO user_statuses (vk_id, online, last_seen)
-                VALUES (?, ?, ?)
-                """,
-                (vk_id, online, last_seen)
-            )
-            await db.commit()
+    async def set_chat_delivery_mode(chat_id, mode):
+        """Сохранение режима доставки уведомлений для чата"""
+        async with Database._write() as db:
+            try:
+                await db.execute(
+                    "INSERT OR REPLACE INTO chat_settings (chat_id, delivery_mode) VALUES (?, ?)",
+                    (chat_id, mode)
+                )
+                await db.commit()
+                return True
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении режима доставки: {e}")
+                return False
             
     @staticmethod
     async def init_monitoring_settings(chat_id, vk_id):
         """Инициализация настроек мониторинга для пользователя"""
-        async with aiosqlite.connect(DB_PATH) as db:
+        async with Database._write() as db:
             await db.execute(
-                """
-                INSERT OR IGNORE INTO monitoring_settings 
-                (chat_id, vk_id, track_online, track_friends, track_groups, track_posts, track_likes, track_comments)
-                VALUES (?, ?, 1, 0, 0, 0, 0, 0)
-                """,
-                (chat_id, vk_id)
+                "INSERT OR IGNORE INTO monitoring_settings (chat_id, vk_id, track_mask) VALUES (?, ?, ?)",
+                (chat_id, vk_id, DEFAULT_TRACK_MASK)
             )
             await db.commit()
     
     @staticmethod
     async def update_monitoring_settings(chat_id, vk_id, settings):
         """Обновление настроек мониторинга для пользователя"""
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Формируем запрос на обновление только переданных настроек
-            query_parts = []
-            params = []
-            
+        async with Database._write() as db:
+            # Биты, которые нужно установить и сбросить (только переданные настройки)
+            set_bits = 0
+            clear_bits = 0
             for setting, value in settings.items():
-                if setting in ["track_online", "track_friends", "track_groups", "track_posts", "track_likes", "track_comments"]:
-                    query_parts.append(f"{setting} = ?")
-                    params.append(value)
+                if setting in TRACK_FLAGS:
+                    if value:
+                        set_bits |= TRACK_FLAGS[setting]
+                    else:
+                        clear_bits |= TRACK_FLAGS[setting]
             
-            if not query_parts:
+            if not set_bits and not clear_bits:
                 return False
             
-            query = f"UPDATE monitoring_settings SET {', '.join(query_parts)} WHERE chat_id = ? AND vk_id = ?"
-            params.extend([chat_id, vk_id])
-            
-            await db.execute(query, params)
+            await db.execute(
+                "UPDATE monitoring_settings SET track_mask = (track_mask & ~?) | ? WHERE chat_id = ? AND vk_id = ?",
+                (clear_bits, set_bits, chat_id, vk_id)
+            )
             await db.commit()
             return True
     
     @staticmethod
     async def get_monitoring_settings(chat_id, vk_id):
         """Получение настроек мониторинга для пользователя"""
-        async with aiosqlite.connect(DB_PATH) as db:
-            cursor = await db.execute(
-                """
-                SELECT track_online, track_friends, track_groups, track_posts, track_likes, track_comments
-                FROM monitoring_settings
-                WHERE chat_id = ? AND vk_id = ?
-                """,
-                (chat_id, vk_id)
-            )
+        async with Database._read() as db:
+            cursor = await db.execute(MONITORING_SETTINGS_SQL, (chat_id, vk_id))
             result = await cursor.fetchone()
             
             if result:
-                return {
-                    "track_online": bool(result[0]),
-                    "track_friends": bool(result[1]),
-                    "track_groups": bool(result[2]),
-                    "track_posts": bool(result[3]),
-                    "track_likes": bool(result[4]),
-                    "track_comments": bool(result[5])
-                }
+                return {setting: bool(result[0] & flag) for setting, flag in TRACK_FLAGS.items()}
             
             return None
     
     @staticmethod
-    async def get_users_with_activity_tracking():
-        """Получение списка пользователей с включенным отслеживанием активности"""
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Получаем пользователей с любым отслеживанием активности (кроме онлайн-статуса)
-            cursor = await db.execute(
-                """
-                SELECT DISTINCT vk_id FROM monitoring_settings
-                WHERE track_friends = 1 OR track_groups = 1 OR track_posts = 1 OR 
-                      track_likes = 1 OR track_comments = 1
-                """
-            )
-            result = await cursor.fetchall()
-            return [row[0] for row in result]
-    
+    async def get_subscription_routes():
+        """Получение всех подписок с масками настроек: список (vk_id, chat_id, track_mask)
+
+        Для подписок без сохраненных настроек возвращается маска по умолчанию.
+        """
+        async with Database._read() as db:
+            cursor = await db.execute(SUBSCRIPTION_ROUTES_SQL)
+            return [
+                (vk_id, chat_id, DEFAULT_TRACK_MASK if mask is None else mask)
+                for vk_id, chat_id, mask in await cursor.fetchall()
+            ]
+
+    # Общий механизм сравнения списков ID (друзья, группы)
     @staticmethod
-    async def get_subscribers_with_tracking(vk_id, track_type):
-        """Получение списка подписчиков с определенным типом отслеживания"""
-        if track_type not in ["track_online", "track_friends", "track_groups", "track_posts", "track_likes", "track_comments"]:
-            return []
-            
-        async with aiosqlite.connect(DB_PATH) as db:
+    async def _get_fingerprint(vk_id, list_type):
+        """Получение отпечатка последнего сохраненного списка (из кэша или базы)"""
+        key = (vk_id, list_type)
+        if key not in Database._fingerprints:
+            async with Database._read() as db:
+                cursor = await db.execute(LIST_FINGERPRINT_SQL, key)
+                row = await cursor.fetchone()
+            if row is None:
+                return None
+            Database._fingerprints[key] = (row[0], row[1])
+        return Database._fingerprints[key]
+
+    @staticmethod
+    def retain_fingerprints(vk_ids):
+        """Удаление из кэша отпечатков пользователей, которых обрабатывает другой процесс"""
+        tracked = set(vk_ids)
+        for key in list(Database._fingerprints):
+            if key[0] not in tracked:
+                del Database._fingerprints[key]
+
+    @staticmethod
+    async def _diff_id_list(list_type, table, column, vk_id, ids, current_time, events):
+        """Сравнение полученного списка ID с сохраненным средствами SQL
+
+        Если отпечаток списка совпадает с предыдущим, список не изменился
+        и обращение к таблице не требуется. Иначе полученные ID загружаются
+        во временную таблицу, добавленные и удаленные определяются одним
+        запросом с объединением, после чего изменения и новый отпечаток
+        сохраняются в одной транзакции вместе с событиями outbox (events -
+        типы событий для добавленных и удаленных ID). Возвращает кортеж
+        (added, removed).
+
+        Если список пользователя еще не сохранен (новая подписка или данные
+        удалены очисткой базы после отписки), полученный список становится
+        исходным: он сохраняется без событий, и возвращаются пустые списки.
+        """
+        fingerprint = list_fingerprint(ids)
+        if await Database._get_fingerprint(vk_id, list_type) == fingerprint:
+            return [], []
+
+        async with Database._write() as db:
+            await db.execute(FETCHED_IDS_TABLE_SQL)
+            await db.execute("DELETE FROM temp.fetched_ids")
+            await db.executemany(
+                "INSERT OR IGNORE INTO temp.fetched_ids (id) VALUES (?)",
+                ((item_id,) for item_id in ids)
+            )
+
+            # Отпечаток проверяется в базе, а не в кэше: очистка могла удалить список
+            cursor = await db.execute(LIST_FINGERPRINT_SQL, (vk_id, list_type))
+            baseline = await cursor.fetchone() is None
+            if baseline:
+                cursor = await db.execute(LIST_SAVED_SQL.format(table=table), (vk_id,))
+                baseline = await cursor.fetchone() is None
+
             cursor = await db.execute(
-                f"""
-                SELECT chat_id FROM monitoring_settings
-                WHERE vk_id = ? AND {track_type} = 1
+                LIST_DIFF_SQL.format(table=table, column=column),
+                (vk_id, vk_id)
+            )
+            added, removed = [], []
+            for item_id, is_added in await cursor.fetchall():
+                (added if is_added else removed).append(item_id)
+
+            if added:
+                await db.executemany(
+                    f"INSERT OR REPLACE INTO {table} (vk_id, {column}, added_at) VALUES (?, ?, ?)",
+                    ((vk_id, item_id, current_time) for item_id in added)
+                )
+            if removed:
+                await db.execute(
+                    LIST_DIFF_DELETE_SQL.format(table=table, column=column),
+                    (vk_id,)
+                )
+            if baseline:
+                added, removed = [], []
+            added_event, removed_event = events
+            await Database._add_outbox_event(db, vk_id, added_event, added, current_time)
+            await Database._add_outbox_event(db, vk_id, removed_event, removed, current_time)
+            await db.execute(
+                """
+                INSERT OR REPLACE INTO list_fingerprints (vk_id, list_type, item_count, digest, updated_at)
+                VALUES (?, ?, ?, ?, ?)
                 """,
-                (vk_id,)
+                (vk_id, list_type, fingerprint[0], fingerprint[1], current_time)
             )
-            result = await cursor.fetchall()
-            return [row[0] for row in result]
-            
+            await db.commit()
+
+        Database._fingerprints[(vk_id, list_type)] = fingerprint
+        return added, removed
+
     # Методы для работы с друзьями
     @staticmethod
-    async def update_friends(vk_id, friends, current_time):
-        """Обновление списка друзей пользователя и получение новых друзей"""
-        new_friends = []
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Получаем текущий список друзей
-            cursor = await db.execute(
-                "SELECT friend_id FROM user_friends WHERE vk_id = ?",
-                (vk_id,)
-            )
-            existing_friends = {row[0] for row in await cursor.fetchall()}
-            
-            # Обрабатываем новых друзей
-            for friend_id in friends:
-                if friend_id not in existing_friends:
-                    await db.execute(
-                        """
-                        INSERT OR REPLACE INTO user_friends (vk_id, friend_id, added_at)
-                        VALUES (?, ?, ?)
-                        """,
-                        (vk_id, friend_id, current_time)
-                    )
-                    new_friends.append(friend_id)
-            
-            await db.commit()
-        return new_friends
-        
+    async def diff_friends(vk_id, friends, current_time):
+        """Обновление списка друзей пользователя; возвращает (новые друзья, удаленные друзья)"""
+        return await Database._diff_id_list(
+            "friends", "user_friends", "friend_id", vk_id, friends, current_time,
+            ("friends_added", "friends_removed")
+        )
+
     # Методы для работы с группами
     @staticmethod
-    async def update_groups(vk_id, groups, current_time):
-        """Обновление списка групп пользователя и получение новых групп"""
-        new_groups = []
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Получаем текущий список групп
-            cursor = await db.execute(
-                "SELECT group_id FROM user_groups WHERE vk_id = ?",
-                (vk_id,)
-            )
-            existing_groups = {row[0] for row in await cursor.fetchall()}
-            
-            # Обрабатываем новые группы
-            for group_id in groups:
-                if group_id not in existing_groups:
-                    await db.execute(
-                        """
-                        INSERT OR REPLACE INTO user_groups (vk_id, group_id, added_at)
-                        VALUES (?, ?, ?)
-                        """,
-                        (vk_id, group_id, current_time)
-                    )
-                    new_groups.append(group_id)
-            
-            await db.commit()
-        return new_groups
+    async def diff_groups(vk_id, groups, current_time):
+        """Обновление списка групп пользователя; возвращает (новые группы, покинутые группы)"""
+        return await Database._diff_id_list(
+            "groups", "user_groups", "group_id", vk_id, groups, current_time,
+            ("groups_joined", "groups_left")
+        )
     
     # Методы для работы с постами
+    @staticmethod
+    async def _existing_keys(db, table, vk_id, keys):
+        """Какие из ключей уже сохранены у пользователя
+
+        Каждый ключ ищется по индексу, поэтому стоимость сравнения зависит
+        от числа полученных элементов, а не от размера истории.
+        """
+        columns = HISTORY_KEY_COLUMNS[table]
+        keys = list(dict.fromkeys(keys))
+        existing = set()
+        chunk_size = SQL_PARAMS_CHUNK // len(columns)
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            cursor = await db.execute(
+                existing_keys_query(table, columns, len(chunk)),
+                [*itertools.chain.from_iterable(chunk), vk_id]
+            )
+            existing.update(tuple(row) for row in await cursor.fetchall())
+        return existing
+
     @staticmethod
     async def update_posts(vk_id, posts):
         """Обновление списка постов пользователя и получение новых постов"""
         new_posts = []
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Получаем текущие посты
-            cursor = await db.execute(
-                "SELECT owner_id, post_id FROM user_posts WHERE vk_id = ?",
-                (vk_id,)
+        async with Database._write() as db:
+            # Из сохраненных постов проверяем только полученные (без загрузки всей истории)
+            existing_posts = await Database._existing_keys(
+                db, "user_posts", vk_id,
+                [(post.get("owner_id"), post.get("id")) for post in posts]
             )
-            existing_posts = {(row[0], row[1]) for row in await cursor.fetchall()}
             
             # Обрабатываем новые посты
             for post in posts:
@@ -382,8 +855,13 @@ class Database:
                         """,
                         (vk_id, post_id, owner_id, post_date, text)
                     )
+                    existing_posts.add(post_key)
                     new_posts.append(post)
             
+            await Database._add_outbox_event(db, vk_id, "posts", [
+                {"id": post.get("id"), "owner_id": post.get("owner_id"), "text": post.get("text", "")}
+                for post in new_posts
+            ], int(time.time()))
             await db.commit()
         return new_posts
     
@@ -392,13 +870,12 @@ class Database:
     async def update_likes(vk_id, likes, current_time):
         """Обновление списка лайков пользователя и получение новых лайков"""
         new_likes = []
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Получаем текущие лайки
-            cursor = await db.execute(
-                "SELECT type, owner_id, item_id FROM user_likes WHERE vk_id = ?",
-                (vk_id,)
+        async with Database._write() as db:
+            # Из сохраненных лайков проверяем только полученные (без загрузки всей истории)
+            existing_likes = await Database._existing_keys(
+                db, "user_likes", vk_id,
+                [(like.get("type"), like.get("owner_id"), like.get("item_id")) for like in likes]
             )
-            existing_likes = {(row[0], row[1], row[2]) for row in await cursor.fetchall()}
             
             # Обрабатываем новые лайки
             for like in likes:
@@ -415,23 +892,60 @@ class Database:
                         """,
                         (vk_id, like_type, owner_id, item_id, current_time)
                     )
+                    existing_likes.add(like_key)
                     new_likes.append(like)
             
+            await Database._add_outbox_event(db, vk_id, "likes", [
+                {"type": like.get("type"), "owner_id": like.get("owner_id"), "item_id": like.get("item_id")}
+                for like in new_likes
+            ], current_time)
             await db.commit()
         return new_likes
     
     # Методы для работы с комментариями
     @staticmethod
-    async def update_comments(vk_id, comments):
-        """Обновление списка комментариев пользователя и получение новых комментариев"""
+    async def get_comment_cursors(vk_id):
+        """Получение курсоров комментариев: {(owner_id, post_id): (comments_count, last_comment_id)}"""
+        async with Database._read() as db:
+            cursor = await db.execute(COMMENT_CURSORS_SQL, (vk_id,))
+            return {(row[0], row[1]): (row[2], row[3]) for row in await cursor.fetchall()}
+
+    @staticmethod
+    async def update_comments(vk_id, comments, cursors=None, window=None):
+        """Обновление списка комментариев пользователя и получение новых комментариев
+
+        cursors - новые значения курсоров {(owner_id, post_id): (comments_count, last_comment_id)},
+        сохраняются в той же транзакции. Если задан window (ключи проверяемых постов),
+        курсоры остальных постов удаляются.
+        """
         new_comments = []
-        async with aiosqlite.connect(DB_PATH) as db:
-            # Получаем текущие комментарии
-            cursor = await db.execute(
-                "SELECT owner_id, post_id, comment_id FROM user_comments WHERE vk_id = ?",
-                (vk_id,)
+        async with Database._write() as db:
+            if cursors:
+                await db.executemany(
+                    """
+                    INSERT OR REPLACE INTO comment_cursors (vk_id, owner_id, post_id, comments_count, last_comment_id)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    [(vk_id, owner_id, post_id, count, last_id)
+                     for (owner_id, post_id), (count, last_id) in cursors.items()]
+                )
+            if window is not None:
+                cursor = await db.execute(
+                    "SELECT owner_id, post_id FROM comment_cursors WHERE vk_id = ?",
+                    (vk_id,)
+                )
+                stale = [(vk_id, row[0], row[1]) for row in await cursor.fetchall() if (row[0], row[1]) not in window]
+                if stale:
+                    await db.executemany(
+                        "DELETE FROM comment_cursors WHERE vk_id = ? AND owner_id = ? AND post_id = ?",
+                        stale
+                    )
+
+            # Из сохраненных комментариев проверяем только полученные (без загрузки всей истории)
+            existing_comments = await Database._existing_keys(
+                db, "user_comments", vk_id,
+                [(comment.get("owner_id"), comment.get("post_id"), comment.get("id")) for comment in comments]
             )
-            existing_comments = {(row[0], row[1], row[2]) for row in await cursor.fetchall()}
             
             # Обрабатываем новые комментарии
             for comment in comments:
@@ -450,7 +964,266 @@ class Database:
                         """,
                         (vk_id, comment_id, post_id, owner_id, date, text)
                     )
+                    existing_comments.add(comment_key)
                     new_comments.append(comment)
             
+            await Database._add_outbox_event(db, vk_id, "comments", new_comments, int(time.time()))
             await db.commit()
         return new_comments
+    
+    # Методы для работы со служебным состоянием
+    @staticmethod
+    async def get_state(name):
+        """Получение сохраненного значения (JSON) или None"""
+        async with Database._read() as db:
+            cursor = await db.execute("SELECT value FROM app_state WHERE name = ?", (name,))
+            row = await cursor.fetchone()
+            return json.loads(row[0]) if row else None
+
+    @staticmethod
+    async def set_state(name, value):
+        """Сохранение значения (JSON)"""
+        async with Database._write() as db:
+            await db.execute(
+                "INSERT OR REPLACE INTO app_state (name, value) VALUES (?, ?)",
+                (name, json.dumps(value))
+            )
+            await db.commit()
+    
+    # Методы для работы с исходящими событиями (outbox)
+    @staticmethod
+    async def _add_outbox_event(db, vk_id, event_type, items, created_at):
+        """Добавление события в outbox в рамках текущей транзакции (пустые события пропускаются)"""
+        if not items:
+            return
+        await db.execute(
+            """
+            INSERT INTO outbox (vk_id, event_type, payload, created_at)
+            VALUES (?, ?, ?, ?)
+            """,
+            (vk_id, event_type, json.dumps(items, ensure_ascii=False), created_at)
+        )
+
+    @staticmethod
+    async def add_outbox_event(vk_id, event_type, items, created_at):
+        """Добавление события в outbox отдельной транзакцией"""
+        async with Database._write() as db:
+            await Database._add_outbox_event(db, vk_id, event_type, items, created_at)
+            await db.commit()
+
+    @staticmethod
+    async def claim_outbox_events(now, lease, limit):
+        """Выборка готовых к отправке событий с их резервированием на lease секунд
+
+        Возвращает список (id, vk_id, event_type, items, chat_ids, attempts);
+        chat_ids равен None, если событие нужно отправить всем подписчикам.
+        """
+        async with Database._write() as db:
+            cursor = await db.execute(OUTBOX_CLAIM_SQL, (now, limit))
+            rows = await cursor.fetchall()
+            if rows:
+                await db.executemany(
+                    "UPDATE outbox SET next_attempt_at = ? WHERE id = ?",
+                    ((now + lease, row[0]) for row in rows)
+                )
+                await db.commit()
+        return [
+            (event_id, vk_id, event_type, json.loads(payload),
+             json.loads(chat_ids) if chat_ids is not None else None, attempts)
+            for event_id, vk_id, event_type, payload, chat_ids, attempts in rows
+        ]
+
+    @staticmethod
+    async def ack_outbox_event(event_id):
+        """Подтверждение доставки события (событие удаляется из outbox)"""
+        async with Database._write() as db:
+            await db.execute("DELETE FROM outbox WHERE id = ?", (event_id,))
+            await db.commit()
+
+    @staticmethod
+    async def retry_outbox_event(event_id, chat_ids, next_attempt_at, failed=False):
+        """Сохранение неудачной попытки доставки
+
+        chat_ids - чаты, в которые событие доставить не удалось. Если failed,
+        событие больше не отправляется и остается в outbox для анализа.
+        """
+        async with Database._write() as db:
+            await db.execute(
+                """
+                UPDATE outbox
+                SET attempts = attempts + 1, chat_ids = ?, next_attempt_at = ?, failed_at = ?
+                WHERE id = ?
+                """,
+                (json.dumps(chat_ids), next_attempt_at, int(time.time()) if failed else None, event_id)
+            )
+            await db.commit()
+
+    @staticmethod
+    async def reset_outbox_leases():
+        """Снятие резервирования со всех недоставленных событий (при запуске); возвращает их количество"""
+        async with Database._write() as db:
+            await db.execute(
+                "UPDATE outbox SET next_attempt_at = 0 WHERE failed_at IS NULL AND next_attempt_at > 0"
+            )
+            cursor = await db.execute("SELECT COUNT(*) FROM outbox WHERE failed_at IS NULL")
+            row = await cursor.fetchone()
+            await db.commit()
+            return row[0]
+    
+    # Методы для работы с процессами-обработчиками
+    @staticmethod
+    async def heartbeat_worker(worker_id, pid, now):
+        """Отметка о том, что процесс-обработчик работает"""
+        async with Database._write() as db:
+            await db.execute(
+                "INSERT OR REPLACE INTO tracker_workers (worker_id, pid, heartbeat_at) VALUES (?, ?, ?)",
+                (worker_id, pid, now)
+            )
+            await db.commit()
+
+    @staticmethod
+    async def get_live_workers(min_heartbeat_at):
+        """Получение ID процессов-обработчиков, отметившихся не раньше min_heartbeat_at"""
+        async with Database._read() as db:
+            cursor = await db.execute(
+                "SELECT worker_id FROM tracker_workers WHERE heartbeat_at >= ? ORDER BY worker_id",
+                (min_heartbeat_at,)
+            )
+            return [row[0] for row in await cursor.fetchall()]
+
+    @staticmethod
+    async def remove_worker(worker_id):
+        """Удаление процесса-обработчика при его остановке"""
+        async with Database._write() as db:
+            await db.execute("DELETE FROM tracker_workers WHERE worker_id = ?", (worker_id,))
+            await db.commit()
+
+    # Методы для очистки и сжатия базы данных
+    @staticmethod
+    async def _delete_rows(table, select_rowids, params=()):
+        """Удаление строк, rowid которых возвращает запрос select_rowids
+
+        Строки отбираются один раз во временную таблицу, а удаляются частями
+        по COMPACTION_BATCH_SIZE, каждая в своей транзакции. Возвращает
+        количество удаленных строк.
+        """
+        async with Database._write() as db:
+            await db.execute("CREATE TEMP TABLE IF NOT EXISTS expired_rows (row_id INTEGER PRIMARY KEY)")
+            await db.execute("DELETE FROM temp.expired_rows")
+            await db.execute(f"INSERT INTO temp.expired_rows (row_id) {select_rowids}", params)
+            await db.commit()
+
+        deleted = 0
+        while True:
+            async with Database._write() as db:
+                cursor = await db.execute(
+                    f"""
+                    DELETE FROM {table} WHERE rowid IN (
+                        SELECT row_id FROM temp.expired_rows ORDER BY row_id LIMIT ?
+                    )
+                    """,
+                    (COMPACTION_BATCH_SIZE,)
+                )
+                count = cursor.rowcount
+                await db.execute(
+                    """
+                    DELETE FROM temp.expired_rows WHERE row_id IN (
+                        SELECT row_id FROM temp.expired_rows ORDER BY row_id LIMIT ?
+                    )
+                    """,
+                    (COMPACTION_BATCH_SIZE,)
+                )
+                cursor = await db.execute("SELECT EXISTS (SELECT 1 FROM temp.expired_rows)")
+                remaining = (await cursor.fetchone())[0]
+                await db.commit()
+            deleted += max(count, 0)
+            if not remaining:
+                return deleted
+
+    @staticmethod
+    async def compact_history(min_time, keep):
+        """Удаление истории постов, лайков и комментариев старше min_time
+
+        У каждого пользователя сохраняются последние keep записей независимо
+        от их возраста, чтобы элементы, которые еще возвращает VK API, не
+        считались новыми. Возвращает {таблица: количество удаленных строк}.
+        """
+        deleted = {}
+        for table, column in HISTORY_TABLES:
+            deleted[table] = await Database._delete_rows(
+                table,
+                f"""
+                SELECT row_id FROM (
+                    SELECT rowid AS row_id, {column} AS ts,
+                           ROW_NUMBER() OVER (PARTITION BY vk_id ORDER BY {column} DESC, rowid DESC) AS position
+                    FROM {table}
+                )
+                WHERE ts < ? AND position > ?
+                """,
+                (min_time, keep)
+            )
+        return deleted
+
+    @staticmethod
+    async def remove_untracked_users():
+        """Удаление данных пользователей, на которых не осталось подписок
+
+        Возвращает {таблица: количество удаленных строк}.
+        """
+        deleted = {}
+        for table in TRACKED_USER_TABLES:
+            deleted[table] = await Database._delete_rows(
+                table,
+                f"SELECT rowid FROM {table} WHERE vk_id NOT IN (SELECT vk_id FROM subscriptions)"
+            )
+        return deleted
+
+    @staticmethod
+    async def remove_failed_outbox_events(min_failed_at):
+        """Удаление событий outbox, доставка которых окончательно не удалась до min_failed_at"""
+        return await Database._delete_rows(
+            "outbox",
+            "SELECT id FROM outbox WHERE failed_at IS NOT NULL AND failed_at < ?",
+            (min_failed_at,)
+        )
+
+    @staticmethod
+    async def remove_stale_workers(min_heartbeat_at):
+        """Удаление записей процессов-обработчиков, не отмечавшихся с min_heartbeat_at"""
+        async with Database._write() as db:
+            cursor = await db.execute("DELETE FROM tracker_workers WHERE heartbeat_at < ?", (min_heartbeat_at,))
+            await db.commit()
+            return max(cursor.rowcount, 0)
+
+    @staticmethod
+    async def enable_incremental_vacuum():
+        """Перевод базы в режим auto_vacuum = INCREMENTAL
+
+        Режим применяется только после полного VACUUM, поэтому для
+        существующей базы он выполняется один раз. Возвращает True, если
+        режим был включен сейчас.
+        """
+        async with Database._write() as db:
+            cursor = await db.execute("PRAGMA auto_vacuum")
+            if (await cursor.fetchone())[0] == 2:
+                return False
+            await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            await db.execute("VACUUM")
+            return True
+
+    @staticmethod
+    async def incremental_vacuum(pages=0):
+        """Возврат свободных страниц файловой системе (pages = 0 - все свободные страницы)
+
+        Возвращает количество освобожденных страниц.
+        """
+        async with Database._write() as db:
+            cursor = await db.execute("PRAGMA freelist_count")
+            free_pages = (await cursor.fetchone())[0]
+            if free_pages:
+                # Каждый шаг запроса освобождает одну страницу, поэтому PRAGMA выполняется
+                # через executescript (до завершения); pages - целое число из конфигурации
+                await db.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+                cursor = await db.execute("PRAGMA freelist_count")
+                free_pages -= (await cursor.fetchone())[0]
+            return free_pages
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from telegram.error import Forbidden, RetryAfter
+from config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_CHAT_INTERVAL, DELIVERY_WORKERS, DELIVERY_QUEUE_SIZE
+)
+from rate_limiter import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+class DeliveryQueue:
+    """Очередь исходящих сообщений Telegram с ограничением скорости отправки
+
+    Циклы отслеживания только ставят сообщения в очередь, а отправкой
+    занимаются отдельные обработчики. Скорость ограничена глобально
+    (около 30 сообщений в секунду) и для каждого чата (одно сообщение
+    в chat_interval секунд). У каждого чата своя очередь, поэтому чат,
+    ожидающий своей очереди, не занимает обработчики. Общее количество
+    ожидающих сообщений ограничено: при переполнении постановка в
+    очередь ждет освобождения места.
+    """
+
+    def __init__(self, bot, workers=DELIVERY_WORKERS, global_rate=TELEGRAM_GLOBAL_RATE,
+                 chat_interval=TELEGRAM_CHAT_INTERVAL, maxsize=DELIVERY_QUEUE_SIZE, max_retries=3):
+        self.bot = bot
+        self.workers_count = max(1, workers)
+        self.chat_interval = chat_interval
+        self.max_retries = max_retries
+        self.maxsize = maxsize
+        self.limiter = TokenBucket(global_rate)
+        self._slots = None
+        self._idle = None
+        self._pending = 0
+        # chat_id -> очередь сообщений этого чата
+        self._chats = {}
+        # Чаты, готовые к отправке следующего сообщения
+        self._ready = None
+        self._chat_next_send = {}
+        self._workers = []
+
+    def start(self):
+        """Запуск обработчиков очереди"""
+        if self._ready is None:
+            self._slots = asyncio.Semaphore(self.maxsize)
+            self._idle = asyncio.Event()
+            self._idle.set()
+            self._ready = asyncio.Queue()
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker())
+                for _ in range(self.workers_count)
+            ]
+
+    async def stop(self, timeout=10):
+        """Остановка обработчиков с попыткой отправить оставшиеся сообщения"""
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Не отправлено сообщений при остановке: {self._pending}")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def enqueue(self, chat_id, text, disable_preview=False):
+        """Постановка сообщения в очередь
+
+        Возвращает future, который получит True после успешной отправки
+        или False, если сообщение доставить не удалось.
+        """
+        delivered = asyncio.get_running_loop().create_future()
+        await self._slots.acquire()
+        self._pending += 1
+        self._idle.clear()
+
+        chat_queue = self._chats.get(chat_id)
+        if chat_queue is None:
+            # Чат не активен: создаем его очередь и отмечаем готовым,
+            # как только истечет интервал после предыдущего сообщения
+            chat_queue = self._chats[chat_id] = deque()
+            delay = self._chat_next_send.pop(chat_id, 0) - time.monotonic()
+            if delay > 0:
+                asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+            else:
+                self._ready.put_nowait(chat_id)
+        chat_queue.append((text, disable_preview, delivered))
+        return delivered
+
+    async def _worker(self):
+        """Обработчик: отправляет по одному сообщению из очереди готового чата"""
+        while True:
+            chat_id = await self._ready.get()
+            chat_queue = self._chats[chat_id]
+            text, disable_preview, delivered = chat_queue.popleft()
+            try:
+                result = await self._deliver(chat_id, text, disable_preview)
+            except Exception as e:
+                logger.error(f"Ошибка при отправке уведомления пользователю {chat_id}: {e}")
+                result = False
+            finally:
+                self._slots.release()
+                self._pending -= 1
+                if self._pending == 0:
+                    self._idle.set()
+
+                if chat_queue:
+                    # Следующее сообщение чата станет доступно не раньше, чем через chat_interval
+                    delay = max(0, self._chat_next_send.get(chat_id, 0) - time.monotonic())
+                    asyncio.get_running_loop().call_later(delay, self._ready.put_nowait, chat_id)
+                else:
+                    del self._chats[chat_id]
+
+            if not delivered.done():
+                delivered.set_result(result)
+
+    async def _send(self, chat_id, text, disable_preview):
+        """Отправка одного сообщения с соблюдением глобального ограничения"""
+        await self.limiter.acquire()
+        try:
+            await self.bot.send_message(
+                chat_id=chat_id,
+                text=text,
+                disable_web_page_preview=disable_preview,
+                parse_mode=None  # Используем plain text для корректного отображения ссылок
+            )
+        finally:
+            self._chat_next_send[chat_id] = time.monotonic() + self.chat_interval
+
+    async def _deliver(self, chat_id, text, disable_preview):
+        """Отправка сообщения с повторами при превышении лимитов Telegram"""
+        for attempt in range(self.max_retries):
+            try:
+                await self._send(chat_id, text, disable_preview)
+                return True
+            except RetryAfter as e:
+                if attempt == self.max_retries - 1:
+                    logger.error(f"Ошибка при отправке уведомления пользователю {chat_id}: {e}")
+                    break
+                # Лимит общий для бота: приостанавливаем выдачу токенов всем обработчикам,
+                # повторная отправка дождется окончания паузы в limiter.acquire()
+                logger.warning(f"Превышен лимит отправки сообщений. Повторная попытка через {e.retry_after} секунд")
+                self.limiter.pause(e.retry_after)
+            except Forbidden as e:
+                # Бот заблокирован или удален из чата - повторять бессмысленно
+                logger.warning(f"Нет доступа к чату {chat_id}: {e}")
+                return False
+            except Exception as e:
+                logger.error(f"Ошибка при отправке уведомления пользователю {chat_id}: {e}")
+                break
+
+        # Если отправить не удалось, пытаемся отправить упрощенное сообщение
+        try:
+            simple_message = "Уведомление о пользователе VK (ошибка отображения полного сообщения)"
+            await self._send(chat_id, simple_message, True)
+            logger.info(f"Отправлено упрощенное уведомление пользователю {chat_id}")
+        except Exception as simple_err:
+            logger.error(f"Не удалось отправить даже упрощенное уведомление: {simple_err}")
+        return False
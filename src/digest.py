@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from config import DIGEST_WINDOW
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Максимальная длина сообщения Telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Режимы доставки уведомлений: сразу, сводкой за окно DIGEST_WINDOW, сводкой раз в час
+DELIVERY_MODES = ("immediate", "window", "hourly")
+
+def split_digest(messages, limit=TELEGRAM_MESSAGE_LIMIT):
+    """Объединение уведомлений в сводку, разбитую на части не длиннее limit символов
+
+    Части разбиваются по границам уведомлений; слишком длинное уведомление
+    режется на куски. Заголовок сводки не отправляется отдельной частью.
+    """
+    header = f"📬 Сводка уведомлений ({len(messages)}):"
+    parts = []
+    current = header
+    for message in messages:
+        candidate = f"{current}\n\n{message}"
+        if len(candidate) <= limit:
+            current = candidate
+            continue
+        if current == header:
+            # Первое уведомление не помещается рядом с заголовком: заголовок
+            # остается началом первой части, а уведомление режется на куски
+            current = candidate
+        else:
+            parts.append(current)
+            current = message
+        while len(current) > limit:
+            parts.append(current[:limit])
+            current = current[limit:]
+    parts.append(current)
+    return parts
+
+class NotificationCoalescer:
+    """Объединение уведомлений одного чата в сводки
+
+    Режим доставки задается для каждого чата. В режиме "immediate"
+    уведомления сразу передаются в очередь отправки, в остальных режимах
+    накапливаются и отправляются одной сводкой по истечении окна.
+    """
+
+    def __init__(self, delivery, window=DIGEST_WINDOW):
+        self.delivery = delivery
+        self.window = window
+        self._modes = {}
+        # chat_id -> список (text, disable_preview, future)
+        self._buffers = {}
+        self._timers = {}
+        self._tasks = set()
+
+    async def load(self):
+        """Загрузка режимов доставки чатов из базы данных"""
+        self._modes = await Database.get_chat_delivery_modes()
+
+    def get_mode(self, chat_id):
+        return self._modes.get(chat_id, "immediate")
+
+    def set_mode(self, chat_id, mode):
+        """Изменение режима доставки; накопленные уведомления отправляются сразу"""
+        self._modes[chat_id] = mode
+        if chat_id in self._buffers:
+            self._flush_later(chat_id, 0)
+
+    async def submit(self, chat_id, text, disable_preview=False):
+        """Передача уведомления; возвращает future с результатом доставки"""
+        mode = self.get_mode(chat_id)
+        if mode == "immediate":
+            return await self.delivery.enqueue(chat_id, text, disable_preview)
+
+        future = asyncio.get_running_loop().create_future()
+        self._buffers.setdefault(chat_id, []).append((text, disable_preview, future))
+        if chat_id not in self._timers:
+            self._flush_later(chat_id, self._delay(mode))
+        return future
+
+    def _delay(self, mode):
+        """Время до отправки сводки"""
+        if mode == "hourly":
+            # Сводка отправляется в начале следующего часа
+            return 3600 - time.time() % 3600
+        return self.window
+
+    def _flush_later(self, chat_id, delay):
+        """Планирование отправки сводки чата"""
+        timer = self._timers.pop(chat_id, None)
+        if timer:
+            timer.cancel()
+        self._timers[chat_id] = asyncio.get_running_loop().call_later(delay, self._start_flush, chat_id)
+
+    def _start_flush(self, chat_id):
+        self._timers.pop(chat_id, None)
+        task = asyncio.create_task(self._flush(chat_id))
+        # Храним ссылку на задачу до ее завершения
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self, chat_id):
+        """Отправка накопленных уведомлений чата"""
+        items = self._buffers.pop(chat_id, [])
+        if not items:
+            return
+        try:
+            if len(items) == 1:
+                text, disable_preview, _ = items[0]
+                deliveries = [await self.delivery.enqueue(chat_id, text, disable_preview)]
+            else:
+                deliveries = [
+                    await self.delivery.enqueue(chat_id, part, True)
+                    for part in split_digest([text for text, _, _ in items])
+                ]
+            delivered = all(await asyncio.gather(*deliveries))
+        except Exception as e:
+            logger.error(f"Ошибка при отправке сводки уведомлений в чат {chat_id}: {e}")
+            delivered = False
+
+        for _, _, future in items:
+            if not future.done():
+                future.set_result(delivered)
+
+    async def stop(self):
+        """Немедленная отправка всех накопленных сводок"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers = {}
+        await asyncio.gather(*(self._flush(chat_id) for chat_id in list(self._buffers)))
+        await asyncio.gather(*self._tasks, return_exceptions=True)
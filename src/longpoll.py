@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import time
+import httpx
+from config import LONGPOLL_WAIT, LONGPOLL_FRIENDS_REFRESH
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Коды событий User Long Poll API: друг стал онлайн / офлайн
+EVENT_FRIEND_ONLINE = 8
+EVENT_FRIEND_OFFLINE = 9
+
+# Ключ по умолчанию для сохранения сервера, ключа и ts в таблице app_state
+STATE_NAME = "longpoll"
+
+# Минимальный интервал сохранения ts в базу данных в секундах
+STATE_SAVE_INTERVAL = 10
+
+class LongPollSource:
+    """Источник событий онлайн-статуса на основе User Long Poll API
+
+    Сервер Long Poll сообщает о входе и выходе из сети друзей владельца
+    пользовательского токена (события 8 и 9). Пока соединение активно,
+    статусы этих пользователей не нужно опрашивать через users.get.
+    Сервер, ключ и ts сохраняются в базе данных, поэтому после
+    перезапуска получение событий продолжается с прежней позиции.
+
+    HTTP-клиент можно подменить, например httpx.AsyncClient с
+    транспортом локального тестового сервера.
+    """
+
+    def __init__(self, call, on_status, wait=LONGPOLL_WAIT,
+                 friends_refresh=LONGPOLL_FRIENDS_REFRESH, client=None, state_name=STATE_NAME):
+        # call(method, **params) - вызов VK API с учетом общих лимитов
+        self.call = call
+        # on_status(vk_id, online, timestamp) - корутина-обработчик изменения статуса
+        self.on_status = on_status
+        self.wait = wait
+        self.friends_refresh = friends_refresh
+        self.state_name = state_name
+        self.client = client or httpx.AsyncClient(timeout=wait + 10)
+        self.server = None
+        self.key = None
+        self.ts = None
+        self.connected = False
+        self.friend_ids = frozenset()
+        self._friends_loaded_at = None
+        self._resync = False
+        self._saved_ts = None
+        self._saved_at = None
+        self._task = None
+
+    def covered_ids(self):
+        """ID пользователей, статус которых сейчас приходит через Long Poll
+
+        После разрыва соединения или потери истории событий один раз
+        возвращает пустое множество, чтобы эти пользователи были опрошены
+        заново и пропущенные изменения не потерялись.
+        """
+        if not self.connected or self._resync:
+            self._resync = False
+            return frozenset()
+        return self.friend_ids
+
+    async def start(self):
+        """Восстановление сохраненной позиции и запуск получения событий"""
+        if self._task is None:
+            try:
+                state = await Database.get_state(self.state_name)
+                if state:
+                    self.server, self.key, self.ts = state["server"], state["key"], state["ts"]
+                    self._saved_ts = self.ts
+            except Exception as e:
+                logger.error(f"Ошибка при загрузке состояния Long Poll: {e}")
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Остановка получения событий и сохранение позиции"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.connected = False
+        try:
+            await self._save_state(force=True)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении состояния Long Poll: {e}")
+        await self.client.aclose()
+
+    async def _get_server(self, reset_ts):
+        """Получение адреса сервера и ключа (и новой позиции ts, если reset_ts)"""
+        response = await self.call("messages.getLongPollServer", lp_version=3, v="5.131")
+        self.server = response["server"]
+        self.key = response["key"]
+        if reset_ts or self.ts is None:
+            self.ts = response["ts"]
+
+    async def _refresh_friends(self):
+        """Обновление списка друзей владельца токена"""
+        response = await self.call("friends.get", count=5000, v="5.131")
+        self.friend_ids = frozenset(response.get("items", []) if response else [])
+        self._friends_loaded_at = time.monotonic()
+        logger.info(f"Статусы {len(self.friend_ids)} друзей владельца токена отслеживаются через Long Poll")
+
+    async def _save_state(self, force=False):
+        """Сохранение сервера, ключа и ts (не чаще STATE_SAVE_INTERVAL секунд)"""
+        if self.key is None or self.ts == self._saved_ts:
+            return
+        recently_saved = self._saved_at is not None and time.monotonic() - self._saved_at < STATE_SAVE_INTERVAL
+        if recently_saved and not force:
+            return
+        await Database.set_state(self.state_name, {"server": self.server, "key": self.key, "ts": self.ts})
+        self._saved_ts = self.ts
+        self._saved_at = time.monotonic()
+
+    def _disconnect(self):
+        """Потеря непрерывности событий: пользователи возвращаются в опрос users.get"""
+        if self.connected:
+            self._resync = True
+        self.connected = False
+
+    async def _loop(self):
+        """Получение событий с переподключением при ошибках"""
+        delay = 1
+        while True:
+            try:
+                if self.key is None:
+                    await self._get_server(reset_ts=False)
+                if (self._friends_loaded_at is None
+                        or time.monotonic() - self._friends_loaded_at >= self.friends_refresh):
+                    await self._refresh_friends()
+
+                response = await self.client.get(
+                    f"https://{self.server}",
+                    params={
+                        "act": "a_check",
+                        "key": self.key,
+                        "ts": self.ts,
+                        "wait": self.wait,
+                        "mode": 0,
+                        "version": 3
+                    }
+                )
+                response.raise_for_status()
+                data = response.json()
+
+                failed = data.get("failed")
+                if failed == 1:
+                    # История событий устарела: часть событий потеряна, продолжаем с нового ts
+                    logger.warning("История событий Long Poll устарела, статусы будут запрошены заново")
+                    self.ts = data["ts"]
+                    self._disconnect()
+                    continue
+                if failed == 2:
+                    # Истек срок действия ключа: запрашиваем новый, позиция сохраняется
+                    self.key = None
+                    continue
+                if failed:
+                    # Информация утрачена: запрашиваем новые ключ и ts
+                    logger.warning(f"Сервер Long Poll вернул ошибку {failed}, выполняется переподключение")
+                    await self._get_server(reset_ts=True)
+                    self._disconnect()
+                    continue
+
+                self.connected = True
+                for update in data.get("updates", []):
+                    if update and update[0] in (EVENT_FRIEND_ONLINE, EVENT_FRIEND_OFFLINE):
+                        # [код, -user_id, доп. данные, время]
+                        vk_id = -update[1]
+                        online = 1 if update[0] == EVENT_FRIEND_ONLINE else 0
+                        timestamp = update[3] if len(update) > 3 else int(time.time())
+                        await self.on_status(vk_id, online, timestamp)
+
+                self.ts = data.get("ts", self.ts)
+                await self._save_state()
+                delay = 1
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Ошибка при получении событий Long Poll: {e}. Повтор через {delay} с")
+                self._disconnect()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60)
@@ -1,24 +1,28 @@
 import asyncio
 import logging
+import multiprocessing
 import os
 from telegram import Bot
 from telegram.ext import (
     Application, CommandHandler, ContextTypes
 )
-from config import TELEGRAM_TOKEN, logger
+from config import TELEGRAM_TOKEN, TRACKER_WORKERS, logger
 from database import Database
-from vk_tracker import VKTracker
+from vk_tracker import VKTracker, ROLE_ALL, ROLE_FRONTEND
+import worker
 import bot_commands
 from bot_commands import (
     start_command, help_command, subscribe_command, 
-    unsubscribe_command, list_command, settings_command, toggle_command
+    unsubscribe_command, list_command, settings_command, toggle_command,
+    digest_command
 )
 
 # Инициализация глобальных переменных
 vk_tracker = None
 
 async def setup_database():
-    """Инициализация базы данных"""
+    """Открытие пула соединений и инициализация базы данных"""
+    await Database.open_pool()
     await Database.init_db()
 
 async def on_startup(application: Application):
@@ -28,8 +32,10 @@ async def on_startup(application: Application):
     # Инициализация базы данных
     await setup_database()
     
-    # Создание и запуск трекера VK
-    vk_tracker = VKTracker(application.bot)
+    # Создание и запуск трекера VK; при наличии процессов-обработчиков
+    # бот только выполняет команды и доставляет уведомления
+    role = ROLE_FRONTEND if TRACKER_WORKERS > 0 else ROLE_ALL
+    vk_tracker = VKTracker(application.bot, role=role)
     await vk_tracker.start_tracking()
     
     # Передаем экземпляр VKTracker в модуль bot_commands
@@ -45,6 +51,9 @@ async def on_shutdown(application: Application):
     if vk_tracker:
         await vk_tracker.stop_tracking()
     
+    # Закрытие пула соединений с базой данных
+    await Database.close_pool()
+    
     logger.info("Бот остановлен")
 
 def main():
@@ -65,13 +74,32 @@ def main():
     application.add_handler(CommandHandler("list", list_command))
     application.add_handler(CommandHandler("settings", settings_command))
     application.add_handler(CommandHandler("toggle", toggle_command))
+    application.add_handler(CommandHandler("digest", digest_command))
     
     # Регистрация функций, выполняемых при запуске и остановке бота
     application.post_init = on_startup
     application.post_shutdown = on_shutdown
     
-    # Запуск бота в режиме polling
-    application.run_polling(allowed_updates=["message", "callback_query"])
+    # Запуск процессов-обработчиков, между которыми распределяются отслеживаемые пользователи
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=worker.main, args=(f"worker-{index}",), name=f"worker-{index}")
+        for index in range(1, TRACKER_WORKERS + 1)
+    ]
+    for process in workers:
+        process.start()
+    if workers:
+        logger.info(f"Запущено процессов-обработчиков: {len(workers)}")
+
+    try:
+        # Запуск бота в режиме polling
+        application.run_polling(allowed_updates=["message", "callback_query"])
+    finally:
+        # Остановка процессов-обработчиков (SIGTERM)
+        for process in workers:
+            process.terminate()
+        for process in workers:
+            process.join()
 
 if __name__ == "__main__":
     main()
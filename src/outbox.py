@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import time
+from typing import NamedTuple, Optional
+from config import (
+    OUTBOX_BATCH_SIZE, OUTBOX_POLL_INTERVAL, OUTBOX_MAX_INFLIGHT,
+    OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_DELAY, OUTBOX_LEASE
+)
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+class OutboxEvent(NamedTuple):
+    """Событие из outbox, ожидающее доставки"""
+    id: int
+    vk_id: int
+    event_type: str
+    items: list
+    chat_ids: Optional[list]  # None - все подписчики, иначе чаты для повторной доставки
+    attempts: int
+
+class OutboxDispatcher:
+    """Доставка событий из таблицы outbox
+
+    События записываются в outbox в одной транзакции с изменением
+    состояния, поэтому не теряются при падении процесса или ошибках
+    Telegram. Диспетчер резервирует готовые события, передает их
+    обработчику и удаляет после успешной доставки. Если часть чатов
+    не получила уведомление, событие повторяется для этих чатов с
+    увеличивающейся задержкой. При запуске все недоставленные события
+    отправляются повторно.
+    """
+
+    def __init__(self, handler, batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL,
+                 max_inflight=OUTBOX_MAX_INFLIGHT, max_attempts=OUTBOX_MAX_ATTEMPTS,
+                 retry_delay=OUTBOX_RETRY_DELAY, lease=OUTBOX_LEASE):
+        # handler(event) - корутина, доставляющая событие; возвращает список
+        # chat_id, в которые доставить уведомления не удалось
+        self.handler = handler
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_inflight = max(1, max_inflight)
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self._wakeup = None
+        self._loop_task = None
+        self._tasks = set()
+
+    def notify(self):
+        """Сигнал о новых событиях в outbox"""
+        if self._wakeup:
+            self._wakeup.set()
+
+    async def start(self):
+        """Повторная отправка недоставленных событий и запуск диспетчера"""
+        if self._loop_task is None:
+            pending = await Database.reset_outbox_leases()
+            if pending:
+                logger.info(f"Недоставленных событий в outbox: {pending}, будут отправлены повторно")
+            self._wakeup = asyncio.Event()
+            self._loop_task = asyncio.create_task(self._loop())
+
+    def close(self):
+        """Прекращение выборки новых событий (уже начатые продолжают доставляться)"""
+        if self._loop_task:
+            self._loop_task.cancel()
+
+    async def wait_closed(self, timeout=10):
+        """Ожидание завершения начатых доставок
+
+        Недоставленные за timeout события остаются в outbox и будут
+        отправлены при следующем запуске.
+        """
+        if self._loop_task:
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+        if self._tasks:
+            done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                logger.warning(f"Не завершена доставка событий при остановке: {len(pending)}")
+                await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _loop(self):
+        """Выборка готовых событий и запуск их доставки"""
+        while True:
+            self._wakeup.clear()
+
+            # Ограничиваем число одновременно доставляемых событий
+            while len(self._tasks) >= self.max_inflight:
+                await asyncio.wait(set(self._tasks), return_when=asyncio.FIRST_COMPLETED)
+
+            limit = min(self.batch_size, self.max_inflight - len(self._tasks))
+            try:
+                rows = await Database.claim_outbox_events(int(time.time()), self.lease, limit)
+            except Exception as e:
+                logger.error(f"Ошибка при выборке событий из outbox: {e}")
+                rows = []
+
+            for row in rows:
+                task = asyncio.create_task(self._dispatch(OutboxEvent(*row)))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            # Полная выборка - вероятно, есть еще события, продолжаем без ожидания
+            if len(rows) < limit:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _dispatch(self, event):
+        """Доставка одного события и сохранение результата"""
+        try:
+            failed_chats = await self.handler(event)
+        except Exception as e:
+            logger.error(f"Ошибка при доставке события {event.id} ({event.event_type}) для {event.vk_id}: {e}")
+            failed_chats = event.chat_ids
+
+        try:
+            if failed_chats == []:
+                await Database.ack_outbox_event(event.id)
+                return
+
+            attempts = event.attempts + 1
+            failed = attempts >= self.max_attempts
+            next_attempt_at = int(time.time()) + self.retry_delay * 2 ** (attempts - 1)
+            await Database.retry_outbox_event(event.id, failed_chats, next_attempt_at, failed)
+            if failed:
+                logger.warning(
+                    f"Событие {event.id} ({event.event_type}) для {event.vk_id} не доставлено "
+                    f"после {attempts} попыток"
+                )
+        except Exception as e:
+            # Событие останется зарезервированным и будет отправлено повторно при следующем запуске
+            logger.error(f"Ошибка при сохранении результата доставки события {event.id}: {e}")
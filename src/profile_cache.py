@@ -0,0 +1,72 @@
+import logging
+import time
+from collections import OrderedDict
+from config import PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL, STATUS_FLUSH_INTERVAL
+from database import Database
+from write_behind import WriteBehindCache
+
+logger = logging.getLogger(__name__)
+
+class ProfileCache(WriteBehindCache):
+    """Кэш имен пользователей и данных групп VK для текста уведомлений
+
+    Записи вытесняются по давности использования (LRU) при превышении
+    max_entries и считаются устаревшими через ttl секунд. Новые записи
+    периодически сохраняются в SQLite, чтобы кэш переживал перезапуск.
+    """
+
+    label = "кэша профилей"
+
+    def __init__(self, max_entries=PROFILE_CACHE_SIZE, ttl=PROFILE_CACHE_TTL,
+                 flush_interval=STATUS_FLUSH_INTERVAL):
+        super().__init__(flush_interval)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # (kind, id) -> (name, screen_name, updated_at); kind - "user" или "group"
+        self._entries = OrderedDict()
+
+    async def load(self):
+        """Загрузка сохраненных записей из базы данных"""
+        rows = await Database.get_cached_profiles(int(time.time()) - self.ttl, self.max_entries)
+        # Строки отсортированы от новых к старым, самые свежие должны оказаться в конце LRU
+        for kind, item_id, name, screen_name, updated_at in reversed(rows):
+            self._entries[(kind, item_id)] = (name, screen_name, updated_at)
+        self._dirty.clear()
+        logger.info(f"Загружено профилей в кэш: {len(self._entries)}")
+
+    def get(self, kind, item_id):
+        """Получение записи (name, screen_name) или None, если ее нет или она устарела"""
+        key = (kind, item_id)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] + self.ttl < time.time():
+            del self._entries[key]
+            self._dirty.discard(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0], entry[1]
+
+    def put(self, kind, item_id, name, screen_name=None):
+        """Добавление или обновление записи"""
+        key = (kind, item_id)
+        self._entries[key] = (name, screen_name, int(time.time()))
+        self._entries.move_to_end(key)
+        self._dirty.add(key)
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._dirty.discard(evicted)
+
+    def put_user(self, user):
+        """Добавление пользователя из ответа users.get"""
+        name = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip()
+        if user.get('id') and name:
+            self.put("user", user['id'], name)
+
+    def _rows(self, keys):
+        """Строки (kind, id, name, screen_name, updated_at) для записи"""
+        return [(kind, item_id) + self._entries[(kind, item_id)] for kind, item_id in keys if (kind, item_id) in self._entries]
+
+    async def _save(self, rows):
+        """Сохранение новых записей и удаление устаревших из базы данных"""
+        await Database.save_cached_profiles(rows, int(time.time()) - self.ttl)
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+class TokenBucket:
+    """Ограничитель частоты запросов по алгоритму "token bucket"
+
+    Токены пополняются со скоростью rate в секунду, но не выше capacity.
+    Каждый запрос забирает один токен; если токенов нет, запрос ждет.
+    Емкость не меньше одного токена: иначе при rate < 1 (лимит токена VK,
+    разделенный между процессами) запрос никогда бы не дождался токена.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity if capacity is not None else rate))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = None
+
+    def _refill(self, now):
+        """Пополнение токенов за прошедшее время"""
+        elapsed = max(0.0, now - self._updated_at)
+        self._updated_at = max(self._updated_at, now)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+
+    async def acquire(self):
+        """Ожидание свободного токена"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        # Ожидающие обслуживаются строго по очереди
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def available(self):
+        """Количество доступных сейчас токенов (0 во время паузы)"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return 0.0
+        self._refill(now)
+        return self._tokens
+
+    def try_acquire(self):
+        """Получение токена без ожидания; возвращает False, если токенов нет"""
+        now = time.monotonic()
+        if now < self._paused_until:
+            return False
+        self._refill(now)
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    def pause(self, seconds):
+        """Приостановка выдачи токенов (например, после ошибки "Too many requests")"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # После паузы токены начинают накапливаться заново
+        self._tokens = 0.0
+        self._updated_at = self._paused_until
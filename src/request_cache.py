@@ -0,0 +1,44 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CycleRequestCache:
+    """Кэш ответов VK API в пределах одного цикла проверки активности
+
+    Ключ - метод и параметры запроса. Одновременные обращения с одним
+    ключом ожидают один и тот же запрос, поэтому он выполняется один раз.
+    """
+
+    def __init__(self):
+        self._responses = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(method, params):
+        return method, tuple(sorted(params.items()))
+
+    async def get(self, method, params, fetch):
+        """Получение ответа из кэша или выполнение запроса через fetch()"""
+        key = self._key(method, params)
+        response = self._responses.get(key)
+        if response is None:
+            self.misses += 1
+            response = asyncio.ensure_future(fetch())
+            self._responses[key] = response
+        else:
+            self.hits += 1
+        return await asyncio.shield(response)
+
+    def reset(self):
+        """Очистка кэша перед новым циклом (счетчики обнуляются)"""
+        self._responses = {}
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """Строка со статистикой использования кэша"""
+        total = self.hits + self.misses
+        ratio = self.hits / total * 100 if total else 0
+        return f"попаданий: {self.hits}, промахов: {self.misses} ({ratio:.0f}% запросов сэкономлено)"
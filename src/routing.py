@@ -0,0 +1,88 @@
+import time
+from database import Database, TRACK_FLAGS, DEFAULT_TRACK_MASK
+
+# Типы проверок активности и соответствующие им биты маски настроек.
+# Посты, лайки и комментарии планируются одной проверкой "wall": иначе их
+# интервалы расходятся, и стена запрашивается в разных циклах по отдельности
+ACTIVITY_CHECKS = {
+    "friends": TRACK_FLAGS["track_friends"],
+    "groups": TRACK_FLAGS["track_groups"],
+    "wall": TRACK_FLAGS["track_posts"] | TRACK_FLAGS["track_likes"] | TRACK_FLAGS["track_comments"],
+}
+
+class SubscriptionRouter:
+    """Таблица маршрутизации уведомлений в памяти: vk_id -> {chat_id: маска настроек}
+
+    Загружается из базы данных один раз и затем обновляется командами
+    /subscribe, /unsubscribe и /toggle, поэтому получатели уведомлений и
+    список проверок определяются без запросов к базе данных.
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self.loaded_at = None
+
+    def __len__(self):
+        return sum(len(chats) for chats in self._routes.values())
+
+    async def load(self):
+        """Загрузка всех подписок и их настроек одним запросом"""
+        routes = {}
+        for vk_id, chat_id, mask in await Database.get_subscription_routes():
+            routes.setdefault(vk_id, {})[chat_id] = mask
+        self._routes = routes
+        self.loaded_at = time.monotonic()
+
+    async def refresh(self, max_age):
+        """Загрузка подписок, если таблица старше max_age секунд"""
+        if self.loaded_at is None or time.monotonic() - self.loaded_at >= max_age:
+            await self.load()
+
+    def update(self, chat_id, vk_id, settings):
+        """Изменение настроек подписки (новая подписка получает настройки по умолчанию)"""
+        chats = self._routes.setdefault(vk_id, {})
+        mask = chats.get(chat_id, DEFAULT_TRACK_MASK)
+        for setting, value in settings.items():
+            if setting in TRACK_FLAGS:
+                if value:
+                    mask |= TRACK_FLAGS[setting]
+                else:
+                    mask &= ~TRACK_FLAGS[setting]
+        chats[chat_id] = mask
+
+    def remove(self, chat_id, vk_id):
+        """Удаление подписки"""
+        chats = self._routes.get(vk_id)
+        if chats is not None:
+            chats.pop(chat_id, None)
+            if not chats:
+                del self._routes[vk_id]
+
+    def vk_ids(self):
+        """Все отслеживаемые VK ID"""
+        return list(self._routes)
+
+    def subscribers(self, vk_id, track_type=None):
+        """Чаты, подписанные на пользователя (с включенным track_type, если он задан)"""
+        chats = self._routes.get(vk_id)
+        if not chats:
+            return []
+        if track_type is None:
+            return list(chats)
+        flag = TRACK_FLAGS.get(track_type, 0)
+        return [chat_id for chat_id, mask in chats.items() if mask & flag]
+
+    def activity_checks(self):
+        """План цикла проверок: пары (vk_id, тип проверки), включенные хотя бы одним подписчиком
+
+        Типы проверок пользователя - объединение масок всех его подписчиков.
+        """
+        checks = []
+        for vk_id, chats in self._routes.items():
+            combined = 0
+            for mask in chats.values():
+                combined |= mask
+            for check_type, flag in ACTIVITY_CHECKS.items():
+                if combined & flag:
+                    checks.append((vk_id, check_type))
+        return checks
@@ -0,0 +1,98 @@
+import heapq
+import itertools
+import time
+
+class AdaptiveScheduler:
+    """Планировщик проверок с собственным интервалом для каждого ключа
+
+    Ключи (например, VK ID или пара (vk_id, тип проверки)) хранятся в куче
+    по времени следующей проверки. Интервал ключа подстраивается под частоту
+    изменений: если проверка нашла изменения, интервал уменьшается (не ниже
+    min_interval), если нет - увеличивается (не выше max_interval).
+    """
+
+    def __init__(self, initial_interval, min_interval, max_interval, shrink=0.5, growth=1.5):
+        self.initial_interval = initial_interval
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.shrink = shrink
+        self.growth = growth
+        # Куча записей (due_at, seq, key)
+        self._heap = []
+        # key -> текущий интервал
+        self._intervals = {}
+        # key -> seq актуальной записи в куче; остальные записи ключа устарели
+        self._scheduled = {}
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def _push(self, key, due_at):
+        seq = next(self._counter)
+        self._scheduled[key] = seq
+        heapq.heappush(self._heap, (due_at, seq, key))
+
+    def _peek(self):
+        """Ближайшая актуальная запись кучи (устаревшие записи удаляются)"""
+        while self._heap:
+            due_at, seq, key = self._heap[0]
+            if self._scheduled.get(key) == seq:
+                return due_at, key
+            heapq.heappop(self._heap)
+        return None
+
+    def sync(self, keys):
+        """Приведение набора ключей к актуальному
+
+        Новые ключи проверяются сразу, удаленные перестают планироваться.
+        """
+        keys = set(keys)
+        now = time.monotonic()
+        for key in keys - self._intervals.keys():
+            self._intervals[key] = self.initial_interval
+            self._push(key, now)
+        for key in self._intervals.keys() - keys:
+            del self._intervals[key]
+            self._scheduled.pop(key, None)
+
+    def time_until_next(self):
+        """Секунд до ближайшей проверки (0 - есть просроченные) или None, если ключей нет"""
+        entry = self._peek()
+        if entry is None:
+            return None
+        return max(0.0, entry[0] - time.monotonic())
+
+    def pop_due(self, limit):
+        """Извлечение не более limit ключей, время проверки которых наступило
+
+        Для каждого извлеченного ключа нужно вызвать report(), иначе он
+        больше не будет запланирован.
+        """
+        now = time.monotonic()
+        keys = []
+        while len(keys) < limit:
+            entry = self._peek()
+            if entry is None or entry[0] > now:
+                break
+            heapq.heappop(self._heap)
+            del self._scheduled[entry[1]]
+            keys.append(entry[1])
+        return keys
+
+    def report(self, key, changed):
+        """Результат проверки и планирование следующей
+
+        changed: True - найдены изменения, False - изменений нет,
+        None - проверка не удалась (интервал не меняется).
+        """
+        interval = self._intervals.get(key)
+        if interval is None:
+            # Ключ удален, пока выполнялась проверка
+            return
+        if changed:
+            interval = max(self.min_interval, interval * self.shrink)
+        elif changed is not None:
+            interval = min(self.max_interval, interval * self.growth)
+        self._intervals[key] = interval
+        self._push(key, time.monotonic() + interval)
@@ -0,0 +1,104 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import time
+from config import WORKER_HEARTBEAT_INTERVAL, WORKER_HEARTBEAT_TIMEOUT
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Количество точек каждого процесса на кольце (сглаживает распределение)
+RING_REPLICAS = 64
+
+def ring_position(value):
+    """Позиция значения на кольце хэшей"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Кольцо согласованного хэширования
+
+    При добавлении или удалении процесса меняется владелец только
+    у части VK ID, остальные остаются за прежними процессами.
+    """
+
+    def __init__(self, nodes, replicas=RING_REPLICAS):
+        self.nodes = tuple(sorted(nodes))
+        points = sorted(
+            (ring_position(f"{node}:{replica}"), node)
+            for node in self.nodes for replica in range(replicas)
+        )
+        self._positions = [position for position, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, key):
+        """Процесс, которому принадлежит ключ (None, если процессов нет)"""
+        if not self._positions:
+            return None
+        index = bisect.bisect(self._positions, ring_position(key)) % len(self._positions)
+        return self._nodes[index]
+
+class ShardCoordinator:
+    """Участие процесса-обработчика в распределении отслеживаемых VK ID
+
+    Процессы периодически отмечаются в таблице tracker_workers общей
+    базы данных. Каждый процесс строит кольцо из работающих процессов и
+    обрабатывает только свои VK ID. Новые подписки распределяются при
+    следующем цикле опроса, а при запуске или остановке процесса VK ID
+    перераспределяются между оставшимися.
+    """
+
+    def __init__(self, worker_id, heartbeat_interval=WORKER_HEARTBEAT_INTERVAL,
+                 timeout=WORKER_HEARTBEAT_TIMEOUT):
+        self.worker_id = worker_id
+        self.heartbeat_interval = heartbeat_interval
+        self.timeout = timeout
+        self.ring = HashRing([worker_id])
+        self._task = None
+
+    def owns(self, vk_id):
+        return self.ring.owner(vk_id) == self.worker_id
+
+    def filter(self, vk_ids):
+        """VK ID, которые обрабатывает этот процесс"""
+        return [vk_id for vk_id in vk_ids if self.owns(vk_id)]
+
+    async def refresh(self):
+        """Отметка процесса и обновление кольца по списку работающих процессов"""
+        now = int(time.time())
+        await Database.heartbeat_worker(self.worker_id, os.getpid(), now)
+        workers = await Database.get_live_workers(now - self.timeout)
+        if self.worker_id not in workers:
+            workers.append(self.worker_id)
+        if tuple(sorted(workers)) != self.ring.nodes:
+            self.ring = HashRing(workers)
+            logger.info(f"Обработчик {self.worker_id}: VK ID перераспределены между процессами {list(self.ring.nodes)}")
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении списка процессов-обработчиков: {e}")
+
+    async def start(self):
+        """Регистрация процесса и запуск периодической отметки"""
+        if self._task is None:
+            await self.refresh()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Остановка отметки; VK ID процесса сразу переходят к остальным"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await Database.remove_worker(self.worker_id)
+        except Exception as e:
+            logger.error(f"Ошибка при удалении процесса-обработчика {self.worker_id}: {e}")
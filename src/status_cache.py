@@ -0,0 +1,49 @@
+import logging
+from config import STATUS_FLUSH_INTERVAL
+from database import Database
+from write_behind import WriteBehindCache
+
+logger = logging.getLogger(__name__)
+
+class StatusCache(WriteBehindCache):
+    """Кэш онлайн-статусов в памяти с отложенной записью в SQLite"""
+
+    label = "кэша статусов"
+
+    def __init__(self, flush_interval=STATUS_FLUSH_INTERVAL):
+        super().__init__(flush_interval)
+        self._statuses = {}
+
+    async def load(self):
+        """Загрузка сохраненных статусов из таблицы user_statuses"""
+        self._statuses = await Database.get_all_user_statuses()
+        self._dirty.clear()
+        logger.info(f"Загружено статусов в кэш: {len(self._statuses)}")
+
+    def get(self, vk_id):
+        """Получение предыдущего статуса пользователя (или None)"""
+        return self._statuses.get(vk_id)
+
+    def update(self, vk_id, online, last_seen):
+        """Обновление статуса в памяти с пометкой для последующей записи"""
+        self._statuses[vk_id] = {"online": online, "last_seen": last_seen}
+        self._dirty.add(vk_id)
+
+    def retain(self, vk_ids):
+        """Удаление из кэша пользователей, которые больше не отслеживаются"""
+        tracked = set(vk_ids)
+        for vk_id in list(self._statuses):
+            if vk_id not in tracked:
+                del self._statuses[vk_id]
+                self._dirty.discard(vk_id)
+
+    def _rows(self, keys):
+        """Строки (vk_id, online, last_seen) для записи"""
+        return [
+            (vk_id, self._statuses[vk_id]["online"], self._statuses[vk_id]["last_seen"])
+            for vk_id in keys if vk_id in self._statuses
+        ]
+
+    async def _save(self, rows):
+        """Пакетное сохранение статусов"""
+        await Database.upsert_user_statuses(rows)
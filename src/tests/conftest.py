@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# Модули бота импортируются без пакета (как при запуске из src)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import Database
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """Отдельная база во временном каталоге; пул закрывается после теста"""
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "vk_tracker.db"))
+    monkeypatch.setattr(Database, "_pool", None)
+    monkeypatch.setattr(Database, "_pool_lock", None)
+    monkeypatch.setattr(Database, "_fingerprints", {})
+    yield Database
@@ -0,0 +1,41 @@
+import asyncio
+
+from telegram.error import RetryAfter
+
+from delivery import DeliveryQueue
+
+
+class FakeBot:
+    """Бот, который отвечает RetryAfter на первое сообщение"""
+
+    def __init__(self, retry_after):
+        self.retry_after = retry_after
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        now = asyncio.get_running_loop().time()
+        if self.retry_after:
+            retry_after, self.retry_after = self.retry_after, None
+            raise RetryAfter(retry_after)
+        self.sent.append((chat_id, now))
+
+
+def test_retry_after_pauses_every_worker():
+    bot = FakeBot(retry_after=1)
+    queue = DeliveryQueue(bot, workers=4, global_rate=100, chat_interval=0)
+
+    async def run():
+        queue.start()
+        started = asyncio.get_running_loop().time()
+        first = await queue.enqueue(1, "первое")
+        await asyncio.sleep(0.05)
+        # Сообщения других чатов отправляются только после паузы
+        others = [await queue.enqueue(chat_id, "следующее") for chat_id in (2, 3)]
+        results = await asyncio.gather(first, *others)
+        await queue.stop()
+        return started, results
+
+    started, results = asyncio.run(run())
+    assert results == [True, True, True]
+    assert sorted(chat_id for chat_id, _ in bot.sent) == [1, 2, 3]
+    assert all(sent_at - started >= 0.9 for _, sent_at in bot.sent)
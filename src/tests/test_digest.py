@@ -0,0 +1,37 @@
+from config import format_duration
+from digest import split_digest
+
+
+def test_parts_respect_limit_and_message_boundaries():
+    parts = split_digest(["a" * 30, "b" * 30, "c" * 30], limit=70)
+
+    assert all(len(part) <= 70 for part in parts)
+    assert parts[0].startswith("📬 Сводка уведомлений (3):")
+    assert parts[1:] == ["b" * 30 + "\n\n" + "c" * 30]
+
+
+def test_long_first_message_starts_with_header():
+    parts = split_digest(["a" * 5000, "b"])
+
+    # Заголовок не отправляется отдельным сообщением
+    assert [len(part) for part in parts] == [4096, 934]
+    assert parts[0].startswith("📬 Сводка уведомлений (2):\n\naaa")
+    assert parts[1].endswith("a\n\nb")
+    assert "".join(parts).count("a") == 5000
+
+
+def test_format_duration():
+    assert format_duration(60) == "1 мин"
+    assert format_duration(90) == "1 мин 30 с"
+    assert format_duration(45) == "45 с"
+
+
+def test_first_message_fitting_only_without_header_is_not_split_from_it():
+    header = "📬 Сводка уведомлений (1):"
+    message = "x" * 62
+    parts = split_digest([message], limit=69)
+
+    # Уведомление короче limit, но вместе с заголовком не помещается
+    assert all(len(part) <= 69 for part in parts)
+    assert parts[0].startswith(f"{header}\n\nx")
+    assert "".join(parts) == f"{header}\n\n{message}"
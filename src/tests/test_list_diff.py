@@ -0,0 +1,53 @@
+import asyncio
+
+from database import Database
+
+
+async def with_db(temp_db, scenario):
+    """Выполнение сценария на временной базе; пул закрывается и при ошибке"""
+    await temp_db.init_db()
+    try:
+        return await scenario()
+    finally:
+        await temp_db.close_pool()
+
+
+async def outbox_events():
+    async with Database._read() as db:
+        cursor = await db.execute("SELECT event_type, payload FROM outbox ORDER BY id")
+        return await cursor.fetchall()
+
+
+def test_first_fetch_is_baseline(temp_db):
+    async def run():
+        first = await temp_db.diff_friends(1, [10, 11], 1000)
+        events_after_first = await outbox_events()
+        second = await temp_db.diff_friends(1, [11, 12], 2000)
+        return first, events_after_first, second, await outbox_events()
+
+    first, events_after_first, second, events = asyncio.run(with_db(temp_db, run))
+    assert first == ([], [])
+    assert events_after_first == []
+    assert second == ([12], [10])
+    assert [event_type for event_type, _ in events] == ["friends_added", "friends_removed"]
+
+
+def test_empty_list_is_not_baseline_twice(temp_db):
+    async def run():
+        await temp_db.diff_groups(1, [], 1000)
+        return await temp_db.diff_groups(1, [5], 2000)
+
+    # Сохраненный пустой список - обычный снимок, новая группа попадает в уведомления
+    assert asyncio.run(with_db(temp_db, run)) == ([5], [])
+
+
+def test_fetch_after_cleanup_is_baseline(temp_db):
+    async def run():
+        await temp_db.diff_friends(1, [10, 11], 1000)
+        # Подписок нет: очистка удаляет список друзей и его отпечаток
+        await temp_db.remove_untracked_users()
+        return await temp_db.diff_friends(1, [10, 11, 12], 2000), await outbox_events()
+
+    diff, events = asyncio.run(with_db(temp_db, run))
+    assert diff == ([], [])
+    assert events == []
@@ -0,0 +1,170 @@
+import asyncio
+
+import httpx
+
+from longpoll import LongPollSource, STATE_NAME
+
+SERVER = "lp.vk.test/im"
+FRIENDS = [1, 2, 3]
+
+
+class FakeVk:
+    """Ответы VK API для источника Long Poll: сервер, ключ, ts и список друзей"""
+
+    def __init__(self, *servers):
+        self.servers = list(servers)
+        self.server_requests = 0
+
+    async def __call__(self, method, **params):
+        if method == "messages.getLongPollServer":
+            self.server_requests += 1
+            key, ts = self.servers.pop(0)
+            return {"server": SERVER, "key": key, "ts": ts}
+        if method == "friends.get":
+            return {"items": FRIENDS}
+        raise AssertionError(f"Неожиданный вызов {method}")
+
+
+class FakeLongPollServer:
+    """Сервер Long Poll на httpx.MockTransport с заранее заданными ответами
+
+    Элемент сценария - JSON ответа или исключение транспорта. После
+    окончания сценария запрос ожидает, как при отсутствии событий.
+    """
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.requests = []
+
+    async def handler(self, request):
+        self.requests.append((request.url.params["key"], request.url.params["ts"]))
+        if not self.script:
+            await asyncio.Event().wait()
+        answer = self.script.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return httpx.Response(200, json=answer)
+
+    def client(self):
+        return httpx.AsyncClient(transport=httpx.MockTransport(self.handler))
+
+
+def make_source(vk, server, statuses=None):
+    async def on_status(vk_id, online, timestamp):
+        if statuses is not None:
+            statuses.append((vk_id, online, timestamp))
+
+    return LongPollSource(vk, on_status, wait=1, friends_refresh=3600, client=server.client())
+
+
+async def with_db(temp_db, scenario):
+    """Выполнение сценария на временной базе; пул закрывается и при ошибке"""
+    await temp_db.init_db()
+    try:
+        return await scenario()
+    finally:
+        await temp_db.close_pool()
+
+
+async def wait_for(condition, timeout=5):
+    """Ожидание условия, пока цикл источника обрабатывает ответы"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "условие не выполнено за отведенное время"
+        await asyncio.sleep(0.01)
+
+
+def test_failed_1_continues_from_new_ts(temp_db):
+    vk = FakeVk(("k1", 10))
+    server = FakeLongPollServer({"ts": 11, "updates": []}, {"failed": 1, "ts": 50}, {"ts": 51, "updates": []})
+
+    async def run():
+        source = make_source(vk, server)
+        await source.start()
+        await wait_for(lambda: len(server.requests) == 4)
+        covered = (source.covered_ids(), source.covered_ids())
+        await source.stop()
+        return covered
+
+    covered = asyncio.run(with_db(temp_db, run))
+    assert server.requests == [("k1", "10"), ("k1", "11"), ("k1", "50"), ("k1", "51")]
+    assert vk.server_requests == 1
+    # События между ts 11 и 50 потеряны: один раз друзья возвращаются в опрос users.get
+    assert covered == (frozenset(), frozenset(FRIENDS))
+
+
+def test_failed_2_gets_new_key_and_keeps_ts(temp_db):
+    vk = FakeVk(("k1", 10), ("k2", 99))
+    server = FakeLongPollServer({"failed": 2})
+
+    async def run():
+        source = make_source(vk, server)
+        await source.start()
+        await wait_for(lambda: len(server.requests) == 2)
+        await source.stop()
+
+    asyncio.run(with_db(temp_db, run))
+    assert server.requests == [("k1", "10"), ("k2", "10")]
+
+
+def test_failed_3_gets_new_key_and_ts(temp_db):
+    vk = FakeVk(("k1", 10), ("k2", 99))
+    server = FakeLongPollServer({"failed": 3})
+
+    async def run():
+        source = make_source(vk, server)
+        await source.start()
+        await wait_for(lambda: len(server.requests) == 2)
+        await source.stop()
+
+    asyncio.run(with_db(temp_db, run))
+    assert server.requests == [("k1", "10"), ("k2", "99")]
+
+
+def test_position_restored_after_restart(temp_db):
+    statuses = []
+    first = FakeLongPollServer({"ts": 11, "updates": [[8, -2, 0, 1000]]})
+    second = FakeLongPollServer()
+    vk = FakeVk(("k1", 10))
+
+    async def run():
+        source = make_source(vk, first, statuses)
+        await source.start()
+        await wait_for(lambda: len(first.requests) == 2)
+        await source.stop()
+
+        # Новый процесс продолжает с сохраненными сервером, ключом и ts
+        restarted = make_source(vk, second, statuses)
+        await restarted.start()
+        await wait_for(lambda: len(second.requests) == 1)
+        await restarted.stop()
+        state = await temp_db.get_state(STATE_NAME)
+        return state
+
+    state = asyncio.run(with_db(temp_db, run))
+    assert statuses == [(2, 1, 1000)]
+    assert second.requests == [("k1", "11")]
+    assert vk.server_requests == 1
+    assert state == {"server": SERVER, "key": "k1", "ts": 11}
+
+
+def test_reconnects_after_transport_error(temp_db):
+    vk = FakeVk(("k1", 10))
+    server = FakeLongPollServer(httpx.ConnectError("connection refused"), {"ts": 11, "updates": []})
+
+    async def run():
+        source = make_source(vk, server)
+        await source.start()
+        await wait_for(lambda: len(server.requests) == 1)
+        # Пока соединения нет, статусы друзей опрашиваются через users.get
+        disconnected = source.covered_ids()
+        await wait_for(lambda: len(server.requests) == 3)
+        connected = source.covered_ids()
+        await source.stop()
+        return disconnected, connected
+
+    disconnected, connected = asyncio.run(with_db(temp_db, run))
+    assert disconnected == frozenset()
+    assert connected == frozenset(FRIENDS)
+    assert server.requests == [("k1", "10"), ("k1", "10"), ("k1", "11")]
@@ -0,0 +1,98 @@
+import asyncio
+
+from database import Database
+from outbox import OutboxDispatcher
+
+
+async def with_db(temp_db, scenario):
+    """Выполнение сценария на временной базе; пул закрывается и при ошибке"""
+    await temp_db.init_db()
+    try:
+        return await scenario()
+    finally:
+        await temp_db.close_pool()
+
+
+async def wait_for(condition, timeout=5):
+    """Ожидание условия, пока диспетчер доставляет события"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not await condition():
+        assert loop.time() < deadline, "условие не выполнено за отведенное время"
+        await asyncio.sleep(0.01)
+
+
+async def outbox_rows():
+    async with Database._read() as db:
+        cursor = await db.execute("SELECT id, attempts, chat_ids, failed_at FROM outbox ORDER BY id")
+        return await cursor.fetchall()
+
+
+def test_lease_hides_event_until_it_expires(temp_db):
+    async def run():
+        await temp_db.add_outbox_event(1, "friends_added", [10, 11], 900)
+        claimed = await temp_db.claim_outbox_events(1000, 60, 10)
+        # Событие зарезервировано: другой выборке оно не достается
+        during_lease = await temp_db.claim_outbox_events(1030, 60, 10)
+        # Процесс не подтвердил доставку до конца резервирования - событие выбирается снова
+        after_lease = await temp_db.claim_outbox_events(1061, 60, 10)
+        return claimed, during_lease, after_lease
+
+    claimed, during_lease, after_lease = asyncio.run(with_db(temp_db, run))
+    assert [row[1:] for row in claimed] == [(1, "friends_added", [10, 11], None, 0)]
+    assert during_lease == []
+    assert [row[0] for row in after_lease] == [claimed[0][0]]
+
+
+def test_claimed_events_replayed_after_crash(temp_db):
+    delivered = []
+
+    async def handler(event):
+        delivered.append((event.vk_id, event.event_type, event.items))
+        return []
+
+    async def outbox_empty():
+        return not await outbox_rows()
+
+    async def run():
+        await temp_db.add_outbox_event(1, "posts", [{"id": 5}], 900)
+        # Процесс зарезервировал событие и упал, не доставив его
+        await temp_db.claim_outbox_events(10 ** 10, 7200, 10)
+
+        dispatcher = OutboxDispatcher(handler, poll_interval=0.01)
+        await dispatcher.start()
+        await wait_for(outbox_empty)
+        dispatcher.close()
+        await dispatcher.wait_closed()
+
+    asyncio.run(with_db(temp_db, run))
+    assert delivered == [(1, "posts", [{"id": 5}])]
+
+
+def test_retry_limit_marks_event_failed(temp_db):
+    attempts = []
+
+    async def handler(event):
+        attempts.append(event.chat_ids)
+        # Чат 20 получил уведомление, чат 30 - нет
+        return [30]
+
+    async def failed():
+        rows = await outbox_rows()
+        return rows and rows[0][3] is not None
+
+    async def run():
+        await temp_db.add_outbox_event(1, "likes", [{"item_id": 1}], 900)
+        dispatcher = OutboxDispatcher(handler, poll_interval=0.01, max_attempts=3, retry_delay=0)
+        await dispatcher.start()
+        await wait_for(failed)
+        dispatcher.close()
+        await dispatcher.wait_closed()
+        return await outbox_rows(), await temp_db.claim_outbox_events(10 ** 10, 60, 10)
+
+    (row,), claimable = asyncio.run(with_db(temp_db, run))
+    # Первая попытка - всем подписчикам, повторные - только чатам с ошибкой
+    assert attempts == [None, [30], [30]]
+    assert row[1:3] == (3, "[30]")
+    # Событие с исчерпанными попытками остается в outbox, но больше не выбирается
+    assert claimable == []
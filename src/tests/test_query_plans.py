@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from database import FETCHED_IDS_TABLE_SQL, HISTORY_KEY_COLUMNS, HOT_QUERIES, existing_keys_query
+
+
+async def query_plan(db, query):
+    """Строки EXPLAIN QUERY PLAN запроса (параметры заменяются на NULL)"""
+    cursor = await db.execute(f"EXPLAIN QUERY PLAN {query}", (None,) * query.count("?"))
+    return [row[-1] for row in await cursor.fetchall()]
+
+
+def full_scans(plan, allowed):
+    """Таблицы, которые план читает полным просмотром без индекса"""
+    scans = []
+    for detail in plan:
+        # "SCAN t" - просмотр таблицы; "SCAN t USING ... INDEX" - просмотр индекса;
+        # "SCAN N CONSTANT ROWS" - перебор строк VALUES, а не таблицы
+        if detail.startswith("SCAN ") and " USING " not in detail and not detail.endswith("CONSTANT ROWS"):
+            table = detail[len("SCAN "):]
+            if table not in allowed:
+                scans.append(table)
+    return scans
+
+
+def run_plan(temp_db, query):
+    async def run():
+        await temp_db.init_db()
+        try:
+            async with temp_db._write() as db:
+                await db.execute(FETCHED_IDS_TABLE_SQL)
+                return await query_plan(db, query)
+        finally:
+            await temp_db.close_pool()
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("name, query, allowed", HOT_QUERIES, ids=[name for name, _, _ in HOT_QUERIES])
+def test_hot_query_uses_index(temp_db, name, query, allowed):
+    plan = run_plan(temp_db, query)
+    assert not full_scans(plan, allowed), plan
+    # Каждая таблица, кроме допустимых полных просмотров, читается через поиск по индексу
+    searches = [detail for detail in plan if detail.startswith("SEARCH ")]
+    assert searches, plan
+    for detail in searches:
+        assert " USING " in detail and ("INDEX" in detail or "PRIMARY KEY" in detail), plan
+
+
+@pytest.mark.parametrize("table", HISTORY_KEY_COLUMNS)
+def test_existing_keys_use_full_key(temp_db, table):
+    columns = HISTORY_KEY_COLUMNS[table]
+    plan = run_plan(temp_db, existing_keys_query(table, columns, 2))
+
+    # Полученный ключ ищется по всем столбцам, а не по всей истории пользователя
+    search = [detail for detail in plan if detail.startswith("SEARCH t ")]
+    assert len(search) == 1, plan
+    for column in ("vk_id", *columns):
+        assert f"{column}=?" in search[0], plan
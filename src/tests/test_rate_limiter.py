@@ -0,0 +1,23 @@
+import asyncio
+
+from rate_limiter import TokenBucket
+
+
+def test_bucket_with_rate_below_one_grants_tokens():
+    # Лимит 3 запроса в секунду на токен, разделенный между 4 процессами
+    bucket = TokenBucket(0.75)
+
+    async def run():
+        await asyncio.wait_for(bucket.acquire(), timeout=1)
+
+    asyncio.run(run())
+    assert bucket.capacity == 1.0
+    assert not bucket.try_acquire()
+
+
+def test_pause_blocks_try_acquire():
+    bucket = TokenBucket(100)
+    bucket.pause(60)
+
+    assert not bucket.try_acquire()
+    assert bucket.available() == 0.0
@@ -0,0 +1,18 @@
+from routing import SubscriptionRouter
+
+
+def test_wall_checks_share_one_scheduler_key():
+    router = SubscriptionRouter()
+    router.update(1, 10, {"track_posts": True, "track_likes": True, "track_comments": True})
+    router.update(2, 10, {"track_friends": True})
+
+    # Посты, лайки и комментарии одного пользователя - одна проверка стены
+    assert sorted(router.activity_checks()) == [(10, "friends"), (10, "wall")]
+
+
+def test_wall_check_planned_for_any_wall_setting():
+    router = SubscriptionRouter()
+    router.update(1, 10, {"track_online": True})
+    router.update(1, 11, {"track_comments": True})
+
+    assert router.activity_checks() == [(11, "wall")]
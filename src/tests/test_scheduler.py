@@ -0,0 +1,83 @@
+import pytest
+
+import scheduler
+from scheduler import AdaptiveScheduler
+
+
+class FakeTime:
+    """Управляемые часы для планировщика"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeTime()
+    monkeypatch.setattr(scheduler, "time", fake)
+    return fake
+
+
+def test_due_keys_pop_in_time_order(clock):
+    plan = AdaptiveScheduler(initial_interval=60, min_interval=10, max_interval=600)
+    plan.sync(["a", "b", "c"])
+    for key in plan.pop_due(10):
+        plan.report(key, None)
+    plan.report("c", True)   # через 30 с
+    plan.report("a", False)  # через 90 с
+
+    clock.now += 35
+    assert plan.pop_due(10) == ["c"]
+    clock.now += 30
+    assert plan.pop_due(10) == ["b"]
+    clock.now += 30
+    assert plan.pop_due(10) == ["a"]
+    assert plan.time_until_next() is None
+
+
+def test_interval_backs_off_and_resets_on_changes(clock):
+    plan = AdaptiveScheduler(initial_interval=60, min_interval=10, max_interval=100)
+    plan.sync(["a"])
+    assert plan.pop_due(1) == ["a"]
+
+    # Без изменений интервал растет до max_interval
+    expected = [90, 100, 100]
+    for interval in expected:
+        plan.report("a", False)
+        assert plan.time_until_next() == interval
+        clock.now += interval
+        assert plan.pop_due(1) == ["a"]
+
+    # Изменения сокращают интервал, но не ниже min_interval
+    for interval in (50, 25, 12.5, 10):
+        plan.report("a", True)
+        assert plan.time_until_next() == interval
+        clock.now += interval
+        assert plan.pop_due(1) == ["a"]
+
+    # Неудачная проверка интервал не меняет
+    plan.report("a", None)
+    assert plan.time_until_next() == 10
+
+
+def test_sync_adds_and_removes_keys(clock):
+    plan = AdaptiveScheduler(initial_interval=60, min_interval=10, max_interval=600)
+    plan.sync(["a", "b"])
+    assert len(plan) == 2
+    assert plan.time_until_next() == 0
+
+    plan.sync(["b", "c"])
+    assert len(plan) == 2
+    # Удаленный ключ больше не выдается, новый проверяется сразу
+    assert sorted(plan.pop_due(10)) == ["b", "c"]
+
+    # Результат проверки ключа, удаленного во время ее выполнения, игнорируется
+    plan.sync(["c"])
+    plan.report("b", True)
+    plan.report("c", False)
+    assert len(plan) == 1
+    clock.now += 90
+    assert plan.pop_due(10) == ["c"]
@@ -0,0 +1,137 @@
+import asyncio
+import re
+
+from vk_client import ApiError, RateLimitError, TooManyRequestsError
+from vk_execute import ExecuteBatcher
+from vk_pool import NoTokenAvailableError, VKClientPool
+
+
+class FakeExecute:
+    """Выполнение execute: каждый вызов возвращает свой номер в коде"""
+
+    def __init__(self, fail_capability=None):
+        self.codes = []
+        self.fail_capability = fail_capability
+
+    async def __call__(self, code):
+        self.codes.append(code)
+        params = {"code": code}
+        if VKClientPool.required_capability("execute", params) == self.fail_capability:
+            raise NoTokenAvailableError("нет токена")
+        calls = re.findall(r"API\.([\w.]+)\(", code)
+        return {"response": [f"{method}#{index}" for index, method in enumerate(calls)]}
+
+
+def test_calls_with_different_capabilities_are_not_mixed():
+    send = FakeExecute(fail_capability="user")
+    batcher = ExecuteBatcher(send, group=VKClientPool.required_capability)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.call("wall.get", {"owner_id": 1}),
+            batcher.call("groups.get", {"user_id": 1}),
+            batcher.call("friends.get", {"user_id": 2}),
+            return_exceptions=True
+        )
+
+    wall, groups, friends = asyncio.run(run())
+    assert len(send.codes) == 2
+    # Только groups.get требует пользовательский токен, остальные вызовы выполнены
+    assert isinstance(groups, NoTokenAvailableError)
+    assert (wall, friends) == ("wall.get#0", "friends.get#1")
+
+
+class ScriptedExecute:
+    """Выполнение execute с заранее заданным ответом"""
+
+    def __init__(self, response):
+        self.response = response
+        self.codes = []
+
+    async def __call__(self, code):
+        self.codes.append(code)
+        if isinstance(self.response, Exception):
+            raise self.response
+        return self.response
+
+
+def test_results_go_back_to_their_callers():
+    send = FakeExecute()
+    batcher = ExecuteBatcher(send)
+
+    async def run():
+        return await asyncio.gather(*(
+            batcher.call(method, {"user_id": index})
+            for index, method in enumerate(["users.get", "wall.get", "friends.get"])
+        ))
+
+    assert asyncio.run(run()) == ["users.get#0", "wall.get#1", "friends.get#2"]
+    assert send.codes == [
+        'return [API.users.get({"user_id": 0}), API.wall.get({"user_id": 1}), API.friends.get({"user_id": 2})];'
+    ]
+
+
+def test_large_batches_split_by_execute_limit():
+    send = FakeExecute()
+    batcher = ExecuteBatcher(send)
+
+    async def run():
+        return await asyncio.gather(*(batcher.call("wall.get", {"owner_id": i}) for i in range(30)))
+
+    results = asyncio.run(run())
+    assert [code.count("API.") for code in send.codes] == [25, 5]
+    assert results[24] == "wall.get#24" and results[25] == "wall.get#0"
+
+
+def test_execute_errors_map_to_failed_calls():
+    send = ScriptedExecute({
+        "response": ["first", False, "third", False],
+        "execute_errors": [
+            {"method": "wall.get", "error_code": 6, "error_msg": "Too many requests per second"},
+            {"method": "groups.get", "error_code": 29, "error_msg": "Rate limit reached"},
+        ],
+    })
+    batcher = ExecuteBatcher(send)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.call("users.get", {}),
+            batcher.call("wall.get", {"owner_id": 1}),
+            batcher.call("friends.get", {"user_id": 1}),
+            batcher.call("groups.get", {"user_id": 1}),
+            return_exceptions=True
+        )
+
+    first, second, third, fourth = asyncio.run(run())
+    assert (first, third) == ("first", "third")
+    assert isinstance(second, TooManyRequestsError) and second.method == "wall.get"
+    assert isinstance(fourth, RateLimitError) and fourth.method == "groups.get"
+
+
+def test_execute_failure_reaches_every_caller():
+    send = ScriptedExecute(TooManyRequestsError("execute", {}, {"error_code": 6}))
+    batcher = ExecuteBatcher(send)
+
+    async def run():
+        return await asyncio.gather(
+            batcher.call("wall.get", {"owner_id": 1}),
+            batcher.call("wall.get", {"owner_id": 2}),
+            return_exceptions=True
+        )
+
+    assert all(isinstance(result, TooManyRequestsError) for result in asyncio.run(run()))
+
+
+def test_missing_result_without_error_fails_the_call():
+    batcher = ExecuteBatcher(ScriptedExecute({"response": ["only"]}))
+
+    async def run():
+        return await asyncio.gather(
+            batcher.call("wall.get", {"owner_id": 1}),
+            batcher.call("wall.get", {"owner_id": 2}),
+            return_exceptions=True
+        )
+
+    first, second = asyncio.run(run())
+    assert first == "only"
+    assert isinstance(second, ApiError)
@@ -0,0 +1,168 @@
+import asyncio
+from urllib.parse import parse_qs
+
+import httpx
+import pytest
+
+from vk_client import (
+    VK_API_URL, AuthorizationError, HttpTransport, RateLimitError,
+    TooManyRequestsError, VKClient
+)
+from vk_pool import TOKEN_OWNER, TOKEN_SERVICE, TOKEN_USER, NoTokenAvailableError, VKClientPool
+
+
+class FakeVkApi:
+    """Сервер VK API на httpx.MockTransport
+
+    errors: токен -> код ошибки, который возвращают все его вызовы,
+    кроме проверки токена (users.get). Запросы записываются как (токен, метод).
+    """
+
+    def __init__(self, errors=None):
+        self.errors = dict(errors or {})
+        self.requests = []
+
+    def handler(self, request):
+        method = request.url.path.rsplit("/", 1)[-1]
+        data = {key: values[0] for key, values in parse_qs(request.content.decode()).items()}
+        token = data["access_token"]
+        if method == "users.get":
+            return httpx.Response(200, json={"response": [{"id": 1}]})
+        self.requests.append((token, method))
+        if token in self.errors:
+            code = self.errors[token]
+            return httpx.Response(200, json={"error": {"error_code": code, "error_msg": f"error {code}"}})
+        return httpx.Response(200, json={"response": {"token": token, "method": method}})
+
+    def transport(self):
+        client = httpx.AsyncClient(base_url=VK_API_URL, transport=httpx.MockTransport(self.handler))
+        return HttpTransport(client=client)
+
+
+async def make_pool(api, tokens, cooldown=60):
+    pool = VKClientPool(rate=100, cooldown=cooldown, transport=api.transport())
+    for token, kind in tokens:
+        await pool.add_token(token, kind)
+    return pool
+
+
+@pytest.mark.parametrize("code, error_class", [
+    (5, AuthorizationError),
+    (6, TooManyRequestsError),
+    (29, RateLimitError),
+])
+def test_error_codes_map_to_exceptions(code, error_class):
+    api = FakeVkApi({"token": code})
+
+    async def run():
+        client = VKClient("token", transport=api.transport())
+        try:
+            await client.call("wall.get", owner_id=1)
+        finally:
+            await client.close()
+
+    with pytest.raises(error_class) as info:
+        asyncio.run(run())
+    assert info.value.code == code
+    # Токен не попадает в параметры исключения (и в логи)
+    assert "access_token" not in info.value.params
+
+
+@pytest.mark.parametrize("code", [5, 29])
+def test_failed_token_cools_down_and_request_fails_over(code):
+    api = FakeVkApi({"bad1": code})
+
+    async def run():
+        pool = await make_pool(api, [("bad1", TOKEN_USER), ("good", TOKEN_USER)])
+        # Плохой токен выбирается первым: у него больше оставшихся запросов
+        pool.tokens[1].limiter.try_acquire()
+        try:
+            first = await pool.call("wall.get", owner_id=1)
+            second = await pool.call("wall.get", owner_id=2)
+        finally:
+            await pool.close()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["token"] == second["token"] == "good"
+    # После ошибки токен исключен и больше не получает запросы
+    assert api.requests == [("bad1", "wall.get"), ("good", "wall.get"), ("good", "wall.get")]
+
+
+def test_too_many_requests_pauses_only_that_token():
+    api = FakeVkApi({"busy": 6})
+
+    async def run():
+        pool = await make_pool(api, [("busy", TOKEN_USER), ("good", TOKEN_USER)])
+        pool.tokens[1].limiter.try_acquire()
+        try:
+            with pytest.raises(TooManyRequestsError):
+                await pool.call("wall.get", owner_id=1)
+            result = await pool.call("wall.get", owner_id=1)
+        finally:
+            await pool.close()
+        return result
+
+    assert asyncio.run(run())["token"] == "good"
+
+
+def test_all_tokens_failed_raises_last_error():
+    api = FakeVkApi({"bad": 5})
+
+    async def run():
+        pool = await make_pool(api, [("bad", TOKEN_USER)])
+        try:
+            with pytest.raises(AuthorizationError):
+                await pool.call("wall.get", owner_id=1)
+            # Пока идет cooldown, подходящих токенов нет
+            with pytest.raises(NoTokenAvailableError):
+                await pool.call("wall.get", owner_id=1)
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
+
+
+def test_capability_routing():
+    api = FakeVkApi()
+
+    async def run():
+        pool = await make_pool(api, [("service", TOKEN_SERVICE), ("user", TOKEN_USER), ("owner", TOKEN_OWNER)])
+        # Сервисный ключ выбирается для всех методов, которые он может вызвать
+        pool.tokens[1].limiter.try_acquire()
+        pool.tokens[2].limiter.try_acquire()
+        try:
+            return {
+                method: (await pool.call(method, **params))["token"]
+                for method, params in (
+                    ("wall.get", {"owner_id": 1}),
+                    ("groups.get", {"user_id": 1}),
+                    ("newsfeed.get", {"filters": "post"}),
+                    ("friends.get", {}),
+                )
+            }
+        finally:
+            await pool.close()
+
+    assert asyncio.run(run()) == {
+        "wall.get": "service",
+        "groups.get": "user",
+        "newsfeed.get": "owner",
+        "friends.get": "owner",
+    }
+
+
+def test_service_token_cannot_serve_user_methods():
+    api = FakeVkApi()
+
+    async def run():
+        pool = await make_pool(api, [("service", TOKEN_SERVICE)])
+        try:
+            with pytest.raises(NoTokenAvailableError):
+                await pool.call("groups.get", user_id=1)
+            return await pool.call("wall.get", owner_id=1)
+        finally:
+            await pool.close()
+
+    assert asyncio.run(run())["token"] == "service"
+    assert api.requests == [("service", "wall.get")]
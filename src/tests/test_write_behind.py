@@ -0,0 +1,33 @@
+import asyncio
+
+import pytest
+
+from status_cache import StatusCache
+
+
+def test_failed_flush_keeps_changes(temp_db, monkeypatch):
+    cache = StatusCache(flush_interval=3600)
+    cache.update(1, 1, 100)
+
+    async def broken(rows):
+        raise RuntimeError("база недоступна")
+
+    monkeypatch.setattr(temp_db, "upsert_user_statuses", broken)
+    with pytest.raises(RuntimeError):
+        asyncio.run(cache.flush())
+    assert cache._dirty == {1}
+
+
+def test_stop_writes_remaining_changes(temp_db):
+    async def run():
+        await temp_db.init_db()
+        try:
+            cache = StatusCache(flush_interval=3600)
+            cache.start()
+            cache.update(1, 1, 100)
+            await cache.stop()
+            return await temp_db.get_all_user_statuses()
+        finally:
+            await temp_db.close_pool()
+
+    assert asyncio.run(run()) == {1: {"online": 1, "last_seen": 100}}
@@ -0,0 +1,107 @@
+import logging
+import httpx
+from config import VK_HTTP_MAX_CONNECTIONS
+
+logger = logging.getLogger(__name__)
+
+VK_API_URL = "https://api.vk.com/method/"
+VK_API_VERSION = "5.131"
+
+class ApiError(Exception):
+    """Ошибка, возвращенная VK API"""
+
+    def __init__(self, method, params, error):
+        super().__init__()
+        self.method = method
+        # Токен не должен попадать в логи вместе с параметрами запроса
+        self.params = {key: value for key, value in (params or {}).items() if key != "access_token"}
+        self.error = error
+        self.code = error.get("error_code", 0)
+        self.message = error.get("error_msg", "")
+
+    def __str__(self):
+        return f"[{self.code}] {self.message}"
+
+    @staticmethod
+    def from_error(method, params, error):
+        """Создание исключения подходящего класса по коду ошибки"""
+        error_class = ERROR_CLASSES.get(error.get("error_code"), ApiError)
+        return error_class(method, params, error)
+
+class AuthorizationError(ApiError):
+    """Код 5: ошибка авторизации (токен недействителен или отозван)"""
+
+class TooManyRequestsError(ApiError):
+    """Код 6: слишком много запросов в секунду"""
+
+class FloodControlError(ApiError):
+    """Код 9: слишком много однотипных действий"""
+
+class RateLimitError(ApiError):
+    """Код 29: достигнут количественный лимит на вызов метода"""
+
+ERROR_CLASSES = {
+    5: AuthorizationError,
+    6: TooManyRequestsError,
+    9: FloodControlError,
+    29: RateLimitError,
+}
+
+class HttpTransport:
+    """HTTP-транспорт с пулом keep-alive соединений
+
+    HTTP-клиент можно подменить, например httpx.AsyncClient с
+    httpx.MockTransport для тестов.
+    """
+
+    def __init__(self, base_url=VK_API_URL, max_connections=VK_HTTP_MAX_CONNECTIONS, timeout=30, client=None):
+        self.client = client or httpx.AsyncClient(
+            base_url=base_url,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+            timeout=timeout
+        )
+
+    async def post(self, method, data):
+        """POST-запрос к методу API; возвращает разобранный JSON"""
+        response = await self.client.post(method, data=data)
+        response.raise_for_status()
+        return response.json()
+
+    async def close(self):
+        await self.client.aclose()
+
+class VKClient:
+    """Асинхронный клиент VK API
+
+    Транспорт можно подменить: достаточно объекта с корутинами
+    post(method, data) и close(), например HttpTransport с адресом
+    локального тестового сервера.
+    """
+
+    def __init__(self, token, version=VK_API_VERSION, transport=None):
+        self.token = token
+        self.version = version
+        self.transport = transport or HttpTransport()
+
+    async def call_raw(self, method, params=None):
+        """Вызов метода API; возвращает полный ответ (нужно для execute_errors)"""
+        data = {key: value for key, value in (params or {}).items() if value is not None}
+        data.setdefault("v", self.version)
+        data["access_token"] = self.token
+
+        result = await self.transport.post(method, data)
+        if "error" in result:
+            raise ApiError.from_error(method, data, result["error"])
+        return result
+
+    async def call(self, method, **params):
+        """Вызов метода API; возвращает содержимое поля response"""
+        result = await self.call_raw(method, params)
+        return result.get("response")
+
+    async def close(self):
+        """Закрытие HTTP-соединений"""
+        await self.transport.close()
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import logging
+from vk_client import ApiError
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество вызовов API внутри одного execute (ограничение VK)
+EXECUTE_MAX_CALLS = 25
+
+class ExecuteBatcher:
+    """Объединение отдельных вызовов VK API в запросы execute
+
+    Вызовы, поступившие в течение короткого окна (или до набора 25 штук),
+    упаковываются в один код VKScript. Результаты раздаются ожидающим
+    корутинам в том же порядке, в котором были сделаны вызовы.
+
+    Вызовы с разным ключом group(method, params) (например, с разными
+    требованиями к токену) упаковываются в разные запросы execute, чтобы
+    вызов, для которого нет подходящего токена, не мешал остальным.
+    """
+
+    def __init__(self, send, max_calls=EXECUTE_MAX_CALLS, delay=0.05, group=None):
+        # send(code) - корутина, выполняющая execute и возвращающая полный ответ VK
+        self.send = send
+        self.max_calls = min(max_calls, EXECUTE_MAX_CALLS)
+        self.delay = delay
+        self.group = group
+        # Ключ группы -> список ожидающих вызовов (method, params, future)
+        self._pending = {}
+        self._flush_handle = None
+        self._tasks = set()
+
+    async def call(self, method, params):
+        """Постановка вызова в очередь и ожидание его результата"""
+        future = asyncio.get_running_loop().create_future()
+        key = self.group(method, params) if self.group else None
+        pending = self._pending.setdefault(key, [])
+        pending.append((method, params, future))
+
+        if len(pending) >= self.max_calls:
+            self._flush_group(key)
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.delay, self._flush_now)
+
+        return await future
+
+    def _flush_now(self):
+        """Отправка накопленных вызовов всех групп"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        for key in list(self._pending):
+            self._flush_group(key)
+
+    def _flush_group(self, key):
+        """Отправка накопленных вызовов одной группы"""
+        calls = self._pending.pop(key, [])
+        for i in range(0, len(calls), self.max_calls):
+            task = asyncio.create_task(self._execute(calls[i:i + self.max_calls]))
+            # Храним ссылку на задачу до ее завершения
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    @staticmethod
+    def _build_code(calls):
+        """Формирование кода VKScript для группы вызовов"""
+        parts = []
+        for method, params, _ in calls:
+            # Версия API задается для всего execute, пустые параметры не передаются
+            args = {key: value for key, value in params.items() if key != "v" and value is not None}
+            parts.append(f"API.{method}({json.dumps(args, ensure_ascii=False)})")
+        return f"return [{', '.join(parts)}];"
+
+    async def _execute(self, calls):
+        """Выполнение execute и раздача результатов"""
+        try:
+            raw = await self.send(self._build_code(calls))
+        except Exception as e:
+            for _, _, future in calls:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        results = raw.get("response") or []
+        # Ошибки отдельных вызовов перечислены в execute_errors в порядке их возникновения
+        errors = list(raw.get("execute_errors", []))
+
+        for index, (method, params, future) in enumerate(calls):
+            if future.done():
+                continue
+
+            result = results[index] if index < len(results) else False
+            if result is False:
+                error = errors.pop(0) if errors else {"error_code": 0, "error_msg": "execute call failed"}
+                future.set_exception(ApiError.from_error(method, params, error))
+            else:
+                future.set_result(result)
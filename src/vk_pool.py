@@ -0,0 +1,172 @@
+import logging
+import re
+import time
+from config import VK_REQUESTS_PER_SECOND, VK_TOKEN_COOLDOWN
+from rate_limiter import TokenBucket
+from vk_client import (
+    VKClient, HttpTransport, ApiError, AuthorizationError,
+    TooManyRequestsError, RateLimitError
+)
+
+logger = logging.getLogger(__name__)
+
+# Виды токенов: владелец основного пользовательского токена, другой пользователь, сервисный ключ
+TOKEN_OWNER = "owner"
+TOKEN_USER = "user"
+TOKEN_SERVICE = "service"
+
+# Методы, которые нельзя вызвать с сервисным ключом
+USER_TOKEN_METHODS = {"groups.get"}
+
+# Методы, результат которых относится к владельцу токена (лента, сообщения)
+OWNER_METHOD_PREFIXES = ("newsfeed.", "messages.")
+
+# Требования к токену и подходящие виды токенов
+CAPABILITIES = {
+    "any": (TOKEN_OWNER, TOKEN_USER, TOKEN_SERVICE),
+    "user": (TOKEN_OWNER, TOKEN_USER),
+    "owner": (TOKEN_OWNER,),
+}
+
+class NoTokenAvailableError(Exception):
+    """Нет токена, подходящего для запроса (все исключены или не обладают нужными правами)"""
+
+class PooledToken:
+    """Токен пула со своим ограничителем частоты запросов"""
+
+    def __init__(self, kind, client, rate):
+        self.kind = kind
+        self.client = client
+        self.limiter = TokenBucket(rate)
+        self.waiting = 0
+        self.cooldown_until = 0.0
+        # Для логов используется только конец токена
+        self.name = f"{kind}:...{client.token[-4:]}"
+
+    def is_available(self):
+        return time.monotonic() >= self.cooldown_until
+
+    def score(self):
+        """Оставшийся бюджет запросов с учетом уже ожидающих вызовов"""
+        return self.limiter.available() - self.waiting
+
+class VKClientPool:
+    """Пул клиентов VK API с несколькими токенами
+
+    Каждый запрос направляется токену, у которого есть нужные права
+    (лента и сообщения - только владельцу основного пользовательского
+    токена, groups.get - любому пользовательскому) и больше всего
+    оставшихся запросов. Токен, получивший ошибку авторизации (5) или
+    лимита (29), исключается на cooldown секунд, а запрос повторяется
+    с другим подходящим токеном. Пропускная способность растет
+    пропорционально числу токенов.
+    """
+
+    def __init__(self, rate=VK_REQUESTS_PER_SECOND, cooldown=VK_TOKEN_COOLDOWN, transport=None):
+        self.rate = rate
+        self.cooldown = cooldown
+        # Все клиенты используют общий пул HTTP-соединений
+        self.transport = transport or HttpTransport()
+        self.tokens = []
+
+    def __len__(self):
+        return len(self.tokens)
+
+    async def add_token(self, token, kind=None):
+        """Проверка токена и добавление его в пул
+
+        Если kind не задан, вид токена определяется запросом users.get без
+        параметров: пользовательский токен возвращает своего владельца.
+        Возвращает вид токена или None, если токен недействителен.
+        """
+        client = VKClient(token, transport=self.transport)
+        try:
+            if kind == TOKEN_SERVICE:
+                await client.call("users.get", user_ids=1)
+            else:
+                users = await client.call("users.get")
+                if kind is None:
+                    kind = TOKEN_USER if users else TOKEN_SERVICE
+        except AuthorizationError as e:
+            logger.error(f"Токен ...{token[-4:]} недействителен: {e}")
+            return None
+        except ApiError:
+            if kind is not None:
+                raise
+            # Сервисный ключ не может вызвать users.get без указания пользователя
+            kind = TOKEN_SERVICE
+
+        self.tokens.append(PooledToken(kind, client, self.rate))
+        logger.info(f"Токен VK добавлен в пул: {self.tokens[-1].name}")
+        return kind
+
+    @staticmethod
+    def required_capability(method, params):
+        """Требование к токену для вызова метода"""
+        if method == "execute":
+            # Требование execute - самое строгое среди вызываемых внутри методов
+            # (внутри execute методы вызываются для конкретных пользователей)
+            methods = re.findall(r"API\.([\w.]+)\(", (params or {}).get("code", ""))
+            required = [VKClientPool.required_capability(name, {"user_id": None}) for name in methods]
+            for capability in ("owner", "user"):
+                if capability in required:
+                    return capability
+            return "any"
+        if method.startswith(OWNER_METHOD_PREFIXES):
+            return "owner"
+        # Список друзей без user_id - это друзья владельца токена
+        if method == "friends.get" and "user_id" not in (params or {}):
+            return "owner"
+        if method in USER_TOKEN_METHODS:
+            return "user"
+        return "any"
+
+    def _select(self, capability, exclude):
+        """Выбор подходящего токена с наибольшим оставшимся бюджетом"""
+        kinds = CAPABILITIES[capability]
+        candidates = [
+            token for token in self.tokens
+            if token.kind in kinds and token not in exclude and token.is_available()
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=PooledToken.score)
+
+    async def call_raw(self, method, params=None):
+        """Вызов метода API через подходящий токен; возвращает полный ответ"""
+        capability = self.required_capability(method, params)
+        tried = []
+        last_error = None
+        while True:
+            token = self._select(capability, tried)
+            if token is None:
+                if last_error:
+                    raise last_error
+                raise NoTokenAvailableError(f"Нет доступного токена для {method} (требуется: {capability})")
+
+            token.waiting += 1
+            try:
+                await token.limiter.acquire()
+            finally:
+                token.waiting -= 1
+
+            try:
+                return await token.client.call_raw(method, params)
+            except TooManyRequestsError:
+                # Превышена частота запросов: приостанавливаем только этот токен
+                token.limiter.pause(10)
+                raise
+            except (AuthorizationError, RateLimitError) as e:
+                token.cooldown_until = time.monotonic() + self.cooldown
+                logger.warning(f"Токен {token.name} исключен на {self.cooldown} с: {e}")
+                tried.append(token)
+                last_error = e
+
+    async def call(self, method, **params):
+        """Вызов метода API; возвращает содержимое поля response"""
+        result = await self.call_raw(method, params)
+        return result.get("response")
+
+    async def close(self):
+        """Закрытие HTTP-соединений"""
+        await self.transport.close()
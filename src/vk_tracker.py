@@ -2,69 +2,224 @@ import asyncio
 import logging
 import os
 import time
+from typing import NamedTuple
 import vk_api
-from vk_api.exceptions import ApiError, AuthError
+from vk_api.exceptions import AuthError
 from config import (
     VK_LOGIN, VK_PASSWORD, VK_SERVICE_TOKEN, VK_APP_ID,
-    VK_CLIENT_SECRET, POLLING_INTERVAL, format_time, ADMIN_CHAT_ID
+    VK_CLIENT_SECRET, POLLING_INTERVAL, format_time, ADMIN_CHAT_ID,
+    VK_EXTRA_TOKENS, VK_MAX_INFLIGHT_BATCHES, ACTIVITY_INTERVAL,
+    ACTIVITY_CONCURRENCY, NEWSFEED_PAGES, NOTIFICATION_FANOUT, VK_REQUESTS_PER_MINUTE,
+    STATUS_MIN_INTERVAL, STATUS_MAX_INTERVAL, ACTIVITY_MIN_INTERVAL, ACTIVITY_MAX_INTERVAL,
+    VK_LONGPOLL, TRACKER_WORKERS, VK_REQUESTS_PER_SECOND, ROUTES_REFRESH_INTERVAL
 )
+from compaction import DatabaseCompactor
 from database import Database
+from delivery import DeliveryQueue
+from digest import NotificationCoalescer
+from longpoll import LongPollSource
+from outbox import OutboxDispatcher
+from rate_limiter import TokenBucket
+from vk_client import (
+    ApiError, AuthorizationError, TooManyRequestsError,
+    FloodControlError, RateLimitError
+)
+from vk_execute import ExecuteBatcher
+from vk_pool import VKClientPool, TOKEN_OWNER, TOKEN_SERVICE
+from profile_cache import ProfileCache
+from request_cache import CycleRequestCache
+from routing import SubscriptionRouter
+from scheduler import AdaptiveScheduler
+from status_cache import StatusCache
+from worker_pool import ActivityWorkerPool
 
 logger = logging.getLogger(__name__)
 
 # Получаем пользовательский токен из переменных окружения
 VK_USER_TOKEN = os.getenv("VK_USER_TOKEN", "")
 
+# Роли процесса: все сразу, только бот (команды и доставка) или только опрос VK
+ROLE_ALL = "all"
+ROLE_FRONTEND = "frontend"
+ROLE_WORKER = "worker"
+
+# Количество процессов, одновременно использующих токены VK (бот и обработчики)
+VK_PROCESSES = TRACKER_WORKERS + 1 if TRACKER_WORKERS > 0 else 1
+
+# Типы событий outbox и параметры отслеживания, к которым они относятся
+# (None - уведомление получают все подписчики)
+EVENT_TRACKING = {
+    "status": None,
+    "friends_added": "track_friends",
+    "friends_removed": "track_friends",
+    "groups_joined": "track_groups",
+    "groups_left": "track_groups",
+    "posts": "track_posts",
+    "likes": "track_likes",
+    "comments": "track_comments",
+}
+
+class Notification(NamedTuple):
+    """Готовое уведомление, общее для всех подписчиков"""
+    text: str
+    disable_preview: bool = False
+
 class VKTracker:
-    """Класс для отслеживания онлайн-статуса пользователей VK"""
+    """Класс для отслеживания онлайн-статуса пользователей VK
 
-    def __init__(self, bot):
+    В роли ROLE_FRONTEND выполняется только доставка уведомлений из outbox,
+    в роли ROLE_WORKER - только опрос VK API для VK ID своей части кольца
+    (shard); уведомления при этом передаются боту через outbox.
+    """
+
+    def __init__(self, bot, role=ROLE_ALL, shard=None):
         self.bot = bot
-        self.vk_session = None
-        self.vk = None
+        self.role = role
+        self.shard = shard  # ShardCoordinator процесса-обработчика
+        self.vk_pool = None  # Пул клиентов VK API (все доступные токены)
         self.tracking_task = None
         self.activity_tracking_task = None  # Задача для отслеживания активности
+        self.delivery = DeliveryQueue(bot)  # Очередь отправки уведомлений в Telegram
+        self.notifier = NotificationCoalescer(self.delivery)  # Объединение уведомлений в сводки
+        self.outbox = OutboxDispatcher(self._deliver_event)  # Доставка событий из outbox
+        self.status_cache = StatusCache()  # Последние известные онлайн-статусы
+        self.profile_cache = ProfileCache()  # Имена пользователей и групп для уведомлений
+        # Объединение вызовов в execute; вызовы с разными требованиями к токену
+        # не смешиваются, чтобы groups.get не требовал пользовательский токен для всего пакета
+        self.vk_batcher = ExecuteBatcher(self._vk_execute, group=VKClientPool.required_capability)
+        # Пул обработчиков проверок активности
+        self.activity_pool = ActivityWorkerPool(self._process_activity_check, ACTIVITY_CONCURRENCY)
+        self.request_cache = CycleRequestCache()  # Общие ответы API в пределах цикла активности
+        self.router = SubscriptionRouter()  # Подписки и настройки в памяти: кому что отправлять
+        self.compactor = DatabaseCompactor()  # Очистка истории и сжатие файла базы данных
+        # Бюджет запросов в минуту, общий для опроса статусов и проверок активности
+        self.vk_budget = TokenBucket(VK_REQUESTS_PER_MINUTE / 60, VK_REQUESTS_PER_MINUTE)
+        # Планировщики с индивидуальным интервалом для каждого пользователя (и типа проверки)
+        self.status_scheduler = AdaptiveScheduler(POLLING_INTERVAL, STATUS_MIN_INTERVAL, STATUS_MAX_INTERVAL)
+        self.activity_scheduler = AdaptiveScheduler(ACTIVITY_INTERVAL, ACTIVITY_MIN_INTERVAL, ACTIVITY_MAX_INTERVAL)
+        self._newsfeed_snapshot = None  # Задача загрузки индекса лайков из ленты
+        self._newsfeed_loaded_at = 0
+        # Источник событий онлайн-статуса через Long Poll (только с пользовательским токеном)
+        self.longpoll = None
+        if VK_LONGPOLL and VK_USER_TOKEN and role != ROLE_FRONTEND:
+            state_name = f"longpoll:{shard.worker_id}" if shard else "longpoll"
+            self.longpoll = LongPollSource(self._vk_call, self._on_longpoll_status, state_name=state_name)
+        self._status_ids = set()  # VK ID, статус которых отслеживается
         self.is_running = False
 
+    async def _refresh_routes(self):
+        """Обновление таблицы маршрутизации в процессе-обработчике
+
+        Команды бота выполняются в другом процессе, поэтому обработчик
+        перечитывает подписки одним запросом не чаще ROUTES_REFRESH_INTERVAL
+        секунд (загрузка общая для обоих циклов). В процессе бота таблица
+        обновляется командами напрямую.
+        """
+        if self.role == ROLE_WORKER:
+            await self.router.refresh(ROUTES_REFRESH_INTERVAL)
+
+    def _own(self, vk_ids):
+        """VK ID, которые обрабатывает этот процесс"""
+        return self.shard.filter(vk_ids) if self.shard else list(vk_ids)
+
     async def send_notification(self, chat_id, message, disable_preview=False):
-        """Вспомогательный метод для отправки уведомлений с корректным отображением ссылок"""
-        max_retries = 3
-        retry_delay = 5
+        """Постановка уведомления в очередь отправки (сама отправка выполняется в фоне)"""
+        return await self.notifier.submit(chat_id, message, disable_preview)
 
-        for attempt in range(max_retries):
-            try:
-                await self.bot.send_message(
-                    chat_id=chat_id,
-                    text=message,
-                    disable_web_page_preview=disable_preview,
-                    parse_mode=None  # Используем plain text для корректного отображения ссылок
-                )
-                return  # Если успешно отправлено, выходим
-            except Exception as e:
-                if "Flood control" in str(e) and attempt < max_retries - 1:
-                    # Извлекаем время ожидания из сообщения об ошибке
-                    try:
-                        # Пробуем извлечь число секунд из сообщения "Retry in X seconds"
-                        retry_seconds = int(str(e).split("Retry in ")[1].split(" ")[0])
-                    except:
-                        retry_seconds = retry_delay
-
-                    logger.warning(f"Превышен лимит отправки сообщений. Повторная попытка через {retry_seconds} секунд")
-                    await asyncio.sleep(retry_seconds)
-                else:
-                    logger.error(f"Ошибка при отправке уведомления пользователю {chat_id}: {e}")
-                    if attempt == max_retries - 1:
-                        # Если это последняя попытка, пытаемся отправить упрощенное сообщение
-                        try:
-                            simple_message = f"Уведомление о пользователе VK (ошибка отображения полного сообщения)"
-                            await self.bot.send_message(
-                                chat_id=chat_id,
-                                text=simple_message
-                            )
-                            logger.info(f"Отправлено упрощенное уведомление пользователю {chat_id}")
-                        except Exception as simple_err:
-                            logger.error(f"Не удалось отправить даже упрощенное уведомление: {simple_err}")
-                    break
+    async def _broadcast(self, subscribers, notifications):
+        """Рассылка готовых уведомлений всем подписчикам
+
+        Уведомления формируются один раз до рассылки. Чаты обрабатываются
+        параллельно (не более NOTIFICATION_FANOUT одновременно), а внутри
+        одного чата уведомления ставятся в очередь по порядку. Возвращает
+        словарь chat_id -> список future с результатами доставки (None,
+        если поставить уведомления в очередь не удалось).
+        """
+        if not notifications:
+            return {}
+        semaphore = asyncio.Semaphore(NOTIFICATION_FANOUT)
+
+        async def submit(chat_id):
+            async with semaphore:
+                return [
+                    await self.send_notification(chat_id, notification.text, notification.disable_preview)
+                    for notification in notifications
+                ]
+
+        results = await asyncio.gather(*(submit(chat_id) for chat_id in subscribers), return_exceptions=True)
+        deliveries = {}
+        for chat_id, result in zip(subscribers, results):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка при постановке уведомлений в очередь для чата {chat_id}: {result}")
+                result = None
+            deliveries[chat_id] = result
+        return deliveries
+
+    async def _deliver_event(self, event):
+        """Формирование и рассылка уведомлений о событии из outbox
+
+        Возвращает список chat_id, в которые уведомления доставить не удалось.
+        """
+        subscribers = self.router.subscribers(event.vk_id, EVENT_TRACKING[event.event_type])
+        if event.chat_ids is not None:
+            # Повторная доставка - только в чаты, не получившие уведомление ранее
+            retry_chats = set(event.chat_ids)
+            subscribers = [chat_id for chat_id in subscribers if chat_id in retry_chats]
+        if not subscribers:
+            return []
+
+        render = {
+            "status": self._render_status_notifications,
+            "friends_added": self._render_new_friends_notifications,
+            "friends_removed": self._render_removed_friends_notifications,
+            "groups_joined": self._render_new_groups_notifications,
+            "groups_left": self._render_left_groups_notifications,
+            "posts": self._render_new_posts_notifications,
+            "likes": self._render_new_likes_notifications,
+            "comments": self._render_new_comments_notifications,
+        }[event.event_type]
+        notifications = await render(event.vk_id, event.items)
+
+        deliveries = await self._broadcast(subscribers, notifications)
+        failed_chats = []
+        for chat_id, futures in deliveries.items():
+            if futures is None:
+                failed_chats.append(chat_id)
+            elif self.notifier.get_mode(chat_id) != "immediate":
+                # Уведомления приняты в сводку: событие считается доставленным в этот чат,
+                # не дожидаясь отправки сводки (до часа), иначе ожидающие сводки
+                # занимают все места OUTBOX_MAX_INFLIGHT и задерживают остальные события
+                continue
+            elif not all(await asyncio.gather(*futures)):
+                failed_chats.append(chat_id)
+        return failed_chats
+
+    async def _vk_call(self, method, **params):
+        """Вызов метода VK API через подходящий токен пула с учетом его лимита запросов"""
+        return await self.vk_pool.call(method, **params)
+
+    async def _vk_execute(self, code):
+        """Выполнение кода VKScript; возвращает полный ответ вместе с execute_errors"""
+        return await self.vk_pool.call_raw("execute", {"code": code, "v": "5.131"})
+
+    async def _vk_batched(self, method, **params):
+        """Вызов метода VK API в составе общего запроса execute"""
+        return await self.vk_batcher.call(method, params)
+
+    async def _vk_cached(self, method, **params):
+        """Вызов метода VK API с повторным использованием ответа в пределах цикла активности"""
+        return await self.request_cache.get(
+            method, params, lambda: self._vk_batched(method, **params)
+        )
+
+    async def _get_wall(self, vk_id):
+        """Последние записи со стены пользователя (один запрос на цикл для всех проверок)"""
+        return await self._vk_cached(
+            "wall.get",
+            owner_id=vk_id,
+            count=20,  # Ограничиваем количество проверяемых постов
+            v="5.131"
+        )
 
     async def resolve_username(self, username):
         """Преобразование короткого имени пользователя VK в числовой ID
@@ -75,7 +230,7 @@ class VKTracker:
         Возвращает:
             int: Числовой ID пользователя VK или None в случае ошибки
         """
-        if not self.vk:
+        if not self.vk_pool:
             if not await self.authenticate():
                 return None
 
@@ -92,8 +247,8 @@ class VKTracker:
 
             # Делаем запрос к API
             logger.info(f"Резолвинг короткого имени: {username}")
-            result = await asyncio.to_thread(
-                self.vk.users.get,
+            result = await self._vk_call(
+                "users.get",
                 user_ids=username,
                 v="5.131"
             )
@@ -109,61 +264,70 @@ class VKTracker:
             return None
 
     async def authenticate(self):
-        """Аутентификация в VK API"""
+        """Аутентификация в VK API: создание пула клиентов из всех доступных токенов"""
+        # Лимиты токенов делятся между всеми процессами, использующими их одновременно
+        pool = VKClientPool(rate=VK_REQUESTS_PER_SECOND / VK_PROCESSES)
         try:
-            # Пробуем сначала пользовательский токен (имеет больше всего прав)
+            # Пользовательский токен (имеет больше всего прав)
             if VK_USER_TOKEN:
                 logger.info("Авторизация через пользовательский токен")
-                self.vk_session = await asyncio.to_thread(
-                    vk_api.VkApi, token=VK_USER_TOKEN
-                )
-            # Потом пробуем сервисный токен
-            elif VK_SERVICE_TOKEN:
+                await pool.add_token(VK_USER_TOKEN, TOKEN_OWNER)
+            # Сервисный токен
+            if VK_SERVICE_TOKEN:
                 logger.info("Авторизация через service token")
-                self.vk_session = await asyncio.to_thread(
-                    vk_api.VkApi, token=VK_SERVICE_TOKEN
-                )
+                await pool.add_token(VK_SERVICE_TOKEN, TOKEN_SERVICE)
+            # Дополнительные токены (вид определяется автоматически)
+            for token in VK_EXTRA_TOKENS:
+                await pool.add_token(token)
+
             # Если нет токенов, используем логин/пароль
-            elif VK_LOGIN and VK_PASSWORD:
+            if not VK_USER_TOKEN and not VK_SERVICE_TOKEN and not VK_EXTRA_TOKENS and VK_LOGIN and VK_PASSWORD:
                 logger.info("Авторизация через логин/пароль")
-                # Используем асинхронный запуск синхронной функции vk_api
+                # vk_api используется только для получения токена по логину и паролю
                 # Используем Kate Mobile app_id для расширенных прав
-                self.vk_session = await asyncio.to_thread(
-                    vk_api.VkApi,
+                vk_session = vk_api.VkApi(
                     login=VK_LOGIN,
                     password=VK_PASSWORD,
                     app_id=2685278  # Kate Mobile app_id
                 )
                 # Авторизация
-                await asyncio.to_thread(self.vk_session.auth)
-            else:
-                logger.error("Не заданы параметры аутентификации VK API")
-                if ADMIN_CHAT_ID:
+                await asyncio.to_thread(vk_session.auth)
+                await pool.add_token(vk_session.token['access_token'], TOKEN_OWNER)
+
+            if not len(pool):
+                await pool.close()
+                logger.error("Не заданы параметры аутентификации VK API или все токены недействительны")
+                if ADMIN_CHAT_ID and self.bot:
                     await self.bot.send_message(
                         chat_id=ADMIN_CHAT_ID,
-                        text="❌ Ошибка: Не заданы параметры аутентификации VK API"
+                        text="❌ Ошибка: Не заданы параметры аутентификации VK API или все токены недействительны"
                     )
                 return False
 
-            self.vk = self.vk_session.get_api()
-            # Проверка работоспособности
-            await asyncio.to_thread(
-                self.vk.users.get
-            )
-            logger.info("Успешная авторизация в VK API")
+            # Заменяем пул, закрывая соединения предыдущего
+            old_pool, self.vk_pool = self.vk_pool, pool
+            if old_pool:
+                await old_pool.close()
+
+            # Бюджет планировщика растет пропорционально числу токенов
+            budget = VK_REQUESTS_PER_MINUTE * len(pool) / VK_PROCESSES
+            self.vk_budget = TokenBucket(budget / 60, budget)
+            logger.info(f"Успешная авторизация в VK API (токенов: {len(pool)})")
             return True
 
-        except AuthError as e:
+        except (AuthError, AuthorizationError) as e:
+            await pool.close()
             logger.error(f"Ошибка авторизации VK API: {e}")
-            if ADMIN_CHAT_ID:
+            if ADMIN_CHAT_ID and self.bot:
                 await self.bot.send_message(
                     chat_id=ADMIN_CHAT_ID,
                     text=f"❌ Ошибка авторизации VK API: {e}"
                 )
             return False
         except Exception as e:
+            await pool.close()
             logger.error(f"Непредвиденная ошибка при авторизации VK API: {e}")
-            if ADMIN_CHAT_ID:
+            if ADMIN_CHAT_ID and self.bot:
                 await self.bot.send_message(
                     chat_id=ADMIN_CHAT_ID,
                     text=f"❌ Непредвиденная ошибка при авторизации VK API: {e}"
@@ -179,7 +343,31 @@ class VKTracker:
         if not await self.authenticate():
             return
 
+        await self.profile_cache.load()
+        self.profile_cache.start()
+        await self.router.load()
+        logger.info(f"Загружено подписок в таблицу маршрутизации: {len(self.router)}")
+
+        if self.role != ROLE_WORKER:
+            self.delivery.start()
+            await self.notifier.load()
+            # Повторная отправка событий, не доставленных до предыдущей остановки
+            await self.outbox.start()
+            self.compactor.start()
+
         self.is_running = True
+        if self.role == ROLE_FRONTEND:
+            logger.info("Запущена доставка уведомлений (отслеживание выполняют процессы-обработчики)")
+            return
+
+        if self.shard:
+            await self.shard.start()
+        # Загрузка предыдущих статусов в память и запуск их фоновой записи
+        await self.status_cache.load()
+        self.status_cache.start()
+        if self.longpoll:
+            await self.longpoll.start()
+
         self.tracking_task = asyncio.create_task(self._track_online_status())
         self.activity_tracking_task = asyncio.create_task(self._track_user_activity())
         logger.info("Запущено отслеживание онлайн-статуса и активности пользователей VK")
@@ -204,6 +392,34 @@ class VKTracker:
             except asyncio.CancelledError:
                 pass
 
+        if self.longpoll:
+            await self.longpoll.stop()
+        if self.shard:
+            await self.shard.stop()
+
+        # Отправка накопленных сводок и оставшихся уведомлений
+        if self.role != ROLE_WORKER:
+            await self.compactor.stop()
+            self.outbox.close()
+            await self.notifier.stop()
+            await self.delivery.stop()
+            await self.outbox.wait_closed()
+
+        # Сохранение несохраненных статусов
+        try:
+            await self.status_cache.stop()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении кэша статусов: {e}")
+        try:
+            await self.profile_cache.stop()
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении кэша профилей: {e}")
+
+        # Закрытие HTTP-соединений с VK API
+        if self.vk_pool:
+            await self.vk_pool.close()
+            self.vk_pool = None
+
         logger.info("Остановлено отслеживание онлайн-статуса и активности пользователей VK")
 
     async def _track_online_status(self):
@@ -211,20 +427,36 @@ class VKTracker:
         while self.is_running:
             try:
                 # Получение списка отслеживаемых VK ID
-                vk_ids = await Database.get_all_tracked_vk_ids()
+                await self._refresh_routes()
+                vk_ids = self._own(self.router.vk_ids())
+
+                # Убираем из кэша пользователей, от которых все отписались
+                self.status_cache.retain(vk_ids)
+                self._status_ids = set(vk_ids)
+
+                # Пользователи, статус которых приходит через Long Poll, не опрашиваются
+                if self.longpoll:
+                    self.status_scheduler.sync(self._status_ids - self.longpoll.covered_ids())
+                else:
+                    self.status_scheduler.sync(vk_ids)
+
+                # Пользователи, которых пора опросить, группами по 100 ID (лимит VK API);
+                # каждая группа - один запрос из общего бюджета
+                batches = []
+                while self.status_scheduler.time_until_next() == 0 and self.vk_budget.try_acquire():
+                    batches.append(self.status_scheduler.pop_due(100))
 
-                if not vk_ids:
-                    # Если нет отслеживаемых пользователей, пропускаем цикл
-                    await asyncio.sleep(POLLING_INTERVAL)
-                    continue
+                # Группы обрабатываются параллельно с ограничением числа одновременных запросов
+                semaphore = asyncio.Semaphore(VK_MAX_INFLIGHT_BATCHES)
 
-                # Разбиваем список на группы по 100 ID (лимит VK API)
-                for i in range(0, len(vk_ids), 100):
-                    batch = vk_ids[i:i+100]
-                    await self._process_batch(batch)
+                async def process_limited(batch):
+                    async with semaphore:
+                        await self._process_batch(batch)
 
-                # Ожидание перед следующим опросом
-                await asyncio.sleep(POLLING_INTERVAL)
+                await asyncio.gather(*(process_limited(batch) for batch in batches))
+
+                # Ожидание до следующего опроса
+                await asyncio.sleep(self._scheduler_delay(self.status_scheduler, POLLING_INTERVAL))
 
             except asyncio.CancelledError:
                 break
@@ -234,215 +466,294 @@ class VKTracker:
 
     async def _process_batch(self, vk_ids):
         """Обработка группы VK ID (не более 100)"""
+        # VK ID -> изменился ли статус (None - статус получить не удалось)
+        changes = dict.fromkeys(vk_ids)
         try:
             # Запрос к VK API для получения статуса пользователей
             vk_ids_str = ','.join(map(str, vk_ids))
-            users_info = await asyncio.to_thread(
-                self.vk.users.get,
+            users_info = await self._vk_call(
+                "users.get",
                 user_ids=vk_ids_str,
-                fields="online,last_seen",
+                fields="first_name,last_name,online,last_seen",
                 v="5.131"
             )
 
-            # Обработка полученной информации
+            # Сравнение с предыдущим состоянием из кэша в памяти
             current_time = int(time.time())
             for user in users_info:
                 vk_id = user.get('id')
+
+                # Имена из этого же ответа пополняют кэш профилей для уведомлений
+                self.profile_cache.put_user(user)
                 online = user.get('online', 0)
                 last_seen = user.get('last_seen', {}).get('time', current_time) if not online else current_time
 
-                # Получение предыдущего статуса
-                prev_status = await Database.get_user_status(vk_id)
-
-                # Если статус изменился или это первый запрос
-                if not prev_status or prev_status['online'] != online:
-                    # Обновление статуса в базе данных
-                    await Database.update_user_status(vk_id, online, last_seen)
-
-                    # Если это не первый запрос, отправляем уведомления
-                    if prev_status:
-                        await self._send_status_change_notifications(vk_id, online, last_seen)
+                changes[vk_id] = await self._apply_status(vk_id, online, last_seen)
 
+        except TooManyRequestsError:
+            logger.warning("Слишком много запросов к VK API. Запросы с этим токеном приостановлены на 10 секунд.")
+        except AuthorizationError as e:
+            logger.error(f"Ошибка авторизации VK API: {e}")
+            if ADMIN_CHAT_ID and self.bot:
+                await self.bot.send_message(
+                    chat_id=ADMIN_CHAT_ID,
+                    text=f"❌ Ошибка авторизации VK API: {e}"
+                )
+            # Переавторизация не нужна: пул уже исключил токен на VK_TOKEN_COOLDOWN секунд,
+            # а запросы выполняются остальными подходящими токенами
+        except (FloodControlError, RateLimitError) as e:
+            logger.warning(f"Достигнут лимит VK API при запросе статусов: {e}")
         except ApiError as e:
-            if e.code == 6:  # Too many requests
-                logger.warning("Слишком много запросов к VK API. Ожидание 10 секунд.")
-                await asyncio.sleep(10)
-            elif e.code == 5:  # User authorization failed
-                logger.error(f"Ошибка авторизации VK API: {e}")
-                if ADMIN_CHAT_ID:
-                    await self.bot.send_message(
-                        chat_id=ADMIN_CHAT_ID,
-                        text=f"❌ Ошибка авторизации VK API: {e}"
-                    )
-                # Пробуем переавторизоваться
-                await self.authenticate()
-            else:
-                logger.error(f"Ошибка API VK: {e}")
+            logger.error(f"Ошибка API VK: {e}")
         except Exception as e:
             logger.error(f"Непредвиденная ошибка при обработке статусов: {e}")
+        finally:
+            # Следующий опрос каждого пользователя планируется с учетом изменений
+            for vk_id, changed in changes.items():
+                self.status_scheduler.report(vk_id, changed)
+
+    async def _apply_status(self, vk_id, online, last_seen):
+        """Сравнение статуса с предыдущим и отправка уведомлений; возвращает True, если статус изменился"""
+        prev_status = self.status_cache.get(vk_id)
+
+        # Если статус изменился или это первый запрос
+        if not prev_status or prev_status['online'] != online:
+            # Изменение попадет в базу данных при следующей записи кэша
+            self.status_cache.update(vk_id, online, last_seen)
+
+            # Если это не первый запрос, отправляем уведомления
+            if prev_status:
+                await self._send_status_change_notifications(vk_id, online, last_seen)
+                return True
+        return False
+
+    async def _on_longpoll_status(self, vk_id, online, timestamp):
+        """Обработка события онлайн-статуса из Long Poll"""
+        if vk_id not in self._status_ids:
+            # Друг владельца токена, которого никто не отслеживает
+            return
+        try:
+            await self._apply_status(vk_id, online, timestamp)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке события Long Poll для {vk_id}: {e}")
 
     async def _send_status_change_notifications(self, vk_id, online, last_seen):
         """Отправка уведомлений подписчикам о изменении статуса"""
+        if self.role == ROLE_WORKER:
+            # Уведомления отправляет процесс бота: событие передается через outbox
+            await Database.add_outbox_event(
+                vk_id, "status", [{"online": online, "last_seen": last_seen}], int(time.time())
+            )
+            return
+
         # Получение списка Telegram chat_id, подписанных на этого пользователя
-        subscribers = await Database.get_subscribers_for_vk_id(vk_id)
+        subscribers = self.router.subscribers(vk_id)
 
         if not subscribers:
             return
 
-        # Получаем имя и фамилию пользователя
-        try:
-            user_info = await asyncio.to_thread(
-                self.vk.users.get,
-                user_ids=str(vk_id),
-                v="5.131"
-            )
-            if user_info and len(user_info) > 0:
-                first_name = user_info[0].get('first_name', '')
-                last_name = user_info[0].get('last_name', '')
-                user_name = f"{first_name} {last_name}".strip()
+        # Отправка уведомлений всем подписчикам
+        notifications = await self._render_status_notifications(
+            vk_id, [{"online": online, "last_seen": last_seen}]
+        )
+        await self._broadcast(subscribers, notifications)
+
+    async def _render_status_notifications(self, vk_id, statuses):
+        """Формирование уведомлений об изменении онлайн-статуса"""
+        # Получаем имя и фамилию пользователя (обычно уже есть в кэше после users.get)
+        user_name = await self._get_user_name(vk_id)
+
+        notifications = []
+        for status in statuses:
+            time_str = format_time(status["last_seen"])
+            if status["online"]:
+                message = f"👤 Пользователь {user_name} вошёл в сеть в {time_str}"
             else:
-                user_name = f"VK ID {vk_id}"
-        except Exception as e:
-            logger.error(f"Ошибка при получении имени пользователя {vk_id}: {e}")
-            user_name = f"VK ID {vk_id}"
+                message = f"👤 Пользователь {user_name} вышел из сети в {time_str}"
+            notifications.append(Notification(message, True))
 
-        # Формирование сообщения
-        time_str = format_time(last_seen)
-        if online:
-            message = f"👤 Пользователь {user_name} вошёл в сеть в {time_str}"
-        else:
-            message = f"👤 Пользователь {user_name} вышел из сети в {time_str}"
-
-        # Отправка уведомлений всем подписчикам
-        for chat_id in subscribers:
-            await self.send_notification(chat_id, message, disable_preview=True)
+        return tuple(notifications)
 
     async def _track_user_activity(self):
         """Основной цикл отслеживания активности пользователей (друзья, группы, посты, лайки, комментарии)"""
-        # Интервал для проверки активности (раз в 5 минут)
-        ACTIVITY_INTERVAL = 300
+        self.activity_pool.start()
+        try:
+            while self.is_running:
+                try:
+                    # Пары (пользователь, тип проверки) с включенным отслеживанием
+                    await self._refresh_routes()
+                    checks = self.router.activity_checks()
+                    if self.shard:
+                        checks = [(vk_id, check_type) for vk_id, check_type in checks if self.shard.owns(vk_id)]
+                    # Отпечатки списков пользователей, перешедших к другим процессам или
+                    # оставшихся без подписок (их данные удаляет очистка базы), устаревают
+                    Database.retain_fingerprints(vk_id for vk_id, _ in checks)
+                    self.activity_scheduler.sync(checks)
+
+                    # Проверки, время которых наступило; каждая расходует запрос из общего бюджета
+                    tasks = []
+                    while self.activity_scheduler.time_until_next() == 0 and self.vk_budget.try_acquire():
+                        tasks.extend(self.activity_scheduler.pop_due(1))
+
+                    if tasks:
+                        # Каждая пара (пользователь, тип проверки) - отдельная задача пула;
+                        # проверки стены одного пользователя выполняются одной задачей
+                        self.request_cache.reset()
+                        elapsed = await self.activity_pool.run_cycle(tasks)
+
+                        logger.info(
+                            f"Выполнено проверок активности: {len(tasks)} за {elapsed:.1f} с "
+                            f"(запланировано: {len(self.activity_scheduler)}). "
+                            f"Кэш запросов: {self.request_cache.stats()}"
+                        )
+                        if self.activity_scheduler.time_until_next() == 0:
+                            logger.warning(
+                                "Проверки активности не успевают выполняться в срок. "
+                                "Увеличьте VK_REQUESTS_PER_MINUTE, ACTIVITY_CONCURRENCY или ACTIVITY_MIN_INTERVAL"
+                            )
 
-        while self.is_running:
-            try:
-                # Получение списка пользователей с включенным отслеживанием активности
-                vk_ids = await Database.get_users_with_activity_tracking()
+                    # Ожидание до следующей проверки
+                    await asyncio.sleep(self._scheduler_delay(self.activity_scheduler, ACTIVITY_INTERVAL))
 
-                if not vk_ids:
-                    # Если нет пользователей для отслеживания активности, пропускаем цикл
-                    await asyncio.sleep(ACTIVITY_INTERVAL)
-                    continue
+                except asyncio.CancelledError:
+                    break
+                except Exception as e:
+                    logger.error(f"Ошибка при отслеживании активности: {e}")
+                    await asyncio.sleep(30)  # В случае ошибки, ждем 30 секунд
+        finally:
+            await self.activity_pool.stop()
+
+    def _scheduler_delay(self, scheduler, max_delay):
+        """Время ожидания до ближайшей проверки планировщика"""
+        delay = scheduler.time_until_next()
+        if delay is None:
+            return max_delay
+        if delay == 0:
+            # Проверки просрочены, но бюджет запросов исчерпан - ждем пополнения
+            delay = 1 / self.vk_budget.rate
+        return min(max(delay, 1), max_delay)
+
+    async def _process_activity_check(self, vk_id, check_type):
+        """Выполнение одной проверки активности для одного пользователя
+
+        Проверка "wall" выполняет включенные проверки постов, лайков и
+        комментариев подряд, поэтому все они используют один ответ wall.get
+        из кэша цикла. Результат (были ли изменения хотя бы в одной из них)
+        определяет интервал следующей проверки.
+        """
+        checks = {
+            "friends": (("friends", self._check_friends),),
+            "groups": (("groups", self._check_groups),),
+            "wall": (
+                ("posts", self._check_wall_posts),
+                ("likes", self._check_likes),
+                ("comments", self._check_comments),
+            ),
+        }[check_type]
+
+        # Подписчики могли отключить проверку после составления плана цикла:
+        # такая проверка пропускается без обращения к VK API
+        checks = [
+            (track_type, check) for track_type, check in checks
+            if self.router.subscribers(vk_id, f"track_{track_type}")
+        ]
+        if not checks:
+            self.activity_scheduler.report((vk_id, check_type), None)
+            return
 
-                # Получаем текущее время для записи в базу данных
-                current_time = int(time.time())
+        changed = None
+        try:
+            # Получаем текущее время для записи в базу данных
+            current_time = int(time.time())
+            for _, check in checks:
+                result = await check(vk_id, current_time)
+                # None - проверка не удалась и не влияет на интервал
+                if result is not None:
+                    changed = bool(changed or result)
+
+        except TooManyRequestsError:
+            logger.warning("Слишком много запросов к VK API. Запросы с этим токеном приостановлены на 10 секунд.")
+        except AuthorizationError as e:
+            logger.error(f"Ошибка авторизации VK API при отслеживании активности: {e}")
+        except (FloodControlError, RateLimitError) as e:
+            logger.warning(f"Достигнут лимит VK API при отслеживании активности: {e}")
+        except ApiError as e:
+            logger.error(f"Ошибка API VK при отслеживании активности: {e}")
+        except Exception as e:
+            logger.error(f"Непредвиденная ошибка при отслеживании активности для {vk_id}: {e}")
+        finally:
+            self.activity_scheduler.report((vk_id, check_type), changed)
 
-                # Обрабатываем каждого пользователя индивидуально
-                for vk_id in vk_ids:
-                    await self._process_user_activity(vk_id, current_time)
+    async def _fetch_id_list(self, method, vk_id, page_size):
+        """Получение полного списка ID (друзей или групп) с учетом постраничной выдачи
 
-                # Ожидание перед следующей проверкой
-                await asyncio.sleep(ACTIVITY_INTERVAL)
+        Если какая-либо страница не получена, возвращает None: неполный список
+        нельзя сравнивать с сохраненным, иначе недостающие ID станут удаленными.
+        """
+        response = await self._vk_batched(method, user_id=vk_id, count=page_size, v="5.131")
+        if not response or 'items' not in response:
+            return None
 
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                logger.error(f"Ошибка при отслеживании активности: {e}")
-                await asyncio.sleep(30)  # В случае ошибки, ждем 30 секунд
+        items = list(response['items'])
+        total = response.get('count', len(items))
 
-    async def _process_user_activity(self, vk_id, current_time):
-        """Обработка активности для одного пользователя"""
-        try:
-            # Проверяем каждый тип активности
-            await self._check_friends(vk_id, current_time)
-            await self._check_groups(vk_id, current_time)
-            await self._check_wall_posts(vk_id, current_time)
-            await self._check_likes(vk_id, current_time)
-            await self._check_comments(vk_id, current_time)
+        # Остальные страницы запрашиваем одновременно: они попадут в один execute
+        if total > len(items):
+            pages = await asyncio.gather(*(
+                self._vk_batched(method, user_id=vk_id, count=page_size, offset=offset, v="5.131")
+                for offset in range(page_size, total, page_size)
+            ))
+            for page in pages:
+                if not page or 'items' not in page:
+                    logger.warning(f"Не получена страница {method} для пользователя {vk_id}, сравнение списка пропущено")
+                    return None
+                items.extend(page['items'])
 
-        except ApiError as e:
-            if e.code == 6:  # Too many requests
-                logger.warning("Слишком много запросов к VK API. Ожидание 10 секунд.")
-                await asyncio.sleep(10)
-            elif e.code == 5:  # User authorization failed
-                logger.error(f"Ошибка авторизации VK API при отслеживании активности: {e}")
-                await self.authenticate()
-            else:
-                logger.error(f"Ошибка API VK при отслеживании активности: {e}")
-        except Exception as e:
-            logger.error(f"Непредвиденная ошибка при отслеживании активности для {vk_id}: {e}")
+        return items
 
     async def _check_friends(self, vk_id, current_time):
-        """Проверка новых друзей пользователя"""
-        # Получаем подписчиков, которые хотят отслеживать друзей
-        subscribers = await Database.get_subscribers_with_tracking(vk_id, "track_friends")
-        if not subscribers:
-            return
-
+        """Проверка новых и удаленных друзей пользователя"""
         try:
             # Запрос к VK API для получения списка друзей
-            friends_response = await asyncio.to_thread(
-                self.vk.friends.get,
-                user_id=vk_id,
-                v="5.131"
-            )
+            friend_ids = await self._fetch_id_list("friends.get", vk_id, page_size=5000)
 
             # Проверяем, что ответ содержит друзей
-            if friends_response and 'items' in friends_response:
-                friend_ids = friends_response['items']
-
-                # Обновляем список друзей и получаем новых
-                new_friends = await Database.update_friends(vk_id, friend_ids, current_time)
+            if friend_ids is not None:
+                # Обновляем список друзей и получаем новых и удаленных
+                new_friends, removed_friends = await Database.diff_friends(vk_id, friend_ids, current_time)
 
-                # Если есть новые друзья, отправляем уведомления
-                if new_friends:
-                    await self._send_new_friends_notifications(vk_id, new_friends, subscribers)
+                # Изменения записаны в outbox вместе со списком, запускаем их доставку
+                if new_friends or removed_friends:
+                    self.outbox.notify()
+                return bool(new_friends or removed_friends)
 
         except Exception as e:
             logger.error(f"Ошибка при проверке друзей пользователя {vk_id}: {e}")
 
     async def _check_groups(self, vk_id, current_time):
-        """Проверка новых групп пользователя"""
-        # Получаем подписчиков, которые хотят отслеживать группы
-        subscribers = await Database.get_subscribers_with_tracking(vk_id, "track_groups")
-        if not subscribers:
-            return
-
+        """Проверка новых и покинутых групп пользователя"""
         try:
             # Запрос к VK API для получения списка групп
-            groups_response = await asyncio.to_thread(
-                self.vk.groups.get,
-                user_id=vk_id,
-                v="5.131"
-            )
+            group_ids = await self._fetch_id_list("groups.get", vk_id, page_size=1000)
 
             # Проверяем, что ответ содержит группы
-            if groups_response and 'items' in groups_response:
-                group_ids = groups_response['items']
-
-                # Обновляем список групп и получаем новые
-                new_groups = await Database.update_groups(vk_id, group_ids, current_time)
+            if group_ids is not None:
+                # Обновляем список групп и получаем новые и покинутые
+                new_groups, left_groups = await Database.diff_groups(vk_id, group_ids, current_time)
 
-                # Если есть новые группы, отправляем уведомления
-                if new_groups:
-                    await self._send_new_groups_notifications(vk_id, new_groups, subscribers)
+                # Изменения записаны в outbox вместе со списком, запускаем их доставку
+                if new_groups or left_groups:
+                    self.outbox.notify()
+                return bool(new_groups or left_groups)
 
         except Exception as e:
             logger.error(f"Ошибка при проверке групп пользователя {vk_id}: {e}")
 
     async def _check_wall_posts(self, vk_id, current_time):
         """Проверка новых постов на стене пользователя"""
-        # Получаем подписчиков, которые хотят отслеживать посты
-        subscribers = await Database.get_subscribers_with_tracking(vk_id, "track_posts")
-        if not subscribers:
-            return
-
         try:
             # Запрос к VK API для получения последних постов
-            posts_response = await asyncio.to_thread(
-                self.vk.wall.get,
-                owner_id=vk_id,
-                count=20,  # Ограничиваем количество проверяемых постов
-                v="5.131"
-            )
+            posts_response = await self._get_wall(vk_id)
 
             # Проверяем, что ответ содержит посты
             if posts_response and 'items' in posts_response:
@@ -451,20 +762,16 @@ class VKTracker:
                 # Обновляем список постов и получаем новые
                 new_posts = await Database.update_posts(vk_id, posts)
 
-                # Если есть новые посты, отправляем уведомления
+                # Новые посты записаны в outbox, запускаем доставку уведомлений
                 if new_posts:
-                    await self._send_new_posts_notifications(vk_id, new_posts, subscribers)
+                    self.outbox.notify()
+                return bool(new_posts)
 
         except Exception as e:
             logger.error(f"Ошибка при проверке постов пользователя {vk_id}: {e}")
 
     async def _check_likes(self, vk_id, current_time):
         """Проверка новых лайков пользователя"""
-        # Получаем подписчиков, которые хотят отслеживать лайки
-        subscribers = await Database.get_subscribers_with_tracking(vk_id, "track_likes")
-        if not subscribers:
-            return
-
         # Проверяем используется ли пользовательский токен (имеет больше прав)
         is_user_token = bool(VK_USER_TOKEN)
 
@@ -478,15 +785,10 @@ class VKTracker:
             # 1. Проверяем лайки на стене пользователя (работает с сервисным токеном)
             try:
                 # Получаем последние записи со стены пользователя
-                wall_response = await asyncio.to_thread(
-                    self.vk.wall.get,
-                    owner_id=vk_id,
-                    count=10,
-                    v="5.131"
-                )
+                wall_response = await self._get_wall(vk_id)
 
                 if wall_response and 'items' in wall_response:
-                    for post in wall_response['items']:
+                    for post in wall_response['items'][:10]:
                         # Проверяем, есть ли лайк от пользователя на этой записи
                         # (На своей записи пользователь может поставить лайк)
                         if post.get('likes', {}).get('user_likes') == 1:
@@ -502,344 +804,489 @@ class VKTracker:
 
             # Следующие методы доступны только с пользовательским токеном
             if is_user_token:
-                # 2. Получаем новости пользователя и проверяем лайки на них
-                try:
-                    # Получаем последние записи из новостной ленты
-                    newsfeed_response = await asyncio.to_thread(
-                        self.vk.newsfeed.get,
-                        filters="post",
-                        count=15,
-                        v="5.131"
-                    )
-
-                    if newsfeed_response and 'items' in newsfeed_response:
-                        for item in newsfeed_response['items']:
-                            # Проверяем лайк от пользователя на записи из ленты
-                            post_id = item.get('post_id')
-                            source_id = item.get('source_id')
-
-                            if post_id and source_id and item.get('likes', {}).get('user_likes') == 1:
-                                like_info = {
-                                    "type": "post",
-                                    "owner_id": source_id,
-                                    "item_id": post_id,
-                                    "date": item.get("date", int(time.time()))
-                                }
-                                likes.append(like_info)
-                except Exception as newsfeed_err:
-                    logger.error(f"Ошибка при проверке лайков в новостной ленте: {newsfeed_err}")
-
-                # 3. Проверяем лайки на фотографиях
-                try:
-                    # Получаем новости с фотографиями
-                    photos_feed_response = await asyncio.to_thread(
-                        self.vk.newsfeed.get,
-                        filters="photo",
-                        count=10,
-                        v="5.131"
-                    )
-
-                    if photos_feed_response and 'items' in photos_feed_response:
-                        for item in photos_feed_response['items']:
-                            if 'photos' in item and 'items' in item['photos']:
-                                for photo in item['photos']['items']:
-                                    if photo.get('likes', {}).get('user_likes') == 1:
-                                        like_info = {
-                                            "type": "photo",
-                                            "owner_id": photo.get("owner_id"),
-                                            "item_id": photo.get("id"),
-                                            "date": photo.get("date", int(time.time()))
-                                        }
-                                        likes.append(like_info)
-                except Exception as photos_err:
-                    logger.error(f"Ошибка при проверке лайков на фотографиях: {photos_err}")
+                # 2-3. Лайки на записях и фотографиях из новостной ленты.
+                # Лента общая для всех отслеживаемых пользователей, поэтому она
+                # загружается один раз за цикл, а здесь используется готовый индекс
+                newsfeed_likes = await self._get_newsfeed_snapshot()
+                likes.extend(newsfeed_likes.values())
             else:
                 logger.info(f"Проверка лайков в новостной ленте и на фотографиях пропущена для пользователя {vk_id}: требуется пользовательский токен")
 
-            # Добавляем небольшую задержку для избежания ограничений API
-            await asyncio.sleep(0.3)
-
             # Обновляем список лайков и получаем новые
             new_likes = await Database.update_likes(vk_id, likes, current_time)
 
-            # Если есть новые лайки, отправляем уведомления
+            # Новые лайки записаны в outbox, запускаем доставку уведомлений
             if new_likes:
-                await self._send_new_likes_notifications(vk_id, new_likes, subscribers)
+                self.outbox.notify()
+            return bool(new_likes)
 
         except Exception as e:
             logger.error(f"Ошибка при проверке лайков пользователя {vk_id}: {e}")
 
-    async def _check_comments(self, vk_id, current_time):
-        """Проверка новых комментариев пользователя"""
-        # Получаем подписчиков, которые хотят отслеживать комментарии
-        subscribers = await Database.get_subscribers_with_tracking(vk_id, "track_comments")
-        if not subscribers:
-            return
+    async def _fetch_newsfeed(self, filters, page_size):
+        """Постраничная загрузка новостной ленты с помощью start_from"""
+        items = []
+        start_from = None
+        for _ in range(NEWSFEED_PAGES):
+            response = await self._vk_batched(
+                "newsfeed.get",
+                filters=filters,
+                count=page_size,
+                start_from=start_from,
+                v="5.131"
+            )
+            if not response or 'items' not in response:
+                break
 
-        # Проверяем используется ли пользовательский токен (имеет больше прав)
-        is_user_token = bool(VK_USER_TOKEN)
+            items.extend(response['items'])
+            start_from = response.get('next_from')
+            if not start_from:
+                break
+        return items
+
+    async def _load_newsfeed_snapshot(self):
+        """Загрузка ленты и построение индекса отмеченных лайком элементов
 
+        Возвращает словарь (type, owner_id, item_id) -> информация о лайке.
+        """
+        liked_items = {}
+
+        # Лайки на записях из ленты
+        try:
+            for item in await self._fetch_newsfeed("post", page_size=50):
+                post_id = item.get('post_id')
+                source_id = item.get('source_id')
+
+                if post_id and source_id and item.get('likes', {}).get('user_likes') == 1:
+                    liked_items[("post", source_id, post_id)] = {
+                        "type": "post",
+                        "owner_id": source_id,
+                        "item_id": post_id,
+                        "date": item.get("date", int(time.time()))
+                    }
+        except Exception as newsfeed_err:
+            logger.error(f"Ошибка при проверке лайков в новостной ленте: {newsfeed_err}")
+
+        # Лайки на фотографиях из ленты
+        try:
+            for item in await self._fetch_newsfeed("photo", page_size=50):
+                if 'photos' in item and 'items' in item['photos']:
+                    for photo in item['photos']['items']:
+                        if photo.get('likes', {}).get('user_likes') == 1:
+                            liked_items[("photo", photo.get("owner_id"), photo.get("id"))] = {
+                                "type": "photo",
+                                "owner_id": photo.get("owner_id"),
+                                "item_id": photo.get("id"),
+                                "date": photo.get("date", int(time.time()))
+                            }
+        except Exception as photos_err:
+            logger.error(f"Ошибка при проверке лайков на фотографиях: {photos_err}")
+
+        return liked_items
+
+    async def _get_newsfeed_snapshot(self):
+        """Индекс лайков из новостной ленты
+
+        Лента общая для всех пользователей, поэтому загружается не чаще
+        одного раза в ACTIVITY_MIN_INTERVAL секунд.
+        """
+        now = time.monotonic()
+        if self._newsfeed_snapshot is None or now - self._newsfeed_loaded_at >= ACTIVITY_MIN_INTERVAL:
+            self._newsfeed_snapshot = asyncio.ensure_future(self._load_newsfeed_snapshot())
+            self._newsfeed_loaded_at = now
+        return await asyncio.shield(self._newsfeed_snapshot)
+
+    async def _check_comments(self, vk_id, current_time):
+        """Проверка новых комментариев пользователя
+
+        Для каждого поста хранится курсор: число комментариев из ответа
+        wall.get и ID последнего просмотренного комментария. Посты, у
+        которых число комментариев не изменилось, не запрашиваются, у
+        остальных учитываются только комментарии после курсора.
+        """
         try:
             comments = []
+            updated_cursors = {}
+            window = set()
 
             # Сначала получаем посты пользователя, чтобы затем проверить комментарии на них
             try:
-                # Получаем последние посты со стены
-                wall_response = await asyncio.to_thread(
-                    self.vk.wall.get,
-                    owner_id=vk_id,
-                    count=10,  # Ограничиваем количество проверяемых постов
-                    v="5.131"
-                )
-
-                if wall_response and 'items' in wall_response:
-                    posts = wall_response['items']
-
-                    # Для каждого поста получаем комментарии
-                    for post in posts:
-                        post_id = post.get('id')
-                        if not post_id:
-                            continue
-
-                        try:
-                            # Получаем комментарии к посту
-                            post_comments_response = await asyncio.to_thread(
-                                self.vk.wall.getComments,
-                                owner_id=vk_id,
-                                post_id=post_id,
-                                count=20,
-                                sort="desc",
-                                v="5.131"
-                            )
-
-                            # Добавляем небольшую задержку между запросами
-                            await asyncio.sleep(0.2)
-
-                            if post_comments_response and 'items' in post_comments_response:
-                                for comment in post_comments_response['items']:
-                                    # Проверяем, что комментарий от отслеживаемого пользователя
-                                    if comment.get('from_id') == vk_id:
-                                        comment_info = {
-                                            "id": comment.get("id"),
-                                            "post_id": post_id,
-                                            "owner_id": vk_id,
-                                            "date": comment.get("date", int(time.time())),
-                                            "text": comment.get("text", "")
-                                        }
-                                        comments.append(comment_info)
-                        except ApiError as api_err:
-                            # Игнорируем ошибку "post_id is required" - уже учтено в коде
-                            if "post_id is required" in str(api_err):
-                                continue
-                            else:
-                                logger.error(f"Ошибка API при получении комментариев для поста {post_id}: {api_err}")
-
-                        except Exception as post_err:
-                            logger.error(f"Ошибка при получении комментариев для поста {post_id}: {post_err}")
+                # Получаем последние посты со стены (тот же ответ используется проверкой постов)
+                wall_response = await self._get_wall(vk_id)
+                if not wall_response or 'items' not in wall_response:
+                    # Стена не получена: проверка не удалась и не влияет на интервал
+                    return None
+
+                posts = wall_response['items'][:10]  # Ограничиваем количество проверяемых постов
+                cursors = await Database.get_comment_cursors(vk_id)
+
+                changed_posts = []
+                for post in posts:
+                    post_id = post.get('id')
+                    if not post_id:
+                        continue
+                    key = (vk_id, post_id)
+                    window.add(key)
+                    count = (post.get('comments') or {}).get('count', 0)
+                    prev_count, last_comment_id = cursors.get(key, (None, 0))
+                    if count == prev_count:
+                        continue
+                    if count == 0:
+                        # Комментариев нет (или все удалены) - запрашивать нечего
+                        updated_cursors[key] = (0, last_comment_id)
+                    else:
+                        changed_posts.append((post_id, count, prev_count, last_comment_id))
+
+                # Запрашиваем комментарии только к постам с изменившимся числом
+                # комментариев; запросы будут объединены в один вызов execute
+                results = await asyncio.gather(*(
+                    self._fetch_post_comments(
+                        vk_id, post_id, last_comment_id,
+                        count - prev_count if prev_count is not None else 0
+                    )
+                    for post_id, count, prev_count, last_comment_id in changed_posts
+                ))
+                for (post_id, count, _, last_comment_id), result in zip(changed_posts, results):
+                    if result is None:
+                        # Курсор не сдвигается, пост будет проверен в следующем цикле
+                        continue
+                    post_comments, max_comment_id = result
+                    comments.extend(post_comments)
+                    updated_cursors[(vk_id, post_id)] = (count, max(last_comment_id, max_comment_id))
 
             except Exception as wall_err:
                 logger.error(f"Ошибка при получении постов пользователя {vk_id}: {wall_err}")
+                return None
+
+            if not updated_cursors:
+                # Ни у одного поста не изменилось число комментариев; если изменилось,
+                # но комментарии не получены, проверка не удалась
+                return None if changed_posts else False
 
-            # Обновляем список комментариев и получаем новые
-            new_comments = await Database.update_comments(vk_id, comments)
+            # Обновляем список комментариев и курсоры, получаем новые комментарии
+            new_comments = await Database.update_comments(vk_id, comments, updated_cursors, window)
 
-            # Если есть новые комментарии, отправляем уведомления
+            # Новые комментарии записаны в outbox, запускаем доставку уведомлений
             if new_comments:
-                await self._send_new_comments_notifications(vk_id, new_comments, subscribers)
+                self.outbox.notify()
+            return bool(new_comments)
 
         except Exception as e:
             logger.error(f"Ошибка при проверке комментариев пользователя {vk_id}: {e}")
 
-    async def _get_user_name(self, vk_id):
-        """Получение имени и фамилии пользователя"""
+    async def _fetch_post_comments(self, vk_id, post_id, after_comment_id=0, added=0):
+        """Получение комментариев отслеживаемого пользователя к одному посту
+
+        Учитываются только комментарии с ID больше after_comment_id; added -
+        на сколько выросло число комментариев с прошлой проверки.
+        Возвращает (комментарии, максимальный ID среди полученных) или None
+        при ошибке.
+        """
+        comments = []
+        max_comment_id = 0
         try:
-            user_info = await asyncio.to_thread(
-                self.vk.users.get,
-                user_ids=str(vk_id),
+            # Получаем последние комментарии к посту (не меньше 20, но не больше лимита VK API)
+            post_comments_response = await self._vk_batched(
+                "wall.getComments",
+                owner_id=vk_id,
+                post_id=post_id,
+                count=min(100, max(20, added)),
+                sort="desc",
                 v="5.131"
             )
-            if user_info and len(user_info) > 0:
-                first_name = user_info[0].get('first_name', '')
-                last_name = user_info[0].get('last_name', '')
-                return f"{first_name} {last_name}".strip()
+
+            if post_comments_response and 'items' in post_comments_response:
+                for comment in post_comments_response['items']:
+                    comment_id = comment.get("id", 0)
+                    max_comment_id = max(max_comment_id, comment_id)
+                    # Проверяем, что комментарий новый и от отслеживаемого пользователя
+                    if comment_id > after_comment_id and comment.get('from_id') == vk_id:
+                        comment_info = {
+                            "id": comment_id,
+                            "post_id": post_id,
+                            "owner_id": vk_id,
+                            "date": comment.get("date", int(time.time())),
+                            "text": comment.get("text", "")
+                        }
+                        comments.append(comment_info)
+        except ApiError as api_err:
+            # Игнорируем ошибку "post_id is required" - уже учтено в коде
+            if "post_id is required" in str(api_err):
+                return comments, max_comment_id
+            logger.error(f"Ошибка API при получении комментариев для поста {post_id}: {api_err}")
+            return None
+
+        except Exception as post_err:
+            logger.error(f"Ошибка при получении комментариев для поста {post_id}: {post_err}")
+            return None
+
+        return comments, max_comment_id
+
+    async def _get_user_names(self, vk_ids):
+        """Получение имен пользователей: из кэша профилей, недостающие - одним запросом users.get"""
+        names = {}
+        missing = []
+        for vk_id in dict.fromkeys(vk_ids):
+            cached = self.profile_cache.get("user", vk_id)
+            if cached:
+                names[vk_id] = cached[0]
             else:
-                return f"VK ID {vk_id}"
-        except Exception as e:
-            logger.error(f"Ошибка при получении имени пользователя {vk_id}: {e}")
-            return f"VK ID {vk_id}"
+                missing.append(vk_id)
 
-    async def _send_new_friends_notifications(self, vk_id, new_friends, subscribers):
-        """Отправка уведомлений о новых друзьях"""
-        try:
-            # Получаем имя пользователя
-            user_name = await self._get_user_name(vk_id)
+        # users.get принимает не более 1000 ID за запрос
+        for i in range(0, len(missing), 1000):
+            try:
+                users_info = await self._vk_call(
+                    "users.get",
+                    user_ids=','.join(map(str, missing[i:i+1000])),
+                    v="5.131"
+                )
+                for user in users_info or []:
+                    self.profile_cache.put_user(user)
+                    cached = self.profile_cache.get("user", user.get('id'))
+                    if cached:
+                        names[user['id']] = cached[0]
+            except Exception as e:
+                logger.error(f"Ошибка при получении имен пользователей: {e}")
 
-            # Получаем имена новых друзей
-            friends_info = await asyncio.to_thread(
-                self.vk.users.get,
-                user_ids=','.join(map(str, new_friends)),
-                v="5.131"
-            )
+        return names
 
-            for friend_info in friends_info:
-                friend_id = friend_info.get('id')
-                friend_name = f"{friend_info.get('first_name', '')} {friend_info.get('last_name', '')}".strip()
+    async def _get_user_name(self, vk_id):
+        """Получение имени и фамилии пользователя"""
+        names = await self._get_user_names([vk_id])
+        return names.get(vk_id, f"VK ID {vk_id}")
+
+    async def _get_groups_info(self, group_ids):
+        """Получение названий и коротких имен групп: из кэша профилей, недостающие - через groups.getById"""
+        groups = {}
+        missing = []
+        for group_id in dict.fromkeys(group_ids):
+            cached = self.profile_cache.get("group", group_id)
+            if cached:
+                groups[group_id] = cached
+            else:
+                missing.append(group_id)
 
-                # Формируем сообщение
-                message = f"👥 {user_name} добавил(а) нового друга: {friend_name}\n" \
-                          f"🔗 https://vk.com/id{friend_id}"
+        # groups.getById принимает не более 500 ID за запрос
+        for i in range(0, len(missing), 500):
+            try:
+                groups_info = await self._vk_call(
+                    "groups.getById",
+                    group_ids=','.join(map(str, missing[i:i+500])),
+                    v="5.131"
+                )
+                for group_info in groups_info or []:
+                    group_id = group_info.get('id')
+                    group_name = group_info.get('name', 'Группа')
+                    group_screen_name = group_info.get('screen_name', f"club{group_id}")
+                    self.profile_cache.put("group", group_id, group_name, group_screen_name)
+                    groups[group_id] = (group_name, group_screen_name)
+            except Exception as e:
+                logger.error(f"Ошибка при получении информации о группах: {e}")
 
-                # Отправляем уведомления всем подписчикам
-                for chat_id in subscribers:
-                    await self.send_notification(chat_id, message, disable_preview=False)
+        return groups
 
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомлений о новых друзьях: {e}")
+    async def _get_posts_text(self, post_keys):
+        """Получение текстов записей по ключам вида "{owner_id}_{post_id}"
 
-    async def _send_new_groups_notifications(self, vk_id, new_groups, subscribers):
-        """Отправка уведомлений о новых группах"""
-        try:
-            # Получаем имя пользователя
-            user_name = await self._get_user_name(vk_id)
+        wall.getById принимает до 100 записей за один запрос.
+        """
+        post_keys = list(dict.fromkeys(post_keys))
+        texts = {}
+        for i in range(0, len(post_keys), 100):
+            try:
+                posts = await self._vk_call(
+                    "wall.getById",
+                    posts=",".join(post_keys[i:i+100]),
+                    v="5.131"
+                )
+                for post in posts or []:
+                    texts[f"{post.get('owner_id')}_{post.get('id')}"] = post.get('text', '')
+            except Exception as e:
+                logger.error(f"Ошибка при получении доп. информации о контенте: {e}")
+        return texts
 
-            # Получаем информацию о новых группах
-            groups_info = await asyncio.to_thread(
-                self.vk.groups.getById,
-                group_ids=','.join(map(str, new_groups)),
-                v="5.131"
-            )
+    async def _render_new_friends_notifications(self, vk_id, new_friends):
+        """Формирование уведомлений о новых друзьях"""
+        # Получаем имя пользователя
+        user_name = await self._get_user_name(vk_id)
 
-            for group_info in groups_info:
-                group_id = group_info.get('id')
-                group_name = group_info.get('name', 'Группа')
-                group_screen_name = group_info.get('screen_name', f"club{group_id}")
+        # Получаем имена новых друзей
+        friend_names = await self._get_user_names(new_friends)
 
-                # Формируем сообщение
-                message = f"👥 {user_name} вступил(а) в группу: {group_name}\n" \
-                          f"🔗 https://vk.com/{group_screen_name}"
+        notifications = []
+        for friend_id in new_friends:
+            friend_name = friend_names.get(friend_id, f"VK ID {friend_id}")
 
-                # Отправляем уведомления всем подписчикам
-                for chat_id in subscribers:
-                    await self.send_notification(chat_id, message, disable_preview=False)
+            # Формируем сообщение
+            message = f"👥 {user_name} добавил(а) нового друга: {friend_name}\n" \
+                      f"🔗 https://vk.com/id{friend_id}"
 
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомлений о новых группах: {e}")
+            notifications.append(Notification(message))
 
-    async def _send_new_posts_notifications(self, vk_id, new_posts, subscribers):
-        """Отправка уведомлений о новых постах"""
-        try:
-            # Получаем имя пользователя
-            user_name = await self._get_user_name(vk_id)
+        return tuple(notifications)
 
-            for post in new_posts:
-                post_id = post.get("id")
-                owner_id = post.get("owner_id")
-                post_text = post.get("text", "")
+    async def _render_new_groups_notifications(self, vk_id, new_groups):
+        """Формирование уведомлений о новых группах"""
+        # Получаем имя пользователя
+        user_name = await self._get_user_name(vk_id)
 
-                # Ограничиваем длину текста для сообщения
-                if post_text:
-                    if len(post_text) > 200:
-                        post_text = post_text[:200] + "..."
+        # Получаем информацию о новых группах
+        groups_info = await self._get_groups_info(new_groups)
 
-                # Формируем сообщение
-                message = f"📝 {user_name} опубликовал(а) новый пост:\n\n"
-                if post_text:
-                    message += f"{post_text}\n\n"
-                message += f"🔗 https://vk.com/wall{owner_id}_{post_id}"
+        notifications = []
+        for group_id in new_groups:
+            group_name, group_screen_name = groups_info.get(group_id, ("Группа", f"club{group_id}"))
 
-                # Отправляем уведомления всем подписчикам
-                for chat_id in subscribers:
-                    await self.send_notification(chat_id, message, disable_preview=False)
+            # Формируем сообщение
+            message = f"👥 {user_name} вступил(а) в группу: {group_name}\n" \
+                      f"🔗 https://vk.com/{group_screen_name}"
 
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомлений о новых постах: {e}")
+            notifications.append(Notification(message))
 
-    async def _send_new_likes_notifications(self, vk_id, new_likes, subscribers):
-        """Отправка уведомлений о новых лайках"""
-        try:
-            # Получаем имя пользователя
-            user_name = await self._get_user_name(vk_id)
+        return tuple(notifications)
 
-            for like in new_likes:
-                like_type = like.get("type")
-                owner_id = like.get("owner_id")
-                item_id = like.get("item_id")
+    async def _render_removed_friends_notifications(self, vk_id, removed_friends):
+        """Формирование уведомлений об удаленных друзьях"""
+        # Получаем имя пользователя
+        user_name = await self._get_user_name(vk_id)
 
-                # Формируем ссылку в зависимости от типа контента
-                link = "https://vk.com/"
-                type_name = "запись"
+        # Получаем имена удаленных друзей
+        friend_names = await self._get_user_names(removed_friends)
 
-                if like_type == "post":
-                    link = f"https://vk.com/wall{owner_id}_{item_id}"
-                    type_name = "запись"
-                elif like_type == "photo":
-                    link = f"https://vk.com/photo{owner_id}_{item_id}"
-                    type_name = "фотографию"
-                elif like_type == "video":
-                    link = f"https://vk.com/video{owner_id}_{item_id}"
-                    type_name = "видео"
-                elif like_type == "comment":
-                    link = f"https://vk.com/wall{owner_id}_{item_id}?reply={item_id}"
-                    type_name = "комментарий"
-
-                # Получаем доп. информацию о контенте, на который поставлен лайк
-                try:
-                    if like_type == "post":
-                        # Пытаемся получить текст поста, если это возможно
-                        post_info = await asyncio.to_thread(
-                            self.vk.wall.getById,
-                            posts=f"{owner_id}_{item_id}",
-                            v="5.131"
-                        )
+        notifications = []
+        for friend_id in removed_friends:
+            friend_name = friend_names.get(friend_id, f"VK ID {friend_id}")
 
-                        if post_info and len(post_info) > 0:
-                            post_text = post_info[0].get('text', '')
-                            post_preview = post_text[:100] + "..." if len(post_text) > 100 else post_text
-                            if post_preview:
-                                type_name = f"запись:\n\"{post_preview}\""
-                except Exception as e:
-                    logger.error(f"Ошибка при получении доп. информации о контенте: {e}")
+            # Формируем сообщение
+            message = f"👥 {user_name} удалил(а) из друзей: {friend_name}\n" \
+                      f"🔗 https://vk.com/id{friend_id}"
 
-                # Формируем сообщение
-                message = f"❤️ {user_name} поставил(а) лайк на {type_name}\n" \
-                          f"🔗 {link}"
+            notifications.append(Notification(message))
 
-                # Отправляем уведомления всем подписчикам
-                for chat_id in subscribers:
-                    await self.send_notification(chat_id, message, disable_preview=False)
+        return tuple(notifications)
 
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомлений о новых лайках: {e}")
+    async def _render_left_groups_notifications(self, vk_id, left_groups):
+        """Формирование уведомлений о покинутых группах"""
+        # Получаем имя пользователя
+        user_name = await self._get_user_name(vk_id)
 
-    async def _send_new_comments_notifications(self, vk_id, new_comments, subscribers):
-        """Отправка уведомлений о новых комментариях"""
-        try:
-            # Получаем имя пользователя
-            user_name = await self._get_user_name(vk_id)
+        # Получаем информацию о покинутых группах
+        groups_info = await self._get_groups_info(left_groups)
 
-            for comment in new_comments:
-                comment_id = comment.get("id")
-                post_id = comment.get("post_id")
-                owner_id = comment.get("owner_id")
-                comment_text = comment.get("text", "")
+        notifications = []
+        for group_id in left_groups:
+            group_name, group_screen_name = groups_info.get(group_id, ("Группа", f"club{group_id}"))
 
-                # Ограничиваем длину текста для сообщения
-                if comment_text:
-                    if len(comment_text) > 200:
-                        comment_text = comment_text[:200] + "..."
+            # Формируем сообщение
+            message = f"👥 {user_name} покинул(а) группу: {group_name}\n" \
+                      f"🔗 https://vk.com/{group_screen_name}"
 
-                # Формируем ссылку на комментарий
-                link = f"https://vk.com/wall{owner_id}_{post_id}?reply={comment_id}"
+            notifications.append(Notification(message))
 
-                # Формируем сообщение
-                message = f"💬 {user_name} оставил(а) новый комментарий:\n\n"
-                if comment_text:
-                    message += f"{comment_text}\n\n"
-                message += f"🔗 {link}"
+        return tuple(notifications)
 
-                # Отправляем уведомления всем подписчикам
-                for chat_id in subscribers:
-                    await self.send_notification(chat_id, message, disable_preview=False)
+    async def _render_new_posts_notifications(self, vk_id, new_posts):
+        """Формирование уведомлений о новых постах"""
+        # Получаем имя пользователя
+        user_name = await self._get_user_name(vk_id)
 
-        except Exception as e:
-            logger.error(f"Ошибка при отправке уведомлений о новых комментариях: {e}")
+        notifications = []
+        for post in new_posts:
+            post_id = post.get("id")
+            owner_id = post.get("owner_id")
+            post_text = post.get("text", "")
+
+            # Ограничиваем длину текста для сообщения
+            if post_text:
+                if len(post_text) > 200:
+                    post_text = post_text[:200] + "..."
+
+            # Формируем сообщение
+            message = f"📝 {user_name} опубликовал(а) новый пост:\n\n"
+            if post_text:
+                message += f"{post_text}\n\n"
+            message += f"🔗 https://vk.com/wall{owner_id}_{post_id}"
+
+            notifications.append(Notification(message))
+
+        return tuple(notifications)
+
+    async def _render_new_likes_notifications(self, vk_id, new_likes):
+        """Формирование уведомлений о новых лайках"""
+        # Получаем имя пользователя
+        user_name = await self._get_user_name(vk_id)
+
+        # Тексты всех записей, на которые поставлены лайки, одним запросом
+        post_texts = await self._get_posts_text(
+            f"{like.get('owner_id')}_{like.get('item_id')}"
+            for like in new_likes if like.get("type") == "post"
+        )
+
+        notifications = []
+        for like in new_likes:
+            like_type = like.get("type")
+            owner_id = like.get("owner_id")
+            item_id = like.get("item_id")
+
+            # Формируем ссылку в зависимости от типа контента
+            link = "https://vk.com/"
+            type_name = "запись"
+
+            if like_type == "post":
+                link = f"https://vk.com/wall{owner_id}_{item_id}"
+                type_name = "запись"
+            elif like_type == "photo":
+                link = f"https://vk.com/photo{owner_id}_{item_id}"
+                type_name = "фотографию"
+            elif like_type == "video":
+                link = f"https://vk.com/video{owner_id}_{item_id}"
+                type_name = "видео"
+            elif like_type == "comment":
+                link = f"https://vk.com/wall{owner_id}_{item_id}?reply={item_id}"
+                type_name = "комментарий"
+
+            # Добавляем текст записи, на которую поставлен лайк, если он известен
+            if like_type == "post":
+                post_text = post_texts.get(f"{owner_id}_{item_id}", "")
+                post_preview = post_text[:100] + "..." if len(post_text) > 100 else post_text
+                if post_preview:
+                    type_name = f"запись:\n\"{post_preview}\""
+
+            # Формируем сообщение
+            message = f"❤️ {user_name} поставил(а) лайк на {type_name}\n" \
+                      f"🔗 {link}"
+
+            notifications.append(Notification(message))
+
+        return tuple(notifications)
+
+    async def _render_new_comments_notifications(self, vk_id, new_comments):
+        """Формирование уведомлений о новых комментариях"""
+        # Получаем имя пользователя
+        user_name = await self._get_user_name(vk_id)
+
+        notifications = []
+        for comment in new_comments:
+            comment_id = comment.get("id")
+            post_id = comment.get("post_id")
+            owner_id = comment.get("owner_id")
+            comment_text = comment.get("text", "")
+
+            # Ограничиваем длину текста для сообщения
+            if comment_text:
+                if len(comment_text) > 200:
+                    comment_text = comment_text[:200] + "..."
+
+            # Формируем ссылку на комментарий
+            link = f"https://vk.com/wall{owner_id}_{post_id}?reply={comment_id}"
+
+            # Формируем сообщение
+            message = f"💬 {user_name} оставил(а) новый комментарий:\n\n"
+            if comment_text:
+                message += f"{comment_text}\n\n"
+            message += f"🔗 {link}"
+
+            notifications.append(Notification(message))
+
+        return tuple(notifications)
@@ -0,0 +1,41 @@
+import argparse
+import asyncio
+import signal
+from config import logger
+from database import Database
+from sharding import ShardCoordinator
+from vk_tracker import VKTracker, ROLE_WORKER
+
+async def run_worker(worker_id):
+    """Запуск процесса-обработчика до получения SIGTERM или SIGINT"""
+    await Database.open_pool()
+    try:
+        await Database.init_db()
+
+        tracker = VKTracker(None, role=ROLE_WORKER, shard=ShardCoordinator(worker_id))
+        await tracker.start_tracking()
+        if not tracker.is_running:
+            logger.critical(f"Обработчик {worker_id} не запущен: ошибка авторизации VK API")
+            return
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop_event.set)
+
+        logger.info(f"Обработчик {worker_id} запущен")
+        await stop_event.wait()
+
+        await tracker.stop_tracking()
+        logger.info(f"Обработчик {worker_id} остановлен")
+    finally:
+        await Database.close_pool()
+
+def main(worker_id):
+    """Точка входа процесса-обработчика (в том числе для multiprocessing)"""
+    asyncio.run(run_worker(worker_id))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Процесс-обработчик отслеживания пользователей VK")
+    parser.add_argument("worker_id", help="Уникальное имя обработчика, например worker-1")
+    main(parser.parse_args().worker_id)
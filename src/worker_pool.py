@@ -0,0 +1,54 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class ActivityWorkerPool:
+    """Пул обработчиков задач проверки активности
+
+    Задачи вида (vk_id, check_type) ставятся в общую очередь и выполняются
+    ограниченным числом параллельных обработчиков. Медленный профиль
+    занимает только один обработчик и не задерживает остальные проверки.
+    """
+
+    def __init__(self, handler, concurrency):
+        # handler(vk_id, check_type) - корутина, выполняющая одну проверку
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self._queue = asyncio.Queue()
+        self._workers = []
+
+    def start(self):
+        """Запуск обработчиков"""
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker())
+                for _ in range(self.concurrency)
+            ]
+
+    async def stop(self):
+        """Остановка обработчиков"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def _worker(self):
+        """Обработчик: берет задачи из очереди до отмены"""
+        while True:
+            vk_id, check_type = await self._queue.get()
+            try:
+                await self.handler(vk_id, check_type)
+            except Exception as e:
+                logger.error(f"Ошибка при выполнении проверки {check_type} для {vk_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def run_cycle(self, tasks):
+        """Выполнение всех задач цикла; возвращает время выполнения в секундах"""
+        started_at = time.monotonic()
+        for task in tasks:
+            self._queue.put_nowait(task)
+        await self._queue.join()
+        return time.monotonic() - started_at
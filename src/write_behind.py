@@ -0,0 +1,61 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+class WriteBehindCache:
+    """Основа кэшей в памяти с отложенной записью в SQLite
+
+    Измененные ключи помечаются в _dirty и периодически сохраняются одной
+    транзакцией; при остановке записываются оставшиеся изменения. Наследник
+    задает label (для журнала), _rows(keys) - строки для записи измененных
+    ключей - и _save(rows) - их сохранение в базу данных.
+    """
+
+    label = "кэша"
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._dirty = set()
+        self._flush_task = None
+
+    def _rows(self, keys):
+        raise NotImplementedError
+
+    async def _save(self, rows):
+        raise NotImplementedError
+
+    async def flush(self):
+        """Запись измененных записей в базу данных одной транзакцией"""
+        dirty, self._dirty = self._dirty, set()
+        try:
+            await self._save(self._rows(dirty))
+        except Exception:
+            # Возвращаем записи в очередь, чтобы не потерять изменения
+            self._dirty |= dirty
+            raise
+
+    async def _flush_loop(self):
+        """Периодическая запись изменений в базу данных"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении {self.label}: {e}")
+
+    def start(self):
+        """Запуск фоновой записи изменений"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Остановка фоновой записи и сохранение оставшихся изменений"""
+        if self._flush_task:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()